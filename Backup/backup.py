@@ -2,9 +2,15 @@ import time
 from pathlib import Path
 
 import numpy as np
-from gevent.time import sleep as gsleep
+from gevent import get_hub
+from gevent.event import Event
 
+from Backup.journal import INITIAL_BASE, PixelJournal, replay
+from Backup.manifest import BackupEntry, BackupManifest
 from Canvas.canvas import Canvas
+from Canvas.heart import fit
+from Canvas.palette import Palette, convert
+from Canvas.tiled import TiledArray
 from Config.config import Config
 from Misc.errors import IncorrectBackupSize
 from Misc.Template.pixelmodule import PixelModule
@@ -12,62 +18,332 @@ from Misc.utils import logger
 
 
 class BackupHandler(PixelModule):
+    """
+    Creates and restores the backups of the canvas
+    Every n-th backup (backup.keyframe) is a full backup, the others (deltas)
+    only store the pixels changed since the previous backup:
+        backup_%Y_%m_%d_%H_%M_%S.npy:       The full canvas array
+        backup_%Y_%m_%d_%H_%M_%S.delta.npz: index (flat pixel indices), data (pixels)
+    Attributes:
+        config (Config): The configuration
+        canvas (Canvas): The canvas
+        path (Path): The directory of the backups
+        previous (np.ndarray | None): The canvas as stored by the latest backup
+        generation (int): The canvas generation of the latest backup
+        since_keyframe (int): The number of deltas since the latest full backup
+        journal (PixelJournal | None): The write-ahead log of the pixels since the latest backup
+        manifest (BackupManifest): The index of all backups
+        reconfigured (Event): Set when the config was reloaded
+    """
+
     config: Config
     canvas: Canvas
     path: Path
     running: bool
+    previous: np.ndarray | None
+    generation: int
+    since_keyframe: int
+    journal: PixelJournal | None
+    manifest: BackupManifest
+    reconfigured: Event
 
     def __init__(self, config: Config, canvas: Canvas) -> None:
         self.config = config
         self.canvas = canvas
+        self.previous = None
+        self.generation = -1
+        self.since_keyframe = 0
+        self.journal = None
         self.setup()
+        base = INITIAL_BASE
+        if self.canvas.is_restored():
+            logger.info("Canvas was restored from persistent storage, skipping backup")
+        else:
+            base = self.restore() or base
+        if self.config.backup.journal.enabled:
+            self.journal = PixelJournal(self.config, self.path / "journal", base)
+            self.canvas.set_journal(self.journal)
+        self.running = True
+        self.reconfigured = Event()
+        self.config.subscribe(self.reconfigure)
+        super().__init__("Backup")
+
+    def restore(self) -> str | None:
+        """
+        Restores the canvas from the latest backup (or the journal alone if there is none) and logs the result
+        Returns:
+            The time of the restored backup
+        """
         try:
             restored = self.restore_backup()
             if restored:
                 logger.info("Successfully restored from backup")
+            return restored
         except FileNotFoundError:
             logger.warning("No backup found")
         except ValueError:
             logger.warning(
                 "Failed to restore from backup: The file seams to be corrupt."
             )
-        self.running = True
-        super().__init__("Backup")
+        except IncorrectBackupSize:
+            logger.warning(
+                "Failed to restore from backup: The backup doesn't match the canvas."
+            )
+            return None
+        return self.restore_journal()
+
+    def restore_journal(self) -> str | None:
+        """
+        Restores the canvas from the journal alone if there is no valid backup (e.g. after
+        a crash before the first backup), all segments are replayed onto the empty canvas
+        Returns:
+            The base of the replayed segments, None if nothing was replayed
+        """
+        if not self.config.backup.journal.enabled:
+            return None
+        with self.canvas.snapshot() as snapshot:
+            arr = snapshot.data.copy()
+        replayed = replay(
+            arr, self.path / "journal", INITIAL_BASE, palette=self.canvas.palette
+        )
+        if not replayed:
+            return None
+        logger.info(f"Replayed {replayed} pixels from the journal")
+        self.generation = self.canvas.get_generation()
+        self.canvas.restore_from_array(arr)
+        return INITIAL_BASE
 
     def setup(self):
         base = Path().resolve()
         self.path = base / self.config.backup.directory
         if not self.path.exists():
-            self.path.mkdir()
+            self.path.mkdir(parents=True)
+        self.manifest = BackupManifest(self.path)
 
     def create_backup(self):
-        data: np.ndarray = self.canvas.get_raw_data()
-        name = time.strftime("backup_%Y_%m_%d_%H_%M_%S.npy", time.gmtime())
-        np.save(self.path / name, data)
-
-    def restore_backup(self):
-        latest: tuple[time.struct_time, Path | None] = (time.localtime(0), None)
-
-        for entry in self.path.iterdir():
-            if entry.is_file():
-                t = time.strptime(entry.name, "backup_%Y_%m_%d_%H_%M_%S.npy")
-                if t > latest[0]:
-                    latest = (t, entry)
-
-        if latest[1] is not None:
-            arr = np.load(latest[1])
-            try:
-                self.canvas.restore_from_array(arr)
-            except IncorrectBackupSize:
-                raise IncorrectBackupSize(latest[1])
-        return True
+        """
+        Creates a full backup or a delta, nothing is written if the canvas didn't change
+        The files are written from a snapshot in the threadpool
+        """
+        # direct writes since the last tick are already in the journal segment that ends now
+        self.canvas.publish()
+        with self.canvas.snapshot() as snapshot:
+            data = snapshot.data
+            if snapshot.generation == self.generation and self.previous is not None:
+                return
+            name = time.strftime("backup_%Y_%m_%d_%H_%M_%S", time.gmtime())
+
+            keyframe = (
+                self.previous is None
+                or self.previous.shape != data.shape
+                or self.since_keyframe + 1 >= self.config.backup.keyframe
+            )
+            sparse = isinstance(data, TiledArray)
+            if keyframe:
+                # the views of a sparse canvas never change, they are kept instead of a copy
+                self.previous = data if sparse else data.copy()
+            else:
+                index, pixels = self.changed_pixels(data)
+                if sparse:
+                    self.previous = data
+            self.generation = snapshot.generation
+
+        if keyframe:
+            self.since_keyframe = 0
+            self.rotate_journal(name)
+            if sparse:
+                file = f"{name}.tiles.npz"
+                get_hub().threadpool.apply(self.previous.save, (self.path / file,))
+            else:
+                file = f"{name}.npy"
+                get_hub().threadpool.apply(np.save, (self.path / file, self.previous))
+            self.manifest.add(name, file, True)
+            self.prune()
+            return
+
+        if len(index) == 0:
+            return
+        if not sparse:
+            self.previous.reshape(-1, data.shape[2])[index] = pixels
+        self.since_keyframe += 1
+        self.rotate_journal(name)
+        get_hub().threadpool.apply(
+            np.savez_compressed,
+            (self.path / f"{name}.delta.npz",),
+            {"index": index, "data": pixels},
+        )
+        self.manifest.add(name, f"{name}.delta.npz", False)
+
+    def rotate_journal(self, name: str) -> None:
+        """
+        Starts a new journal segment for the writes after the backup with the given name
+        """
+        if self.journal:
+            self.journal.rotate(name[len("backup_") :])
+
+    def changed_pixels(self, data: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Compares the changed regions of the canvas with the latest backup
+        Args:
+            data (np.ndarray | TiledArray): The current canvas array
+
+        Returns:
+            The sorted flat indices of all changed pixels and their values
+        """
+        width = data.shape[1]
+        indices = []
+        values = []
+        for x, y, w, h in self.canvas.get_dirty_rects(self.generation):
+            region = data[y : y + h, x : x + w]
+            ys, xs = np.nonzero(
+                np.any(region != self.previous[y : y + h, x : x + w], axis=2)
+            )
+            indices.append((ys + y) * width + (xs + x))
+            values.append(region[ys, xs])
+        if not indices:
+            return np.empty(0, dtype=np.uint32), np.empty((0, data.shape[2]), np.uint8)
+        index = np.concatenate(indices)
+        order = np.argsort(index)
+        return index[order].astype(np.uint32), np.concatenate(values)[order]
+
+    def prune(self):
+        """
+        Deletes the oldest full backups and their deltas (keeps backup.delete full backups)
+        """
+        if self.config.backup.delete <= 0:
+            return
+        keyframes = self.manifest.keyframes()
+        if len(keyframes) <= self.config.backup.delete:
+            return
+        oldest = self.manifest.entries[keyframes[-self.config.backup.delete]]
+        self.manifest.remove(
+            [entry for entry in self.manifest.entries if entry.name < oldest.name]
+        )
+        if self.journal:
+            self.journal.compact(oldest.time)
+
+    def restore_backup(self) -> str:
+        """
+        Restores the latest valid full backup, replays its deltas and the journal written after them
+        Returns:
+            The time of the latest restored backup (%Y_%m_%d_%H_%M_%S)
+        """
+        if not self.manifest.entries:
+            raise FileNotFoundError()
+        chain = self.manifest.latest_chain()
+        if not chain:
+            raise ValueError("No valid backup found")
+        if chain[-1] is not self.manifest.entries[-1]:
+            logger.warning(f"Falling back to backup {chain[-1].file}")
+
+        # a sparse backup stays sparse for a sparse canvas, it is never assembled
+        sparse = self.config.visuals.sparse.enabled
+        arr = self.load_chain(self.path, chain)
+        if isinstance(arr, TiledArray) and not sparse:
+            arr = np.array(arr)
+        width, height = self.canvas.get_size()
+        if arr.shape[:2] != (height, width):
+            logger.warning(
+                f"The backup {chain[0].file} ({arr.shape[1]}x{arr.shape[0]}) doesn't match "
+                f"the canvas ({width}x{height}), restoring it into the upper left corner"
+            )
+            shape = (height, width, arr.shape[2])
+            arr = arr.fit(shape) if isinstance(arr, TiledArray) else fit(arr, shape)
+        channels = self.canvas.get_raw_data().shape[2]
+        if arr.shape[2] != channels:
+            logger.warning(
+                f"The backup {chain[0].file} was taken in another color mode, converting it"
+            )
+            arr = convert(arr, channels, Palette(self.config.visuals.palette.colors))
+        palette = self.canvas.palette
+        # a sparse canvas starts with a (sparse) full backup instead of holding a dense copy
+        self.previous = None if sparse else arr.copy()
+        base = chain[-1].time
+        if self.config.backup.journal.enabled:
+            replayed = replay(arr, self.path / "journal", base, palette=palette)
+            logger.info(f"Replayed {replayed} pixels from the journal")
+
+        # the replayed pixels aren't part of a backup yet, so the next delta compares everything
+        self.generation = self.canvas.get_generation()
+        self.canvas.restore_from_array(arr)
+
+        self.since_keyframe = len(chain) - 1
+        return base
+
+    @classmethod
+    def load_backup(
+        cls, path: Path, until: str | None = None
+    ) -> tuple[np.ndarray, str]:
+        """
+        Loads the latest valid backup (without the journal), the canvas isn't changed
+        Args:
+            path (Path): The directory of the backups
+            until (str | None): Only use backups up to this time (%Y_%m_%d_%H_%M_%S)
+
+        Returns:
+            The canvas array and the time of the backup
+        """
+        chain = BackupManifest(path).latest_chain(until)
+        if not chain:
+            raise FileNotFoundError(path)
+        return cls.load_chain(path, chain), chain[-1].time
+
+    @staticmethod
+    def load_keyframe(file: Path) -> np.ndarray | TiledArray:
+        """
+        Loads a full backup, dense backups are mapped (copy-on-write) and sparse ones (.tiles.npz) loaded as tiles
+        """
+        if file.name.endswith(".tiles.npz"):
+            return TiledArray.load(file)
+        return np.load(file, mmap_mode="c")
+
+    @staticmethod
+    def load_chain(path: Path, chain: list[BackupEntry]) -> np.ndarray | TiledArray:
+        """
+        Maps a full backup (copy-on-write) and applies the following deltas
+        Args:
+            path (Path): The directory of the backups
+            chain (list[BackupEntry]): The backups, starting with a full backup
+
+        Returns:
+            The canvas array, a TiledArray for a sparse backup (np.array assembles it)
+        """
+        arr = BackupHandler.load_keyframe(path / chain[0].file)
+        for entry in chain[1:]:
+            BackupHandler.apply_delta(arr, path / entry.file)
+        return arr
+
+    @staticmethod
+    def apply_delta(arr: np.ndarray | TiledArray, file: Path) -> None:
+        """
+        Writes the pixels of a delta backup into a canvas array
+        """
+        with np.load(file) as delta:
+            if isinstance(arr, TiledArray):
+                arr.put(delta["index"], delta["data"])
+            else:
+                arr.reshape(-1, arr.shape[2])[delta["index"]] = delta["data"]
 
     def stop(self):
         self.running = False
+        if self.journal:
+            self.journal.close()
+
+    def reconfigure(self, config: Config, changed: set[str]) -> None:
+        """
+        Wakes the loop to apply a changed interval
+        """
+        if "backup" in changed:
+            self.reconfigured.set()
 
     def loop(self):
         logger.info(f"Starting Process: BACKUP.loop")
 
         while self.running:
+            last = time.time()
             self.create_backup()
-            gsleep(self.config.backup.interval)
+            while self.running:  # until the (possibly reloaded) interval has passed
+                self.reconfigured.clear()
+                remaining = last + self.config.backup.interval - time.time()
+                if remaining <= 0 or not self.reconfigured.wait(remaining):
+                    break
@@ -0,0 +1,319 @@
+import argparse
+import re
+import struct
+import time
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+import numpy as np
+
+from Canvas.heart import Heart, blend, to_stamp
+from Canvas.palette import Palette, PaletteHeart, blend_indices, convert
+from Canvas.tiled import TiledArray
+from Config.config import Config
+from Misc.utils import logger
+
+SEGMENT_PATTERN = re.compile(r"^journal_(\d{4}(?:_\d{2}){5})_(\d{6})\.log$")
+INITIAL_BASE = "0000_00_00_00_00_00"
+BATCH = struct.Struct("<4sdI")
+BATCH_MAGIC = b"PXB1"
+RECORD = np.dtype(
+    [
+        ("x", "<u2"),
+        ("y", "<u2"),
+        ("r", "u1"),
+        ("g", "u1"),
+        ("b", "u1"),
+        ("a", "u1"),
+    ]
+)
+
+
+def to_records(pixels: np.ndarray) -> np.ndarray:
+    """
+    Converts a pixel batch (n, 6) to journal records
+    """
+    records = np.empty(len(pixels), dtype=RECORD)
+    for i, field in enumerate(RECORD.names):
+        records[field] = pixels[:, i]
+    return records
+
+
+def from_records(records: np.ndarray) -> np.ndarray:
+    """
+    Converts journal records to a pixel batch (n, 6)
+    """
+    return np.stack([records[field] for field in RECORD.names], axis=1).astype(np.int64)
+
+
+def read_segment(path: Path) -> Iterator[tuple[float, np.ndarray]]:
+    """
+    Reads all complete batches of a segment, a torn batch at the end is ignored
+    Args:
+        path (Path): The segment
+
+    Returns:
+        An iterator over (timestamp, pixels)
+    """
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(BATCH.size)
+            if len(header) < BATCH.size:
+                return
+            magic, timestamp, count = BATCH.unpack(header)
+            if magic != BATCH_MAGIC:
+                logger.warning(f"Journal {path.name} is corrupt, stopping replay")
+                return
+            data = f.read(count * RECORD.itemsize)
+            if len(data) < count * RECORD.itemsize:
+                logger.warning(f"Journal {path.name} ends with a torn batch")
+                return
+            yield timestamp, from_records(np.frombuffer(data, dtype=RECORD))
+
+
+def list_segments(directory: Path) -> list[tuple[str, int, Path]]:
+    """
+    Lists all journal segments of a directory
+    Returns:
+        A sorted list of (base, number, path), base is the time of the backup the segment follows
+    """
+    segments = []
+    if not directory.exists():
+        return segments
+    for entry in directory.iterdir():
+        match = SEGMENT_PATTERN.match(entry.name)
+        if match:
+            segments.append((match.group(1), int(match.group(2)), entry))
+    return sorted(segments)
+
+
+def apply_batch(
+    data: np.ndarray,
+    pixels: np.ndarray,
+    palette: Palette | None = None,
+    generation: int = 1,
+) -> int:
+    """
+    Blends a journal batch onto a canvas array, pixels outside of the canvas are ignored
+    Args:
+        data (np.ndarray | TiledArray): The canvas array
+        pixels (np.ndarray): The batch (n, 6)
+        palette (Palette | None): The palette of the canvas, an array holding indices (see PaletteHeart)
+            is blended by blend_indices, the blended colors of an RGB array are mapped to it
+        generation (int): The generation the pixels are stamped with (see to_stamp), a restored
+            canvas restamps all written pixels anyway
+
+    Returns:
+        The number of applied pixels
+    """
+    height, width = data.shape[:2]
+    pixels = pixels[(pixels[:, 0] < width) & (pixels[:, 1] < height)]
+    args = (
+        data,
+        pixels[:, 0],
+        pixels[:, 1],
+        pixels[:, 2:].astype(np.uint8),
+        to_stamp(generation),
+    )
+    if palette is not None and data.shape[2] == PaletteHeart.channels:
+        blend_indices(*args, palette)
+    elif isinstance(data, TiledArray):
+        data.blend_pixels(*args[1:], palette)
+    else:
+        blend(*args, palette.snap if palette else None)
+    return len(pixels)
+
+
+def replay(
+    data: np.ndarray | TiledArray,
+    directory: Path,
+    base: str,
+    until: float | None = None,
+    palette: Palette | None = None,
+) -> int:
+    """
+    Applies the journal written after a backup onto a canvas array
+    Args:
+        data (np.ndarray | TiledArray): The canvas array restored from the backup
+        directory (Path): The journal directory
+        base (str): The time of the backup (%Y_%m_%d_%H_%M_%S)
+        until (float | None): Only replay batches up to this unix time
+        palette (Palette | None): The palette of the canvas (see apply_batch)
+
+    Returns:
+        The number of replayed pixels
+    """
+    replayed = 0
+    for segment_base, _, path in list_segments(directory):
+        if segment_base < base:
+            continue
+        for timestamp, pixels in read_segment(path):
+            if until is not None and timestamp > until:
+                return replayed
+            replayed += apply_batch(data, pixels, palette)
+    return replayed
+
+
+class PixelJournal:
+    """
+    The append-only write-ahead log of all pixels applied to the canvas
+    The journal is split into segments, every backup starts a new one:
+        journal_<backup time>_<number>.log
+    so all writes after a backup are in the segments with the same or a later
+    base. A segment is a sequence of batches:
+        Header: magic (4 Bytes), unix time (float64), count (uint32)
+        Records: count * (x uint16, y uint16, r, g, b, a uint8)
+    Attributes:
+        config (Config): The configuration
+        path (Path): The directory of the segments
+        base (str): The time of the backup the current segment follows
+        number (int): The number of the current segment
+        file (BinaryIO | None): The current segment
+        size (int): The size of the current segment in bytes
+    """
+
+    config: Config
+    path: Path
+    base: str
+    number: int
+    file: BinaryIO | None
+    size: int
+
+    def __init__(self, config: Config, path: Path, base: str = INITIAL_BASE):
+        self.config = config
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        segments = list_segments(self.path)
+        self.base, self.number = base, 0
+        if segments and segments[-1][0] >= base:
+            self.base, self.number = segments[-1][:2]
+        self.file = None
+        self.size = 0
+        self.open_segment(self.base, self.number + 1)
+
+    def open_segment(self, base: str, number: int) -> None:
+        """
+        Closes the current segment and starts a new one
+        """
+        self.close()
+        self.base, self.number = base, number
+        segment = self.path / f"journal_{base}_{number:06d}.log"
+        self.file = open(segment, "ab")
+        self.size = segment.stat().st_size
+
+    def append(self, pixels: np.ndarray) -> None:
+        """
+        Appends a batch of applied pixels (buffered, see flush)
+        Args:
+            pixels (np.ndarray): An array of shape (n, 6) with the columns x, y, r, g, b, a
+        """
+        if self.file is None or len(pixels) == 0:
+            return
+        records = to_records(pixels).tobytes()
+        self.file.write(BATCH.pack(BATCH_MAGIC, time.time(), len(pixels)))
+        self.file.write(records)
+        self.size += BATCH.size + len(records)
+        if self.size >= self.config.backup.journal.segment_size * 1024 * 1024:
+            self.open_segment(self.base, self.number + 1)
+
+    def flush(self) -> None:
+        """
+        Writes the buffered batches to the segment
+        """
+        if self.file:
+            self.file.flush()
+
+    def rotate(self, backup: str) -> None:
+        """
+        Starts a new segment for the writes after a backup
+        Args:
+            backup (str): The time of the backup (%Y_%m_%d_%H_%M_%S)
+        """
+        self.open_segment(backup, 1)
+
+    def compact(self, oldest: str) -> None:
+        """
+        Deletes all segments that are older than the oldest kept backup
+        Args:
+            oldest (str): The time of the oldest kept backup (%Y_%m_%d_%H_%M_%S)
+        """
+        for base, _, path in list_segments(self.path):
+            if base < oldest:
+                path.unlink(missing_ok=True)
+                logger.info(f"Deleted old journal {path.name}")
+
+    def close(self) -> None:
+        """
+        Flushes and closes the current segment
+        """
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def render_frame(config: Config, until: float) -> np.ndarray | TiledArray:
+    """
+    Regenerates the canvas at a given time from the backups and the journal
+    Args:
+        config (Config): The configuration (backup.directory)
+        until (float): The unix time of the frame
+
+    Returns:
+        The canvas array (see Heart), a backup holding palette indices is decoded to RGB.
+        A sparse backup stays a TiledArray, the journal is replayed onto its tiles
+    """
+    from Backup.backup import BackupHandler
+    from Backup.manifest import BackupManifest
+
+    directory = Path(config.backup.directory).resolve()
+    limit = time.strftime("%Y_%m_%d_%H_%M_%S", time.gmtime(until))
+    chain = BackupManifest(directory).latest_chain(limit)
+    if not chain:
+        raise FileNotFoundError(f"No valid backup before {limit}")
+
+    data = BackupHandler.load_chain(directory, chain)
+    if not isinstance(data, TiledArray):
+        data = np.array(data)
+    palette = Palette.of(config, data)
+    replay(data, directory / "journal", chain[-1].time, until, palette)
+    if palette:
+        data = convert(data, Heart.channels, palette)
+    return data
+
+
+def main():
+    """
+    Regenerates a historical frame of the canvas as image
+    """
+    from PIL import Image
+
+    parser = argparse.ArgumentParser(
+        usage="python3 -m Backup.journal [-c configfile] [-t unixtime] output"
+    )
+    parser.add_argument("output", type=str, help="the image file to write")
+    parser.add_argument(
+        "-c",
+        "--config",
+        dest="configfile",
+        default="Config/config.json",
+        type=str,
+        help="specify a config file",
+    )
+    parser.add_argument(
+        "-t",
+        "--time",
+        dest="until",
+        default=None,
+        type=float,
+        help="unix time of the frame (default: now)",
+    )
+    args = parser.parse_args()
+
+    config = Config(args.configfile)
+    data = render_frame(config, args.until if args.until else time.time())
+    Image.fromarray(data[:, :, :3]).save(args.output)
+    logger.info(f"Saved frame to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import json
+import os
+import re
+import zlib
+from pathlib import Path
+
+from Misc.utils import logger
+
+BACKUP_PATTERN = re.compile(
+    r"^(backup_\d{4}(?:_\d{2}){5})(\.npy|\.tiles\.npz|\.delta\.npz)$"
+)
+MANIFEST_VERSION = 1
+
+
+def file_checksum(path: Path, chunk_size: int = 1 << 24) -> int:
+    """
+    Calculates the CRC32 of a file
+    """
+    checksum = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            checksum = zlib.crc32(chunk, checksum)
+    return checksum
+
+
+class BackupEntry:
+    """
+    A backup listed in the manifest
+    Attributes:
+        name (str): The name of the backup (backup_%Y_%m_%d_%H_%M_%S)
+        file (str): The file name
+        keyframe (bool): If it is a full backup (or a delta otherwise)
+        size (int): The size of the file in bytes
+        checksum (int | None): The CRC32 of the file (None if unknown)
+    """
+
+    name: str
+    file: str
+    keyframe: bool
+    size: int
+    checksum: int | None
+
+    def __init__(
+        self, name: str, file: str, keyframe: bool, size: int, checksum: int | None
+    ):
+        self.name = name
+        self.file = file
+        self.keyframe = keyframe
+        self.size = size
+        self.checksum = checksum
+
+    @property
+    def time(self) -> str:
+        """The time of the backup (%Y_%m_%d_%H_%M_%S)"""
+        return self.name[len("backup_") :]
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "file": self.file,
+            "keyframe": self.keyframe,
+            "size": self.size,
+            "checksum": self.checksum,
+        }
+
+
+class BackupManifest:
+    """
+    The index of all backups in a directory (manifest.json), ordered from old to new
+    Attributes:
+        path (Path): The directory of the backups
+        entries (list[BackupEntry]): The backups
+    """
+
+    path: Path
+    entries: list[BackupEntry]
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries = []
+        self.load()
+
+    @property
+    def file(self) -> Path:
+        return self.path / "manifest.json"
+
+    def load(self) -> None:
+        """
+        Loads the manifest, it is rebuilt from the directory if it is missing or invalid
+        """
+        try:
+            with open(self.file, "r") as f:
+                manifest = json.load(f)
+            if manifest["version"] != MANIFEST_VERSION:
+                raise ValueError(f"Unknown manifest version {manifest['version']}")
+            self.entries = [BackupEntry(**entry) for entry in manifest["backups"]]
+        except FileNotFoundError:
+            self.rebuild()
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Backup manifest is invalid ({e}), rebuilding it")
+            self.rebuild()
+
+    def rebuild(self) -> None:
+        """
+        Lists all backups of the directory (without checksums), ignoring unrelated files
+        """
+        entries = []
+        for entry in self.path.iterdir():
+            match = BACKUP_PATTERN.match(entry.name)
+            if match and entry.is_file():
+                entries.append(
+                    BackupEntry(
+                        match.group(1),
+                        entry.name,
+                        match.group(2) != ".delta.npz",
+                        entry.stat().st_size,
+                        None,
+                    )
+                )
+        self.entries = sorted(entries, key=lambda e: (e.name, not e.keyframe))
+        if self.entries:
+            self.save()
+
+    def save(self) -> None:
+        """
+        Writes the manifest atomically
+        """
+        tmp = self.file.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "version": MANIFEST_VERSION,
+                    "backups": [entry.to_dict() for entry in self.entries],
+                },
+                f,
+                indent=1,
+            )
+        os.replace(tmp, self.file)
+
+    def add(self, name: str, file: str, keyframe: bool) -> BackupEntry:
+        """
+        Adds a written backup file to the manifest
+        """
+        path = self.path / file
+        entry = BackupEntry(
+            name, file, keyframe, path.stat().st_size, file_checksum(path)
+        )
+        self.entries = [e for e in self.entries if e.file != file]
+        self.entries.append(entry)
+        self.save()
+        return entry
+
+    def remove(self, entries: list[BackupEntry]) -> None:
+        """
+        Deletes backups and removes them from the manifest
+        """
+        for entry in entries:
+            (self.path / entry.file).unlink(missing_ok=True)
+            logger.info(f"Deleted old backup {entry.file}")
+        files = {entry.file for entry in entries}
+        self.entries = [e for e in self.entries if e.file not in files]
+        self.save()
+
+    def keyframes(self) -> list[int]:
+        """
+        Returns the indices of all full backups
+        """
+        return [i for i, entry in enumerate(self.entries) if entry.keyframe]
+
+    def verify(self, entry: BackupEntry) -> bool:
+        """
+        Checks if a backup file is complete and unchanged
+        """
+        path = self.path / entry.file
+        try:
+            if path.stat().st_size != entry.size:
+                logger.warning(f"Backup {entry.file} is truncated")
+                return False
+            if entry.checksum is not None and file_checksum(path) != entry.checksum:
+                logger.warning(f"Backup {entry.file} has an invalid checksum")
+                return False
+        except FileNotFoundError:
+            logger.warning(f"Backup {entry.file} is missing")
+            return False
+        return True
+
+    def latest_chain(self, until: str | None = None) -> list[BackupEntry]:
+        """
+        Returns the newest valid full backup with its valid deltas
+        Falls back to older full backups if the newest one is damaged, the
+        deltas are used up to the first damaged one
+        Args:
+            until (str | None): Only use backups up to this time (%Y_%m_%d_%H_%M_%S)
+
+        Returns:
+            The chain starting with the full backup, empty if there is no valid backup
+        """
+        entries = [e for e in self.entries if until is None or e.time <= until]
+        starts = [i for i, entry in enumerate(entries) if entry.keyframe]
+        for start in reversed(starts):
+            if not self.verify(entries[start]):
+                continue
+            chain = [entries[start]]
+            for entry in entries[start + 1 :]:
+                if entry.keyframe or not self.verify(entry):
+                    break
+                chain.append(entry)
+            return chain
+        return []
@@ -0,0 +1,333 @@
+import argparse
+import calendar
+import multiprocessing
+import time
+from collections import deque
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+from PIL import Image
+
+from Backup.journal import apply_batch, list_segments, read_segment
+from Backup.manifest import BackupEntry, BackupManifest
+from Backup.video import VideoWriter, open_writer
+from Canvas.heart import fit
+from Canvas.palette import Palette, PaletteHeart
+from Config.config import Config
+from Misc.utils import logger
+
+worker_writer: VideoWriter | None = None
+worker_size: tuple[int, int] | None = None
+
+
+def backup_time(entry: BackupEntry) -> float:
+    """
+    Returns the unix time of a backup (the names are UTC)
+    """
+    return calendar.timegm(time.strptime(entry.time, "%Y_%m_%d_%H_%M_%S"))
+
+
+def init_worker(writer: VideoWriter, size: tuple[int, int] | None) -> None:
+    """
+    Initializes an encoding process with a copy of the writer
+    """
+    global worker_writer, worker_size
+    worker_writer = writer
+    worker_size = size
+
+
+def encode_frame(frame: np.ndarray) -> bytes:
+    """
+    Scales and encodes a frame (runs in an encoding process)
+    """
+    if worker_size is not None and worker_size != (frame.shape[1], frame.shape[0]):
+        resample = (
+            Image.Resampling.NEAREST
+            if worker_size[0] >= frame.shape[1]
+            else Image.Resampling.BOX
+        )
+        frame = np.asarray(Image.fromarray(frame).resize(worker_size, resample))
+    return worker_writer.encode(frame)
+
+
+class History:
+    """
+    The stored history of the canvas as a stream of changes in time order
+    The canvas is restored from the latest backup before the start, the changes
+    after it are taken from the journal or, if there is none, from the backups
+    (one change per backup).
+    Attributes:
+        directory (Path): The directory of the backups
+        manifest (BackupManifest): The index of the backups
+        chain (list[BackupEntry]): The backups the canvas is restored from
+        data (np.ndarray): The canvas array at the current position
+        palette (Palette): The palette of backups holding indices (see PaletteHeart)
+        quantize (bool): If the blended colors of RGB backups are mapped to the palette (a sparse canvas with a palette)
+    """
+
+    directory: Path
+    manifest: BackupManifest
+    chain: list[BackupEntry]
+    data: np.ndarray
+    palette: Palette
+    quantize: bool
+
+    def __init__(
+        self, directory: Path, start: float, palette: Palette, quantize: bool = False
+    ):
+        self.directory = directory
+        self.palette = palette
+        self.quantize = quantize
+        self.manifest = BackupManifest(directory)
+        limit = time.strftime("%Y_%m_%d_%H_%M_%S", time.gmtime(start))
+        self.chain = self.manifest.latest_chain(limit)
+        if not self.chain:
+            self.chain = self.manifest.latest_chain(
+                self.manifest.entries[0].time if self.manifest.entries else None
+            )
+        if not self.chain:
+            raise FileNotFoundError(f"No valid backup in {directory}")
+        from Backup.backup import BackupHandler
+
+        self.data = np.array(BackupHandler.load_chain(directory, self.chain))
+
+    @property
+    def journal(self) -> Path:
+        return self.directory / "journal"
+
+    @property
+    def base(self) -> str:
+        """The time of the latest backup of the restored chain"""
+        return self.chain[-1].time
+
+    def colors(self, x: int, y: int, w: int, h: int) -> np.ndarray:
+        """
+        Returns the RGB values of a region at the current position, shape (h, w, 3)
+        """
+        region = self.data[y : y + h, x : x + w]
+        if self.data.shape[2] == PaletteHeart.channels:
+            return self.palette.decode(region)
+        return region[:, :, :3]
+
+    def has_journal(self) -> bool:
+        """
+        Returns if the journal covers the writes after the restored backups
+        """
+        return any(base >= self.base for base, _, _ in list_segments(self.journal))
+
+    def changes(self) -> Iterator[float]:
+        """
+        Applies the changes one after another to the canvas array
+        Returns:
+            An iterator over the unix times of the changes, each change is
+            applied when the iteration continues
+        """
+        if self.has_journal():
+            yield from self.journal_changes()
+        else:
+            logger.warning("No journal found, using one frame per backup")
+            yield from self.backup_changes()
+
+    def journal_changes(self) -> Iterator[float]:
+        palette = (
+            self.palette
+            if self.data.shape[2] == PaletteHeart.channels or self.quantize
+            else None
+        )
+        for base, _, path in list_segments(self.journal):
+            if base < self.base:
+                continue
+            for timestamp, pixels in read_segment(path):
+                yield timestamp
+                apply_batch(self.data, pixels, palette)
+
+    def backup_changes(self) -> Iterator[float]:
+        from Backup.backup import BackupHandler
+
+        entries = self.manifest.entries
+        skip = False
+        for entry in entries[entries.index(self.chain[-1]) + 1 :]:
+            if entry.keyframe:
+                skip = not self.manifest.verify(entry)
+            elif not skip:
+                # the following deltas are based on a damaged backup
+                skip = not self.manifest.verify(entry)
+            if skip:
+                continue
+            yield backup_time(entry)
+            if entry.keyframe:
+                # takes the size of the keyframe, the canvas might have been resized
+                self.data = np.array(
+                    BackupHandler.load_keyframe(self.directory / entry.file)
+                )
+            else:
+                BackupHandler.apply_delta(self.data, self.directory / entry.file)
+
+
+def regenerate(
+    config: Config,
+    output: Path,
+    start: float | None = None,
+    end: float | None = None,
+    step: float | None = None,
+    region: tuple[int, int, int, int] | None = None,
+    scale: float = 1.0,
+    format: str | None = None,
+    fps: int | float | None = None,
+    quality: int | None = None,
+    processes: int | None = None,
+) -> int:
+    """
+    Renders a timelapse from the backups and the journal
+    Only the current canvas and a bounded number of frames (2 per process) are
+    held in memory, the frames are scaled and encoded by a pool of processes.
+    Args:
+        config (Config): The configuration (backup.directory and timelapse defaults)
+        output (Path): The path of the video without extension
+        start (float | None): The unix time of the first frame (default: the oldest backup)
+        end (float | None): The unix time of the last frame (default: the last change)
+        step (float | None): The seconds of canvas time between two frames (default: timelapse.interval)
+        region (tuple[int, int, int, int] | None): The rendered region (x, y, width, height)
+        scale (float): The scale of the frames
+        format (str | None): "mjpeg" or "mp4" (default: timelapse.format)
+        fps (int | float | None): The framerate of the video (default: timelapse.fps)
+        quality (int | None): The JPEG quality (default: timelapse.quality)
+        processes (int | None): The number of encoding processes (default: number of CPUs)
+
+    Returns:
+        The number of written frames
+    """
+    directory = Path(config.backup.directory).resolve()
+    step = step or config.timelapse.interval
+    if step <= 0:
+        raise ValueError("The step has to be positive")
+    if start is None:
+        entries = BackupManifest(directory).entries
+        if not entries:
+            raise FileNotFoundError(f"No backup in {directory}")
+        start = backup_time(entries[0])
+
+    history = History(
+        directory,
+        start,
+        Palette(config.visuals.palette.colors),
+        config.visuals.palette.enabled,
+    )
+    changes = history.changes()
+    height, width = history.data.shape[:2]
+    x, y, w, h = region or (0, 0, width, height)
+    if x < 0 or y < 0 or w <= 0 or h <= 0 or x + w > width or y + h > height:
+        raise ValueError(f"The region {region} is outside of the canvas")
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+
+    writer = open_writer(
+        output,
+        format or config.timelapse.format,
+        fps or config.timelapse.fps,
+        quality or config.timelapse.quality,
+        size,
+    )
+    logger.info(f"Rendering timelapse to {writer.path}")
+    processes = processes or multiprocessing.cpu_count()
+    pending = deque()
+    frames = 0
+
+    def submit(pool: multiprocessing.Pool) -> None:
+        nonlocal frames
+        if len(pending) >= 2 * processes:
+            writer.append(pending.popleft().get())
+        frame = fit(np.ascontiguousarray(history.colors(x, y, w, h)), (h, w, 3))
+        pending.append(pool.apply_async(encode_frame, (frame,)))
+        frames += 1
+
+    with multiprocessing.Pool(processes, init_worker, (writer, size)) as pool:
+        try:
+            frame_time = start
+            for timestamp in changes:
+                # the frames before the change
+                while frame_time < timestamp and (end is None or frame_time <= end):
+                    submit(pool)
+                    frame_time += step
+                if end is not None and frame_time > end:
+                    break
+            else:
+                # the state after the last change
+                last = end if end is not None else frame_time
+                while frame_time <= last:
+                    submit(pool)
+                    frame_time += step
+            while pending:
+                writer.append(pending.popleft().get())
+        finally:
+            writer.close()
+
+    logger.info(f"Wrote {frames} frames to {writer.path}")
+    return frames
+
+
+def main():
+    """
+    Renders a timelapse from the stored history of the canvas
+    """
+    parser = argparse.ArgumentParser(
+        usage="python3 -m Backup.regenerate [-c configfile] [options] output"
+    )
+    parser.add_argument(
+        "output", type=str, help="the video file to write (without extension)"
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        dest="configfile",
+        default="Config/config.json",
+        type=str,
+        help="specify a config file",
+    )
+    parser.add_argument(
+        "--start",
+        type=float,
+        help="unix time of the first frame (default: oldest backup)",
+    )
+    parser.add_argument(
+        "--end", type=float, help="unix time of the last frame (default: last change)"
+    )
+    parser.add_argument(
+        "--step",
+        type=float,
+        help="seconds of canvas time per frame (default: timelapse.interval)",
+    )
+    parser.add_argument(
+        "--region",
+        type=lambda s: tuple(int(v) for v in s.split(",")),
+        help="the rendered region x,y,width,height (default: the whole canvas)",
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="scale of the frames (default: 1)"
+    )
+    parser.add_argument("--format", choices=["mjpeg", "mp4"], help="video format")
+    parser.add_argument("--fps", type=float, help="framerate of the video (mp4)")
+    parser.add_argument("--quality", type=int, help="JPEG quality (mjpeg)")
+    parser.add_argument(
+        "-p", "--processes", type=int, help="encoding processes (default: CPU count)"
+    )
+    args = parser.parse_args()
+
+    config = Config(args.configfile)
+    regenerate(
+        config,
+        Path(args.output),
+        args.start,
+        args.end,
+        args.step,
+        args.region,
+        args.scale,
+        args.format,
+        args.fps,
+        args.quality,
+        args.processes,
+    )
+
+
+if __name__ == "__main__":
+    main()
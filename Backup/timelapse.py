@@ -1,44 +1,114 @@
 import time
 from pathlib import Path
 
-from gevent.time import sleep as gsleep
-from PIL import Image
+import numpy as np
+from gevent import get_hub
+from gevent.event import Event
 
+from Backup.video import VideoWriter, open_writer
 from Canvas.canvas import Canvas
 from Config.config import Config
 from Misc.utils import logger
 
 
 class TimelapseHandler:
+    """
+    Appends a frame to the timelapse video every interval, if the canvas changed
+    Attributes:
+        config (Config): The configuration
+        canvas (Canvas): The canvas
+        path (Path): The directory of the timelapse
+        running (bool): If the loop is running
+        writer (VideoWriter | None): The video of the current run
+        generation (int): The canvas generation of the latest frame
+        shape (tuple | None): The shape of the frames of the current video
+        reconfigured (Event): Set when the config was reloaded
+    """
+
     config: Config
     canvas: Canvas
     path: Path
     running: bool
+    writer: VideoWriter | None
+    generation: int
+    shape: tuple | None
+    reconfigured: Event
 
     def __init__(self, config: Config, canvas: Canvas) -> None:
         self.config = config
         self.canvas = canvas
+        self.writer = None
+        self.generation = -1
+        self.shape = None
         self.setup()
         self.running = True
+        self.reconfigured = Event()
+        self.config.subscribe(self.reconfigure)
 
     def setup(self):
         base = Path().resolve()
-        self.path = base / self.config.backup.directory
+        self.path = base / self.config.timelapse.directory
         if not self.path.exists():
-            self.path.mkdir()
+            self.path.mkdir(parents=True)
 
     def create_timelapse(self):
-        img: Image = self.canvas.get_canvas()
-        img = img.convert("RGBA")
-        name = time.strftime("image_%Y_%m_%d_%H_%M_%S.png", time.gmtime())
-        img.save(self.path / name)
+        """
+        Appends the latest snapshot to the video, the encoding runs in the threadpool (or in ffmpeg)
+        """
+        with self.canvas.snapshot() as snapshot:
+            if snapshot.generation == self.generation:
+                return
+            self.generation = snapshot.generation
+            self.write_frame(snapshot.colors())
+
+    def write_frame(self, frame: np.ndarray) -> None:
+        """
+        Appends a frame to the video of the current run, a resized canvas starts a new video
+        """
+        if self.writer and frame.shape != self.shape:
+            self.close()
+        if self.writer is None:
+            self.shape = frame.shape
+            name = time.strftime("timelapse_%Y_%m_%d_%H_%M_%S", time.gmtime())
+            self.writer = open_writer(
+                self.path / name,
+                self.config.timelapse.format,
+                self.config.timelapse.fps,
+                self.config.timelapse.quality,
+            )
+            logger.info(f"Writing timelapse to {self.writer.path}")
+        data = get_hub().threadpool.apply(self.writer.encode, (frame,))
+        self.writer.append(data)
 
     def stop(self):
         self.running = False
 
+    def close(self):
+        """
+        Finishes the video of the current run
+        """
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+    def reconfigure(self, config: Config, changed: set[str]) -> None:
+        """
+        Wakes the loop to apply a changed interval
+        """
+        if "timelapse" in changed:
+            self.reconfigured.set()
+
     def loop(self):
         logger.info(f"Starting Process: TIMELAPSE.loop")
 
-        while self.running:
-            self.create_timelapse()
-            gsleep(self.config.backup.interval)
+        try:
+            while self.running:
+                last = time.time()
+                self.create_timelapse()
+                while self.running:  # until the (possibly reloaded) interval has passed
+                    self.reconfigured.clear()
+                    remaining = last + self.config.timelapse.interval - time.time()
+                    if remaining <= 0 or not self.reconfigured.wait(remaining):
+                        break
+        finally:
+            self.close()
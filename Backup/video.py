@@ -0,0 +1,187 @@
+import shutil
+import subprocess
+from abc import ABC, abstractmethod
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO
+
+import numpy as np
+from PIL import Image
+
+from Misc.utils import logger
+
+
+class VideoWriter(ABC):
+    """
+    The abstract base class for appending frames to a video file
+    Writing a frame is split into encode (CPU bound, thread safe, can run in a
+    worker thread or process) and append (I/O, runs in the caller's greenlet)
+    Attributes:
+        path (Path): The path of the video
+    """
+
+    path: Path
+    extension: str
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    @abstractmethod
+    def encode(self, frame: np.ndarray) -> bytes:
+        """
+        Encodes a frame
+        Args:
+            frame (np.ndarray): The RGB frame, shape (h, w, 3)
+        """
+
+    @abstractmethod
+    def append(self, data: bytes) -> None:
+        """
+        Appends an encoded frame to the video
+        """
+
+    def write(self, frame: np.ndarray) -> None:
+        """
+        Encodes and appends a frame
+        """
+        self.append(self.encode(frame))
+
+    def close(self) -> None:
+        """
+        Finishes the video
+        """
+        pass
+
+
+class MJPEGWriter(VideoWriter):
+    """
+    Appends the frames as JPEG images to one file (Motion JPEG, e.g. `ffplay -f mjpeg`)
+    The file stays playable after every frame and can be continued after a restart
+    """
+
+    extension: str = "mjpeg"
+    file: BinaryIO | None
+    quality: int
+
+    def __init__(self, path: Path, quality: int = 90):
+        super().__init__(path)
+        self.quality = quality
+        self.file = None
+
+    def encode(self, frame: np.ndarray) -> bytes:
+        buf = BytesIO()
+        Image.fromarray(frame).save(buf, format="jpeg", quality=self.quality)
+        return buf.getvalue()
+
+    def append(self, data: bytes) -> None:
+        if self.file is None:
+            self.file = open(self.path, "ab")
+        self.file.write(data)
+        self.file.flush()
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class FFmpegWriter(VideoWriter):
+    """
+    Pipes the raw frames to ffmpeg, which encodes them to H.264 (mp4) in its own process
+    """
+
+    extension: str = "mp4"
+    process: subprocess.Popen | None
+    fps: int | float
+    size: tuple[int, int] | None
+
+    def __init__(
+        self,
+        path: Path,
+        fps: int | float = 30,
+        size: tuple[int, int] | None = None,
+    ):
+        super().__init__(path)
+        self.fps = fps
+        self.size = size
+        self.process = None
+
+    @staticmethod
+    def available() -> bool:
+        """
+        Returns if ffmpeg is installed
+        """
+        return shutil.which("ffmpeg") is not None
+
+    def encode(self, frame: np.ndarray) -> bytes:
+        height, width = frame.shape[:2]
+        if self.size is None:
+            self.size = (width, height)
+        elif (width, height) != self.size:
+            raise ValueError(f"Frame size {width}x{height} doesn't match {self.size}")
+        return np.ascontiguousarray(frame).tobytes()
+
+    def append(self, data: bytes) -> None:
+        if self.process is None:
+            width, height = self.size
+            self.process = subprocess.Popen(
+                [
+                    "ffmpeg",
+                    "-loglevel",
+                    "error",
+                    "-y",
+                    "-f",
+                    "rawvideo",
+                    "-pix_fmt",
+                    "rgb24",
+                    "-s",
+                    f"{width}x{height}",
+                    "-r",
+                    str(self.fps),
+                    "-i",
+                    "-",
+                    "-c:v",
+                    "libx264",
+                    "-pix_fmt",
+                    "yuv420p",
+                    "-vf",
+                    "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                    "-movflags",
+                    "+faststart",
+                    str(self.path),
+                ],
+                stdin=subprocess.PIPE,
+            )
+        self.process.stdin.write(data)
+
+    def close(self) -> None:
+        if self.process:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process = None
+
+
+def open_writer(
+    path: Path,
+    format: str,
+    fps: int | float = 30,
+    quality: int = 90,
+    size: tuple[int, int] | None = None,
+) -> VideoWriter:
+    """
+    Creates a video writer for the given format, mp4 falls back to mjpeg without ffmpeg
+    Args:
+        path (Path): The path of the video without extension
+        format (str): "mp4" or "mjpeg"
+        fps (int | float): The framerate of the video (mp4)
+        quality (int): The JPEG quality (mjpeg)
+        size (tuple[int, int] | None): The frame size (width, height), taken from the first frame if None
+
+    Returns:
+        The writer
+    """
+    if format == "mp4":
+        if FFmpegWriter.available():
+            return FFmpegWriter(path.with_suffix(".mp4"), fps, size)
+        logger.warning("ffmpeg is not installed, writing the video as mjpeg")
+    return MJPEGWriter(path.with_suffix(".mjpeg"), quality)
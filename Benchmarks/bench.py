@@ -0,0 +1,280 @@
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse
+import json
+import platform
+import resource
+import socket
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from Clients.manager import manager
+from Config.config import Config
+from Misc.utils import logger
+
+
+class Result:
+    """
+    The result of a benchmark
+    Attributes:
+        name (str): The name of the benchmark
+        params (dict): The parameters of the workload
+        count (int): The number of processed units (pixels or requests)
+        unit (str): The unit of count
+        seconds (float): The duration of the measured part
+        latencies (np.ndarray): The latencies of the single operations in seconds
+        extra (dict): Additional measurements of the workload
+        rss (float): The resident memory after the benchmark in MB
+        peak_rss (float): The peak resident memory of the process in MB
+    """
+
+    name: str
+    params: dict
+    count: int
+    unit: str
+    seconds: float
+    latencies: np.ndarray
+    extra: dict
+    rss: float
+    peak_rss: float
+
+    def __init__(self, name: str, params: dict, unit: str = "pixels"):
+        self.name = name
+        self.params = params
+        self.unit = unit
+        self.count = 0
+        self.seconds = 0.0
+        self.latencies = np.empty(0)
+        self.extra = {}
+        self.rss = 0.0
+        self.peak_rss = 0.0
+
+    @property
+    def rate(self) -> float:
+        """The processed units per second"""
+        return self.count / self.seconds if self.seconds else 0.0
+
+    def percentile(self, q: float) -> float | None:
+        """
+        Returns a percentile of the latencies in milliseconds
+        """
+        if len(self.latencies) == 0:
+            return None
+        return round(float(np.percentile(self.latencies, q)) * 1000, 3)
+
+    def to_dict(self) -> dict:
+        return {
+            "params": self.params,
+            "count": self.count,
+            "unit": self.unit,
+            "seconds": round(self.seconds, 4),
+            f"{self.unit}_per_sec": round(self.rate, 1),
+            "latency_ms": {
+                "p50": self.percentile(50),
+                "p99": self.percentile(99),
+                "max": self.percentile(100),
+            },
+            "memory_mb": {
+                "rss": round(self.rss, 1),
+                "peak_rss": round(self.peak_rss, 1),
+            },
+            **self.extra,
+        }
+
+    def __str__(self):
+        return (
+            f"{self.name:<18} {self.rate:>14,.0f} {self.unit}/s"
+            f"  p50 {self.percentile(50)} ms  p99 {self.percentile(99)} ms"
+            f"  rss {self.rss:.0f} MB"
+        )
+
+
+def rss_mb() -> float:
+    """
+    Returns the current resident memory of the process in MB
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident memory of the process in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if platform.system() == "Darwin" else peak / 2**10
+
+
+def free_port() -> int:
+    """
+    Returns a free TCP port on localhost
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit() -> str | None:
+    """
+    Returns the current commit of the repository (None if unknown)
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_config(configfile: str, directory: Path) -> Config:
+    """
+    Loads the config and isolates it for benchmarking: no rate limits, no
+    persistence, local ports and a temporary backup directory
+    """
+    config = Config(configfile)
+    config.game.pps = 10**9
+    config.game.godmode.pps = 10**9
+    config.persistence.enabled = False
+    config.connection.host = "127.0.0.1"
+    config.connection.ports.socket = free_port()
+    config.backup.directory = str(directory / "backup")
+    config.timelapse.directory = str(directory / "timelapse")
+    config.frontend.web.force_reload = False
+    manager.set_config(config)
+    return config
+
+
+def run(
+    benchmarks: dict[str, Callable[[Config, float], Result]],
+    configfile: str,
+    scale: float,
+) -> dict[str, Result]:
+    """
+    Runs benchmarks one after another, each with a fresh config
+    Args:
+        benchmarks (dict): The benchmarks by name
+        configfile (str): The config file the benchmark configs are based on
+        scale (float): Scales the size of all workloads
+
+    Returns:
+        The results by name
+    """
+    results = {}
+    for name, benchmark in benchmarks.items():
+        with tempfile.TemporaryDirectory(prefix="pixelframe-bench-") as directory:
+            config = bench_config(configfile, Path(directory))
+            result = benchmark(config, scale)
+        result.rss = rss_mb()
+        result.peak_rss = peak_rss_mb()
+        results[name] = result
+        print(result, flush=True)
+    return results
+
+
+def save(results: dict[str, Result], output: Path, scale: float) -> None:
+    """
+    Writes the results as JSON
+    """
+    data = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "scale": scale,
+        "results": {name: result.to_dict() for name, result in results.items()},
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(data, f, indent=2)
+    logger.warning(f"Saved results to {output}")
+
+
+def compare(results: dict[str, Result], baseline: Path) -> None:
+    """
+    Prints the change of the throughput and the p99 latency against saved results
+    """
+    with open(baseline) as f:
+        data = json.load(f)
+    print(f"\nCompared to {baseline} (commit {data.get('commit')}):")
+    for name, result in results.items():
+        old = data["results"].get(name)
+        if not old:
+            continue
+        old_rate = old[f"{result.unit}_per_sec"]
+        old_p99 = old["latency_ms"]["p99"]
+        rate = f"{(result.rate / old_rate - 1) * 100:+.1f}%" if old_rate else "-"
+        p99 = result.percentile(99)
+        latency = f"{(p99 / old_p99 - 1) * 100:+.1f}%" if old_p99 and p99 else "-"
+        print(f"{name:<18} throughput {rate:>8}  p99 latency {latency:>8}")
+
+
+def main():
+    """
+    Runs the benchmark suite
+    """
+    from Benchmarks.workloads import WORKLOADS
+
+    parser = argparse.ArgumentParser(
+        usage="python3 -m Benchmarks.bench [-c configfile] [-o output] [--compare results] [benchmarks ...]"
+    )
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help=f"the benchmarks to run (default: all of {', '.join(WORKLOADS)})",
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        dest="configfile",
+        default="Config/config.json",
+        type=str,
+        help="specify a config file",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        type=str,
+        help="the JSON file for the results (default: Benchmarks/results/<commit>.json)",
+    )
+    parser.add_argument(
+        "--compare", default=None, type=str, help="results of an earlier run"
+    )
+    parser.add_argument(
+        "--scale",
+        default=1.0,
+        type=float,
+        help="scales the size of the workloads (default: 1)",
+    )
+    args = parser.parse_args()
+
+    unknown = [name for name in args.benchmarks if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(unknown)}")
+    benchmarks = {
+        name: WORKLOADS[name] for name in (args.benchmarks or list(WORKLOADS))
+    }
+
+    results = run(benchmarks, args.configfile, args.scale)
+    output = args.output or f"Benchmarks/results/{git_commit() or 'results'}.json"
+    save(results, Path(output), args.scale)
+    if args.compare:
+        compare(results, Path(args.compare))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+The workloads of the benchmark suite
+Every workload drives the real modules with synthetic data and returns a Result:
+    ingest:     add_pixel + canvas ticks, random pixels (latency: tick duration)
+    contended:  like ingest, repainting a small region with 50% alpha writes
+    netcat:     clients pipelining PX over the socketserver (latency: until "PX Success")
+    since:      a poll storm on /canvas/since of the API (latency: per request)
+    webp:       the canvas image (GET /canvas/) of the API (latency: per request)
+    publish:    the snapshot publishing of the changed tiles (latency: per publish)
+    backup:     full backups, deltas and the restore (latency: per backup)
+"""
+
+import asyncio
+import time
+from typing import Callable
+
+import gevent
+import numpy as np
+from gevent import socket
+from gevent.lock import Semaphore
+
+from Benchmarks.bench import Result
+from Canvas.canvas import Canvas
+from Config.config import Config
+
+
+def random_pixels(
+    count: int, width: int, height: int, seed: int = 0, alpha: float = 0.0
+) -> np.ndarray:
+    """
+    Creates a batch of random pixels (n, 6)
+    Args:
+        count (int): The number of pixels
+        width (int): The width of the area
+        height (int): The height of the area
+        seed (int): The seed of the generator
+        alpha (float): The share of semi transparent pixels
+    """
+    rng = np.random.default_rng(seed)
+    pixels = np.empty((count, 6), dtype=np.int64)
+    pixels[:, 0] = rng.integers(0, width, count)
+    pixels[:, 1] = rng.integers(0, height, count)
+    pixels[:, 2:5] = rng.integers(0, 256, (count, 3))
+    pixels[:, 5] = np.where(rng.random(count) < alpha, rng.integers(1, 255, count), 255)
+    return pixels
+
+
+async def asgi_get(app, path: str, query: str = "") -> tuple[int, bytes]:
+    """
+    Sends a GET request directly to an ASGI app (no network)
+    Returns:
+        The status code and the body
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"benchmark")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 8000),
+    }
+    response = {"status": 0, "body": [], "requested": False}
+    done = asyncio.Event()
+
+    async def receive():
+        if not response["requested"]:
+            response["requested"] = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    return response["status"], b"".join(response["body"])
+
+
+def api_requests(
+    canvas: Canvas, config: Config, path: str, query: str, count: int, concurrency: int
+) -> tuple[np.ndarray, float, int]:
+    """
+    Sends requests to the API with the given concurrency
+    Returns:
+        The latencies, the duration and the size of the last response
+    """
+    from Frontend.API.pixelapi import PixelAPI
+
+    app = PixelAPI(canvas, config).base_api
+    latencies = []
+    size = 0
+
+    async def worker(requests: int):
+        nonlocal size
+        for _ in range(requests):
+            start = time.perf_counter()
+            status, body = await asgi_get(app, path, query)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                raise RuntimeError(f"GET {path}?{query} returned {status}")
+            size = len(body)
+
+    async def storm():
+        share, rest = divmod(count, concurrency)
+        await asyncio.gather(*(worker(share + (i < rest)) for i in range(concurrency)))
+
+    start = time.perf_counter()
+    asyncio.run(storm())
+    return np.array(latencies), time.perf_counter() - start, size
+
+
+def ingest(config: Config, scale: float, contended: bool = False) -> Result:
+    count = int(1_000_000 * scale)
+    canvas = Canvas(config)
+    width, height = canvas.get_size()
+    if contended:
+        rows = random_pixels(count, 64, 64, alpha=0.5).tolist()
+    else:
+        rows = random_pixels(count, width, height).tolist()
+    result = Result("contended" if contended else "ingest", {"pixels": count})
+
+    start = time.perf_counter()
+    for row in rows:
+        canvas.add_pixel(*row)
+    queued = time.perf_counter()
+    latencies = []
+    while len(canvas.tasks):
+        tick = time.perf_counter()
+        canvas.update()
+        latencies.append(time.perf_counter() - tick)
+    end = time.perf_counter()
+
+    result.count = count
+    result.seconds = end - start
+    result.latencies = np.array(latencies)
+    result.extra = {
+        "queue_seconds": round(queued - start, 4),
+        "apply_seconds": round(end - queued, 4),
+        "ticks": len(latencies),
+    }
+    return result
+
+
+def contended(config: Config, scale: float) -> Result:
+    return ingest(config, scale, contended=True)
+
+
+def netcat(config: Config, scale: float, clients: int = 16, window: int = 1000):
+    from Frontend.sockets import Socketserver
+
+    lines = int(20_000 * scale)
+    canvas = Canvas(config)
+    server = Socketserver(canvas, config)
+    loops = [gevent.spawn(canvas.loop), gevent.spawn(server.loop)]
+    width, height = canvas.get_size()
+    address = (config.connection.host, config.connection.ports.socket)
+    result = Result("netcat", {"clients": clients, "lines": lines, "window": window})
+    latencies = []
+    batch = 100
+
+    def client(number: int):
+        ip = f"127.0.0.{number + 2}"  # the server allows one connection per IP
+        sock = socket.create_connection(address, source_address=(ip, 0))
+        while ip not in server.clients or not server.clients[ip].connected:
+            gevent.sleep(0.001)
+        server.clients[ip].godmode(True)
+        pixels = random_pixels(lines, width, height, seed=number)
+        commands = [
+            f"PX {x} {y} {r:02x}{g:02x}{b:02x}\n" for x, y, r, g, b, _ in pixels
+        ]
+        sent = []
+        free = Semaphore(window // batch)
+
+        def reader():
+            file = sock.makefile("r")
+            acked = 0
+            while acked < lines:
+                line = file.readline()
+                if not line:
+                    raise ConnectionError("Disconnected")
+                if "PX Success" in line:
+                    latencies.append(time.perf_counter() - sent[acked])
+                    acked += 1
+                    if acked % batch == 0:
+                        free.release()
+
+        receiving = gevent.spawn(reader)
+        for i in range(0, lines, batch):
+            free.acquire()
+            chunk = commands[i : i + batch]
+            sent.extend([time.perf_counter()] * len(chunk))
+            sock.sendall("".join(chunk).encode())
+        receiving.get()
+        sock.close()
+
+    start = time.perf_counter()
+    with gevent.Timeout(600):
+        tasks = [gevent.spawn(client, i) for i in range(clients)]
+        gevent.joinall(tasks, raise_error=True)
+        while len(canvas.tasks):
+            gevent.sleep(0.001)
+    end = time.perf_counter()
+
+    server.stop()
+    canvas.stop()
+    gevent.killall(loops)
+    server.socket.close()
+    result.count = clients * lines
+    result.seconds = end - start
+    result.latencies = np.array(latencies)
+    return result
+
+
+def since(config: Config, scale: float, changed: int = 5000, concurrency: int = 50):
+    count = int(500 * scale)
+    canvas = Canvas(config)
+    since = canvas.get_generation()
+    canvas.put_pixels(random_pixels(changed, *canvas.get_size()))
+    canvas.publish()
+    latencies, seconds, size = api_requests(
+        canvas,
+        config,
+        "/canvas/since",
+        f"generation={since}&raw=true",
+        count,
+        concurrency,
+    )
+    result = Result(
+        "since",
+        {"requests": count, "changed": changed, "concurrency": concurrency},
+        "requests",
+    )
+    result.count = count
+    result.seconds = seconds
+    result.latencies = latencies
+    result.extra = {"response_bytes": size}
+    return result
+
+
+def webp(config: Config, scale: float):
+    count = max(1, int(20 * scale))
+    canvas = Canvas(config)
+    width, height = canvas.get_size()
+    canvas.put_pixels(random_pixels(width * height // 4, width, height))
+    canvas.publish()
+    latencies, seconds, size = api_requests(canvas, config, "/canvas/", "", count, 1)
+
+    result = Result("webp", {"requests": count}, "requests")
+    result.count = count
+    result.seconds = seconds
+    result.latencies = latencies
+    result.extra = {"response_bytes": size}
+    return result
+
+
+def publish(config: Config, scale: float, pixels: int = 1000):
+    count = int(1000 * scale)
+    canvas = Canvas(config)
+    width, height = canvas.get_size()
+    batches = [
+        random_pixels(pixels, width, height, seed=i) for i in range(min(count, 100))
+    ]
+    latencies = []
+    for i in range(count):
+        canvas.put_pixels(batches[i % len(batches)])
+        start = time.perf_counter()
+        canvas.publish()
+        latencies.append(time.perf_counter() - start)
+
+    result = Result("publish", {"publishes": count, "pixels": pixels}, "publishes")
+    result.count = count
+    result.seconds = float(np.sum(latencies))
+    result.latencies = np.array(latencies)
+    return result
+
+
+def backup(config: Config, scale: float, pixels: int = 10000):
+    from Backup.backup import BackupHandler
+
+    deltas = max(2, int(3 * scale))
+    config.backup.keyframe = deltas + 1
+    canvas = Canvas(config)
+    width, height = canvas.get_size()
+    handler = BackupHandler(config, canvas)
+    latencies = []
+    keyframe = delta = 0.0
+    for i in range(deltas + 1):
+        canvas.put_pixels(random_pixels(pixels, width, height, seed=i))
+        start = time.perf_counter()
+        handler.create_backup()
+        latencies.append(time.perf_counter() - start)
+        if i == 0:
+            keyframe = latencies[-1]
+        gevent.sleep(1)  # the backups are named by the second
+    delta = float(np.median(latencies[1:]))
+
+    start = time.perf_counter()
+    restored = Canvas(config)
+    BackupHandler(config, restored)
+    restore = time.perf_counter() - start
+    if not (restored.get_raw_data()[:, :, :3] == canvas.get_raw_data()[:, :, :3]).all():
+        raise RuntimeError("The restored canvas doesn't match")
+
+    result = Result("backup", {"deltas": deltas, "pixels": pixels}, "backups")
+    result.count = len(latencies)
+    result.seconds = float(np.sum(latencies))
+    result.latencies = np.array(latencies)
+    result.extra = {
+        "keyframe_ms": round(keyframe * 1000, 3),
+        "delta_ms": round(delta * 1000, 3),
+        "restore_ms": round(restore * 1000, 3),
+    }
+    return result
+
+
+WORKLOADS: dict[str, Callable[[Config, float], Result]] = {
+    "ingest": ingest,
+    "contended": contended,
+    "netcat": netcat,
+    "since": since,
+    "webp": webp,
+    "publish": publish,
+    "backup": backup,
+}
@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import numpy as np
+
+from Canvas.plane import Plane, create_plane
+
+
+class Attribution:
+    """
+    The owner of every pixel of the canvas: the id of the client that wrote it last
+    The ids are assigned by the client manager (Manager.ids), 0 stands for writes
+    without a client (admin, restores) and untouched pixels. The owners of a batch
+    are recorded at once, so the plane costs one vectorized assignment per batch.
+    Attributes:
+        owners (Plane): The owner of every pixel (tiled for a sparse canvas)
+    """
+
+    owners: Plane
+    dtype = np.uint16
+
+    def __init__(self, width: int, height: int, sparse: bool = False):
+        self.owners = create_plane(width, height, self.dtype, sparse)
+
+    def assign(
+        self,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        owners: np.ndarray,
+        unique: bool = False,
+    ) -> None:
+        """
+        Records the owners of a batch of writes, the last write to a pixel wins
+        Args:
+            xs (np.ndarray): Coordinates x, shape (n,)
+            ys (np.ndarray): Coordinates y, shape (n,)
+            owners (np.ndarray): The client id of every write, shape (n,)
+            unique (bool): If every pixel is written at most once
+        """
+        if not unique:
+            # np.unique finds the first occurrence, in the reversed batch the last write
+            keys = ys * self.owners.shape[1] + xs
+            _, first = np.unique(keys[::-1], return_index=True)
+            last = len(keys) - 1 - first
+            xs, ys, owners = xs[last], ys[last], owners[last]
+        self.owners.set(xs, ys, owners)
+
+    def clear(
+        self, x: int = 0, y: int = 0, w: int | None = None, h: int | None = None
+    ) -> None:
+        """
+        Forgets the owners of a region (the whole canvas by default)
+        """
+        self.owners.fill(0, x, y, w, h)
+
+    def owned(self, owner: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the coordinates (xs, ys) of all pixels owned by a client
+        """
+        return self.owners.find(owner)
+
+    def resize(self, width: int, height: int) -> None:
+        """
+        Resizes the plane, the owners of the overlapping region are kept
+        """
+        self.owners.resize(width, height)
+
+    def save(self, path: Path, ips: list[str]) -> None:
+        """
+        Writes the plane and the ips of the client ids to a file (e.g. for the next process)
+        """
+        with open(path, "wb") as f:
+            np.savez(f, ips=np.array(ips, dtype=str), **self.owners.dump())
+
+    def load(self, path: Path) -> list[str] | None:
+        """
+        Restores the plane from a file written by save
+        Returns:
+            The ips of the client ids, None if the file is missing or of another size
+        """
+        try:
+            with np.load(path) as saved:
+                if not self.owners.load(saved):
+                    return None
+                return saved["ips"].tolist()
+        except (OSError, KeyError, ValueError):
+            return None
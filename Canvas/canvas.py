@@ -1,16 +1,28 @@
+import math
 import time
 from collections import deque
 from typing import Any
 
 import numpy as np
+from gevent import get_hub
 from gevent.time import sleep as gsleep
 from PIL import Image
 
-from Canvas.heart import Heart
+from Backup.journal import PixelJournal
+from Canvas.attribution import Attribution
+from Canvas.heart import Heart, coalesce
+from Canvas.palette import Palette, PaletteHeart, convert
+from Canvas.protection import Protection
+from Canvas.snapshot import Snapshot
+from Canvas.tiled import TiledArray, TiledHeart
+from Clients.clients import Client
+from Clients.manager import manager
 from Config.config import Config
 from Misc.eventhandler import event_handler
+from Misc.handover import Handover, handover
 from Misc.Template.pixelmodule import PixelModule
 from Misc.utils import hex_to_rgb, logger
+from Stats.metrics import metrics
 from Stats.stats import Stats
 from Stats.stats import stats as statsobj
 
@@ -37,28 +49,130 @@ class Pixel(object):
         """Returns the Pixel formatted for Pillow"""
         return (self.x, self.y), (self.r, self.g, self.b, self.a)
 
+    def row(self) -> tuple[int, int, int, int, int, int]:
+        """Returns the Pixel as a row of a pixel batch"""
+        return self.x, self.y, self.r, self.g, self.b, self.a
+
 
 class Queue:
-    """The queue for pixels to set at the canvas"""
+    """
+    The queue for pixels to set at the canvas
+    Every client has its own queue, they are drained by deficit round robin: in
+    every round each client applies up to its quantum (its pixels per tick), so
+    a bulk writer delays the pixels of other clients by at most one round, no
+    matter how many pixels it has queued. The order of a client's pixels is kept.
+    The pixels are stored as rows (x, y, r, g, b, a, owner), so they can be drained as one batch
+    Attributes:
+        queues (dict[str | None, deque]): The queued rows of every client (None: no client)
+        quanta (dict[str | None, int]): The pixels every client may apply per round
+        deficits (dict[str | None, int]): The pixels every client may still apply in the current round
+        active (deque): The clients with queued pixels in round robin order
+        size (int): The number of queued pixels
+    """
 
-    queue: deque
+    queues: dict[str | None, deque]
+    quanta: dict[str | None, int]
+    deficits: dict[str | None, int]
+    active: deque
+    size: int
 
     def __init__(self) -> None:
         """
-        Initializes the queue with a deque
+        Initializes the queue without clients
         """
-        self.queue = deque()
+        self.queues = {}
+        self.quanta = {}
+        self.deficits = {}
+        self.active = deque()
+        self.size = 0
 
-    def add(self, pixel: Pixel) -> None:
+    def add(
+        self,
+        pixel: Pixel,
+        client: str | None = None,
+        quantum: int = 1,
+        owner: int = 0,
+    ) -> None:
         """
         Adds a pixel to the queue
         Args:
             pixel (Pixel): A Pixel object
+            client (str | None): The client that set the pixel
+            quantum (int): The pixels the client may apply per round
+            owner (int): The id of the client (see Attribution)
 
         Returns:
             None
         """
-        self.queue.append(pixel)
+        queue = self.queues.get(client)
+        if queue is None:
+            queue = self.queues[client] = deque()
+            self.deficits[client] = 0
+            self.active.append(client)
+        queue.append((*pixel.row(), owner))
+        self.quanta[client] = quantum
+        self.size += 1
+
+    def remove(self, client: str | None) -> None:
+        """
+        Removes an empty client queue
+        """
+        del self.queues[client]
+        del self.quanta[client]
+        del self.deficits[client]
+
+    def drain(self, limit: int | None = None) -> np.ndarray:
+        """
+        Removes pixels from the queue in round robin order
+        Args:
+            limit (int | None): The number of pixels to remove at most, all if None
+
+        Returns:
+            An array of shape (n, 7) with the columns x, y, r, g, b, a, owner
+        """
+        if limit is None or limit >= self.size:
+            rows = [row for client in self.active for row in self.queues[client]]
+            self.queues.clear()
+            self.quanta.clear()
+            self.deficits.clear()
+            self.active.clear()
+        else:
+            rows = []
+            while len(rows) < limit:
+                client = self.active[0]
+                queue = self.queues[client]
+                count = min(len(queue), limit - len(rows))
+                if len(self.active) > 1:  # otherwise nobody to share with
+                    if self.deficits[client] <= 0:
+                        self.deficits[client] += self.quanta[client]
+                    count = min(count, self.deficits[client])
+                    self.deficits[client] -= count
+                popleft = queue.popleft
+                rows.extend([popleft() for _ in range(count)])
+                if not queue:
+                    self.active.popleft()
+                    self.remove(client)
+                elif self.deficits[client] <= 0:
+                    self.active.rotate(-1)
+        self.size -= len(rows)
+        return np.array(rows, dtype=np.int64).reshape(-1, 7)
+
+    def discard(self, client: str | None) -> int:
+        """
+        Drops the queued pixels of a client
+        Returns:
+            The number of dropped pixels
+        """
+        queue = self.queues.get(client)
+        if queue is None:
+            return 0
+        self.active.remove(client)
+        self.remove(client)
+        self.size -= len(queue)
+        return len(queue)
+
+    def __len__(self) -> int:
+        return self.size
 
     def __iter__(self):
         """
@@ -76,8 +190,8 @@ class Queue:
         Raises:
             StopIteration: If the queue is empty/completed
         """
-        if len(self.queue) > 0:
-            return self.queue.popleft()
+        if self.size > 0:
+            return Pixel(*self.drain(1)[0, :6].tolist())
         else:
             raise StopIteration
 
@@ -88,26 +202,138 @@ class Canvas(PixelModule):
     Attributes:
         config (Config): The configuration object
         _heart (Heart): The heart of the canvas
-        fps (int): The framerate for visual updates
+        palette (Palette | None): The colors of the canvas (if visuals.palette is enabled)
+        attribution (Attribution | None): The owner of every pixel (if moderation.attribution is enabled)
+        protection (Protection): The regions clients can't write to (moderation.protected)
         tasks (Queue): The queue of Pixels
+        journal (PixelJournal | None): The write-ahead log of the applied pixels
+        chunk (int): The pixels applied between two checks of the tick's time budget
+        published (float): The time of the latest published snapshot
+        reset (int): The generation of the latest resize or restore, clients polling from before reload the canvas
     """
 
     config: Config
     _heart: Heart
-    fps: int = 30
+    palette: Palette | None
+    attribution: Attribution | None
+    protection: Protection
     tasks: Queue
     stats: Stats
+    journal: PixelJournal | None
+    chunk: int = 2048
+    published: float
+    reset: int
 
     def __init__(self, config: Config):
         """
         Initializes the canvas
         """
         self.config = config
-        self._heart = Heart(self.config)
+        self.palette = None
+        if self.config.visuals.palette.enabled:
+            self.palette = Palette(self.config.visuals.palette.colors)
+        if self.config.visuals.sparse.enabled:
+            # the tiles hold RGB, the colors are mapped to the palette when they are blended
+            self._heart = TiledHeart(self.config, self.palette)
+        elif self.palette:
+            self._heart = PaletteHeart(self.config, self.palette)
+        else:
+            self._heart = Heart(self.config)
         self.tasks = Queue()
+        self.journal = None
+        self.published = 0.0
+        self.reset = 0
+        sparse = self.config.visuals.sparse.enabled
         self.stats = statsobj
+        self.stats.resize(*self.get_size(), sparse)
+        self.attribution = None
+        if self.config.moderation.attribution:
+            self.attribution = Attribution(*self.get_size(), sparse)
+        self.protection = Protection(*self.get_size(), sparse)
+        self.protection.compile(self.config.moderation.protected)
+        if handover and not self._heart.storage:
+            if self._heart.restore_from_storage(handover.canvas):
+                self._heart.publish()
+        if handover and self.attribution:
+            ips = self.attribution.load(handover.owners)
+            if ips is not None:
+                manager.restore_ids(ips)
+        self.config.subscribe(self.reconfigure)
         super().__init__("CANVAS")
 
+    def reconfigure(self, config: Config, changed: set[str]) -> None:
+        """
+        Resizes the canvas to a reloaded size and applies reloaded protected regions
+        """
+        if "moderation" in changed:
+            try:
+                self.protection.compile(config.moderation.protected)
+            except ValueError as e:
+                logger.warning(f"Ignoring the reloaded protected regions: {e}")
+                config.moderation.protected = [
+                    list(region) for region in self.protection.regions
+                ]
+        height, width = self._heart.data.shape[:2]
+        size = config.visuals.size
+        if (size.width, size.height) != (width, height):
+            try:
+                self.resize(size.width, size.height)
+            except ValueError as e:
+                logger.warning(f"Ignoring the reloaded canvas size: {e}")
+                size.width, size.height = width, height
+
+    def resize(self, width: int, height: int) -> None:
+        """
+        Resizes the canvas while it runs, the pixels of the overlapping region are kept
+        The heart (with its tiles and snapshots) and the stats are migrated at once, queued
+        pixels outside of the new size are dropped when they are applied. The size is saved
+        to the config file, so it survives restarts. Web clients reload the canvas on their next poll.
+        Args:
+            width (int): The new width
+            height (int): The new height
+        """
+        if not (0 < width <= 0xFFFF and 0 < height <= 0xFFFF):
+            raise ValueError(f"The size {width}x{height} is out of range (1-65535)")
+        old = self._heart.data.shape[1::-1]
+        self._heart.resize(width, height)
+        self.stats.resize(width, height, self.config.visuals.sparse.enabled)
+        if self.attribution:
+            self.attribution.resize(width, height)
+        self.protection.resize(width, height)
+        size = self.config.visuals.size
+        size.width, size.height = width, height
+        self.reset = self._heart.generation
+        logger.info(f"Resized the canvas from {old[0]}x{old[1]} to {width}x{height}")
+
+        visuals = self.config.raw["visuals"]
+        if visuals.get("size") != {"width": width, "height": height}:
+            visuals["size"] = {"width": width, "height": height}
+            try:
+                self.config.save()
+            except OSError as e:
+                logger.error(f"Failed to save the canvas size to the config: {e}")
+
+    def protect(self, regions: list) -> None:
+        """
+        Replaces the protected regions while the canvas runs, they are saved to the config file
+        Args:
+            regions (list): The rects [x, y, w, h] clients can't write to
+        Raises:
+            ValueError: If a region isn't a rect with a positive size
+        """
+        self.protection.compile(regions)
+        protected = [list(region) for region in self.protection.regions]
+        self.config.moderation.protected = protected
+        logger.info(f"Protected regions: {protected}")
+
+        moderation = self.config.raw.setdefault("moderation", {})
+        if moderation.get("protected") != protected:
+            moderation["protected"] = protected
+            try:
+                self.config.save()
+            except OSError as e:
+                logger.error(f"Failed to save the protected regions to the config: {e}")
+
     def stop(self):
         """
         Acts as a kind of 'killswitch' function
@@ -115,6 +341,7 @@ class Canvas(PixelModule):
             None
         """
         super().stop()
+        self.stop_heart()
 
     def set_stats(self, stats: Stats):
         """
@@ -123,6 +350,15 @@ class Canvas(PixelModule):
             stats (Stats): The stats class
         """
         self.stats = stats
+        self.stats.resize(*self.get_size(), self.config.visuals.sparse.enabled)
+
+    def set_journal(self, journal: PixelJournal):
+        """
+        Sets the journal all applied pixels are logged to
+        Args:
+            journal (PixelJournal): The journal
+        """
+        self.journal = journal
 
     def pixel_in_bounds(self, x: int, y: int) -> bool:
         """
@@ -133,6 +369,26 @@ class Canvas(PixelModule):
             and 0 <= y <= self.config.visuals.size.height
         )
 
+    def color_allowed(self, r: int, g: int, b: int) -> bool:
+        """
+        Checks if a color can be set (always, unless the palette rejects other colors)
+        """
+        return (
+            self.palette is None
+            or self.config.visuals.palette.quantize
+            or (r, g, b) in self.palette
+        )
+
+    def colors_allowed(self, colors: np.ndarray) -> bool:
+        """
+        Checks if all colors of a batch (n, 3) can be set (see color_allowed)
+        """
+        return (
+            self.palette is None
+            or self.config.visuals.palette.quantize
+            or bool(self.palette.contains(colors).all())
+        )
+
     def get_pixel(self, x: int, y: int) -> Any:
         """
         Gets a single pixel from the canvas
@@ -148,7 +404,16 @@ class Canvas(PixelModule):
         else:
             return None
 
-    def add_pixel(self, x: int, y: int, r: int, g: int, b: int, a: int = 255) -> None:
+    def add_pixel(
+        self,
+        x: int,
+        y: int,
+        r: int,
+        g: int,
+        b: int,
+        a: int = 255,
+        client: Client | None = None,
+    ) -> None:
         """
         Adds a single pixel to the queue
         Args:
@@ -158,11 +423,19 @@ class Canvas(PixelModule):
             g (int): Value Green
             b (int): Value Blue
             a (int): Value Alpha
+            client (Client | None): The client that set the pixel, used for the fair scheduling
 
         Returns:
             None
         """
-        self.tasks.add(Pixel(x, y, r, g, b, a))
+        pps = client.get_pps() if client else self.config.game.pps
+        quantum = max(1, math.ceil(pps / self.config.tick.rate))
+        self.tasks.add(
+            Pixel(x, y, r, g, b, a),
+            client and client.ip,
+            quantum,
+            client.id if client else 0,
+        )
 
     def no_queue_pixel(
         self, x: int, y: int, r: int, g: int, b: int, a: int = 255
@@ -191,25 +464,70 @@ class Canvas(PixelModule):
         Returns:
             None
         """
-        coords, color = pixel.get()
-        x, y = coords
-        r, g, b, a = color
-        if not (
-            0 <= x < self.config.visuals.size.width
-            and 0 <= y < self.config.visuals.size.height
-        ):
-            return
-        elif pixel.a == 0:
+        self.put_pixels(np.array([pixel.row()], dtype=np.int64))
+
+    def put_pixels(self, pixels: np.ndarray, owners: np.ndarray | None = None) -> None:
+        """
+        Puts a batch of pixels on the canvas, skipping the ones out of bounds or fully transparent
+        Writes of clients (with owners) to protected regions are rejected with one lookup
+        in the mask and counted per client (metrics.rejected), other writes (e.g. admin) pass.
+        Writes overwritten by a later opaque write to the same pixel are dropped
+        before they reach the heart and the journal (they are still counted in the stats).
+        With a palette opaque colors are replaced by the nearest palette colors, so the
+        journal holds the colors that were stored. Semi-transparent writes are blended
+        over the current colors first, the result is mapped to the palette (as in a replay).
+        Args:
+            pixels (np.ndarray): An array of shape (n, 6) with the columns x, y, r, g, b, a
+            owners (np.ndarray | None): The client id of every pixel (see Attribution), 0 if None
+
+        Returns:
+            None
+        """
+        width, height = self.get_size()
+        xs, ys, alpha = pixels[:, 0], pixels[:, 1], pixels[:, 5]
+        valid = (0 <= xs) & (xs < width) & (0 <= ys) & (ys < height) & (alpha > 0)
+        if owners is not None and self.protection:
+            blocked = self.protection.blocked(xs, ys, valid)
+            if blocked.any():
+                self.reject(owners[blocked])
+                valid &= ~blocked
+        if not valid.all():
+            pixels = pixels[valid]
+            if owners is not None:
+                owners = owners[valid]
+        if len(pixels) == 0:
             return
-        elif pixel.a == 255:
-            self._heart.update_pixel(x, y, (r, g, b))
-        else:
-            r2, g2, b2 = self._heart.get_pixel_color(x, y)
-            r = (r2 * (0xFF - a) + (r * a)) / 0xFF
-            g = (g2 * (0xFF - a) + (g * a)) / 0xFF
-            b = (b2 * (0xFF - a) + (b * a)) / 0xFF
-            self._heart.update_pixel(x, y, (r, g, b))
-        self.stats.add_pixel(x, y)
+        if self.palette:
+            pixels = pixels.copy()
+            opaque = pixels[:, 5] == 0xFF
+            pixels[opaque, 2:5] = self.palette.snap(pixels[opaque, 2:5])
+        index, counts = coalesce(pixels[:, 1] * width + pixels[:, 0], pixels[:, 5])
+        if counts is not None:
+            pixels = pixels[index]
+        xs, ys = pixels[:, 0], pixels[:, 1]
+        self._heart.blend_pixels(xs, ys, pixels[:, 2:].astype(np.uint8))
+        if self.attribution:
+            if owners is None:
+                owners = np.zeros(len(xs), dtype=np.int64)
+            elif counts is not None:
+                owners = owners[index]
+            self.attribution.assign(xs, ys, owners, unique=counts is None)
+        self.stats.add_pixels(xs, ys, counts)
+        if self.journal:
+            self.journal.append(pixels)
+
+    def reject(self, owners: np.ndarray) -> None:
+        """
+        Counts rejected writes per client
+        Args:
+            owners (np.ndarray): The client id of every rejected write (see Manager.ids)
+        """
+        ids, counts = np.unique(owners, return_counts=True)
+        clients = {}
+        for client_id, count in zip(ids.tolist(), counts.tolist()):
+            ip = manager.client_ip(client_id) or "anonymous"
+            clients[ip] = clients.get(ip, 0) + count
+        metrics.rejected.record(clients)
 
     def get_pixel_color_count(self, sorted: bool) -> dict[str, int]:
         """
@@ -217,11 +535,11 @@ class Canvas(PixelModule):
         Returns:
             A dict with the pixel count
         """
-        pixels = self._heart.pixel_since(1)
+        _, pixels = self._heart.pixel_since(0)
 
         colors = {}
         for p in pixels:
-            c = p[2]
+            c = p[2] if isinstance(p[2], str) else self.palette.hex[p[2]]
             col = f"{c} / " + ",".join(str(cl) for cl in hex_to_rgb(c))
             colors[col] = colors.get(col, 0) + 1
 
@@ -236,15 +554,55 @@ class Canvas(PixelModule):
         return self.config.visuals.size.get_size()
 
     def stop_heart(self):
-        pass
+        """
+        Applies the remaining queue and closes the persistent storage of the heart
+        """
+        while len(self.tasks):
+            self.update()
+        if self.journal:
+            self.journal.flush()
+        self._heart.close()
+
+    def hand_over(self, handover: Handover) -> None:
+        """
+        Stops the canvas, applies the remaining queue and hands the canvas over to the next
+        process (hot restart). With persistence the storage file is handed over, else a copy in shared memory
+        """
+        self.stop()
+        if not self._heart.storage:
+            self._heart.save_to_storage(handover.canvas)
+        if self.attribution:
+            self.attribution.save(handover.owners, manager.ips)
+
+    def checkpoint(self) -> None:
+        """
+        Syncs the persistent storage of the heart in the threadpool and records the checkpoint
+        """
+        generation = self._heart.generation
+        get_hub().threadpool.apply(self._heart.flush)
+        self._heart.checkpoint(generation)
+
+    def is_restored(self) -> bool:
+        """
+        Gets if the canvas was restored from the persistent storage (or the previous process)
+        """
+        return self._heart.restored
 
     def heart_loop(self) -> None:
         """
-        The loop for updating the heart's timestamp
+        The loop for flushing the journal and the checkpoints of the persistent storage
         """
         logger.info(f"Starting Process: {self.prefix}.heart_loop")
+        last_checkpoint = time.time()
         while self.running:
-            self._heart.update_timestamp()
+            if self.journal:
+                self.journal.flush()
+            if (
+                self.config.persistence.enabled
+                and time.time() - last_checkpoint >= self.config.persistence.interval
+            ):
+                last_checkpoint = time.time()
+                self.checkpoint()
             try:
                 gsleep(1)
             finally:
@@ -255,32 +613,155 @@ class Canvas(PixelModule):
         The loop for controlling the canvas
         """
         logger.info(f"Starting Process: {self.prefix}.loop")
-        updates = 1.0 / self.fps
         while self.running:
             start = time.time()
             event_handler.trigger("CANVAS-update")
 
             end = time.time() - start
-            gsleep(max(updates - end, 0))
+            gsleep(max(1.0 / self.config.tick.rate - end, 0))
 
-    def update(self):
+    def update(self) -> int:
         """
-        Fired by the canvas loop to render queued Pixels
+        Fired by the canvas loop to apply the queued pixels within the tick's budget
+        (tick.max_pixels, tick.max_ms), the rest is carried over to the next tick.
+        A snapshot is published at the end of the tick (at most tick.publish per second).
         Returns:
-            None
-        """
-        for pixel in self.tasks:
-            self.put_pixel(pixel)
+            The number of applied pixels
+        """
+        tick = self.config.tick
+        start = time.perf_counter()
+        applied = 0
+        while len(self.tasks):
+            limit = self.chunk
+            if tick.max_pixels:
+                limit = min(limit, tick.max_pixels - applied)
+                if limit <= 0:
+                    break
+            pixels = self.tasks.drain(limit)
+            self.put_pixels(pixels[:, :6], pixels[:, 6])
+            applied += len(pixels)
+            if tick.max_ms and (time.perf_counter() - start) * 1000 >= tick.max_ms:
+                break
+
+        if not tick.publish or time.time() - self.published >= 1.0 / tick.publish:
+            self.published = time.time()
+            self._heart.publish()
+        metrics.tick.record(
+            time.perf_counter() - start, 1.0 / tick.rate, applied, len(self.tasks)
+        )
+        return applied
 
     def restore_from_image(self, image: Image):
         self._heart.restore_from_image(image)
+        self.reset = self._heart.generation
+        if self.attribution:
+            self.attribution.clear()
+        self._heart.publish()
 
     def restore_from_array(self, array: np.array):
         self._heart.restore_from_array(array)
+        self.reset = self._heart.generation
+        if self.attribution:
+            self.attribution.clear()
+        self._heart.publish()
+
+    def paste(
+        self, array: np.ndarray, x: int, y: int
+    ) -> tuple[int, int, int, int] | None:
+        """
+        Restores a canvas array of any size (e.g. a backup from before a resize) into the region at x, y
+        Args:
+            array (np.ndarray): The canvas array (see Heart), cut off at the border of the canvas
+            x (int): Coordinate x of the upper left corner
+            y (int): Coordinate y of the upper left corner
+        Returns:
+            The changed rect (x, y, w, h), None if the array is outside of the canvas
+        """
+        if array.shape[2] != self._heart.channels:
+            palette = self.palette or Palette(self.config.visuals.palette.colors)
+            array = convert(array, self._heart.channels, palette)
+        rect = self._heart.paste(array, x, y)
+        if rect and self.attribution:
+            self.attribution.clear(*rect)
+        if rect and self.journal:
+            x, y, w, h = rect
+            ys, xs = np.mgrid[y : y + h, x : x + w]
+            pixels = np.empty((w * h, 6), dtype=np.int64)
+            pixels[:, 0] = xs.ravel()
+            pixels[:, 1] = ys.ravel()
+            pixels[:, 2:5] = self._heart.get_colors(x, y, w, h).reshape(-1, 3)
+            pixels[:, 5] = 0xFF
+            self.journal.append(pixels)
+        self._heart.publish()
+        return rect
+
+    def rollback(self, owner: int, past: np.ndarray | TiledArray) -> int:
+        """
+        Reverts the pixels owned by a client to an earlier state of the canvas (e.g. rendered from the journal)
+        The pixels the client wrote last are compared with the earlier state at once, the
+        differing ones are written back as one batch (journaled, without owner). Pixels
+        other clients wrote over the client's ones are kept. The queued pixels of the client are dropped.
+        Args:
+            owner (int): The id of the client (see Attribution)
+            past (np.ndarray | TiledArray): The earlier canvas array (see Heart), cut off or padded to the size of the
+                canvas. Only the owned pixels are read, a TiledArray looks them up in its tiles
+        Returns:
+            The number of reverted pixels
+        Raises:
+            ValueError: If the owners of the pixels aren't recorded
+        """
+        if not self.attribution:
+            raise ValueError("The owners aren't recorded (moderation.attribution)")
+        self.tasks.discard(manager.client_ip(owner))
+        xs, ys = self.attribution.owned(owner)
+        inside = (xs < past.shape[1]) & (ys < past.shape[0])
+        colors = np.zeros((len(xs), 3), dtype=np.uint8)
+        colors[inside] = past[ys[inside], xs[inside], :3]
+        changed = np.any(colors != self._heart.colors_at(xs, ys), axis=1)
+        pixels = np.empty((int(changed.sum()), 6), dtype=np.int64)
+        pixels[:, 0] = xs[changed]
+        pixels[:, 1] = ys[changed]
+        pixels[:, 2:5] = colors[changed]
+        pixels[:, 5] = 0xFF
+        self.put_pixels(pixels)
+        return len(pixels)
 
     def get_raw_data(self) -> np.ndarray:
+        """
+        Gets the live canvas array, readers outside of the canvas should use snapshot
+        """
         return self._heart.get_raw_array()
 
+    def publish(self) -> None:
+        """
+        Publishes the writes applied since the last tick as snapshot
+        """
+        self._heart.publish()
+
+    def snapshot(self) -> Snapshot:
+        """
+        Gets a consistent, read-only frame of the canvas as of the last tick
+        Returns:
+            The snapshot, it has to be released (or used as context manager)
+        """
+        return self._heart.snapshot()
+
+    def get_generation(self) -> int:
+        """
+        Gets the current generation of the canvas (increases with every applied write)
+        """
+        return self._heart.generation
+
+    def get_dirty_rects(self, since: int) -> list[tuple[int, int, int, int]]:
+        """
+        Gets the regions of the canvas changed after a generation
+        Args:
+            since (int): The last generation seen by the caller
+        Returns:
+            A list of rects (x, y, w, h)
+        """
+        return self._heart.dirty_rects(since)
+
     def get_canvas(self) -> Image:
         """
         Gets a copy of the canvas
@@ -289,15 +770,38 @@ class Canvas(PixelModule):
         """
         return self._heart.create_image()
 
-    def get_pixel_since(self, timestamp: int) -> list[tuple[int, int, str]]:
+    def get_frame(self) -> tuple[Image, int]:
+        """
+        Gets a copy of the canvas with its generation (the start for get_pixel_since)
+        """
+        return self._heart.create_frame()
+
+    def get_region(self, x: int, y: int, width: int, height: int) -> Image:
+        """
+        Gets a region of the latest snapshot
+        Args:
+            x (int): Coordinate x of the upper left corner
+            y (int): Coordinate y of the upper left corner
+            width (int): The width of the region
+            height (int): The height of the region
+        Returns:
+            The region as image
+        """
+        with self.snapshot() as snapshot:
+            region = snapshot.colors(x, y, width, height)
+            return Image.fromarray(np.ascontiguousarray(region))
+
+    def get_pixel_since(
+        self, generation: int
+    ) -> tuple[int, list[tuple[int, int, str | int]]]:
         """
-        Returns all pixels changed since timestamp
+        Returns all pixels changed after a generation
         Args:
-            timestamp (int): Timestamp of the last client update
+            generation (int): The generation of the last client update
         Returns:
-            dict with all changed pixels
+            The generation of the returned state (the next request starts there) and the changed pixels
         """
-        return self._heart.pixel_since(timestamp)
+        return self._heart.pixel_since(generation)
 
     def is_alive(self) -> bool:
         """
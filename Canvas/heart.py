@@ -1,27 +1,213 @@
-import time
+from pathlib import Path
+from typing import Callable
 
 import numpy as np
 from PIL import Image
 
+from Canvas.snapshot import Snapshot, SnapshotPool
+from Canvas.storage import CanvasStorage
 from Config.config import Config
 from Misc.errors import IncorrectBackupSize
-from Misc.utils import rgb_to_hex, time_to_np
+from Misc.utils import alpha_blend, rgb_to_hex
+
+
+def write_rounds(keys: np.ndarray) -> list[np.ndarray | slice]:
+    """
+    Splits a batch of writes into rounds with unique keys
+    Args:
+        keys (np.ndarray): The (flat) coordinate of every write
+
+    Returns:
+        A list of indices, the n-th round holds the n-th write of every key
+    """
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    if len(starts) == len(keys):
+        return [slice(None)]
+    counts = np.diff(np.r_[starts, len(keys)])
+    ranks = np.empty(len(keys), dtype=np.int64)
+    ranks[order] = np.arange(len(keys)) - np.repeat(starts, counts)
+    by_rank = np.argsort(ranks, kind="stable")
+    bounds = np.searchsorted(ranks[by_rank], np.arange(1, counts.max()))
+    return np.split(by_rank, bounds)
+
+
+def coalesce(
+    keys: np.ndarray, alpha: np.ndarray
+) -> tuple[np.ndarray | slice, np.ndarray | None]:
+    """
+    Finds the writes of a batch that aren't overwritten by a later opaque write to the same key
+    Only the last opaque write of a key and the (alpha) writes after it change the
+    result, so the other writes can be dropped without changing the canvas.
+    Args:
+        keys (np.ndarray): The (flat) coordinate of every write
+        alpha (np.ndarray): The alpha value of every write
+
+    Returns:
+        The indices of the kept writes (in order) and the number of writes per
+        key, counted at the first kept write of the key (0 for the other ones).
+        (slice(None), None) if the keys are unique
+    """
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    if len(starts) == len(keys):
+        return slice(None), None
+    sizes = np.diff(np.r_[starts, len(keys)])
+    last_opaque = np.maximum.reduceat(np.where(alpha[order] == 0xFF, order, -1), starts)
+    kept = order >= np.repeat(last_opaque, sizes)
+    # the kept writes are the end of their group
+    first_kept = starts + sizes - np.add.reduceat(kept, starts)
+    counts = np.zeros(len(keys), dtype=np.int64)
+    counts[order[first_kept]] = sizes
+    index = np.sort(order[kept])
+    return index, counts[index]
+
+
+def blend(
+    data: np.ndarray,
+    xs: np.ndarray,
+    ys: np.ndarray,
+    colors: np.ndarray,
+    stamp: np.ndarray,
+    snap: Callable[[np.ndarray], np.ndarray] | None = None,
+) -> None:
+    """
+    Blends a batch of RGBA writes onto a canvas array, in the order they are given
+    Args:
+        data (np.ndarray): The canvas array (see Heart)
+        xs (np.ndarray): Coordinates x, shape (n,)
+        ys (np.ndarray): Coordinates y, shape (n,)
+        colors (np.ndarray): Values RGBA, shape (n, 4)
+        stamp (np.ndarray): The generation bytes stored with the pixels (see to_stamp)
+        snap (Callable | None): Maps the blended colors to a palette (see Palette.snap)
+    """
+    for index in write_rounds(ys * data.shape[1] + xs):
+        rx, ry, rc = xs[index], ys[index], colors[index]
+        if np.all(rc[:, 3] == 0xFF):
+            rgb = rc[:, :3]
+        else:
+            rgb = alpha_blend(data[ry, rx, :3], rc[:, :3], rc[:, 3])
+        data[ry, rx, :3] = snap(rgb) if snap else rgb
+        data[ry, rx, 3:] = stamp
+
+
+def to_stamp(generation: int) -> np.ndarray:
+    """Converts a generation to the 4 Bytes stored with the pixels (big-endian)"""
+    return np.frombuffer(int(generation).to_bytes(4, byteorder="big"), dtype=np.uint8)
+
+
+def read_stamps(data: np.ndarray, color_channels: int = 3) -> np.ndarray:
+    """
+    Returns the generation of the last write to every pixel of a canvas array (0 if never written)
+    """
+    return np.ascontiguousarray(data[..., color_channels:]).view(">u4")[..., 0]
+
+
+def overlap(
+    target: tuple[int, ...], source: tuple[int, ...], x: int, y: int
+) -> tuple[int, int, int, int, int, int] | None:
+    """
+    Finds the part of an array (source) placed at x, y that lies inside of another array (target)
+    Args:
+        target (tuple): The shape of the target
+        source (tuple): The shape of the source
+        x (int): Coordinate x of the upper left corner in the target (can be negative)
+        y (int): Coordinate y of the upper left corner in the target (can be negative)
+
+    Returns:
+        The rect (x, y, w, h) in the target and the offset (x, y) in the source, None if they don't overlap
+    """
+    tx, ty = max(x, 0), max(y, 0)
+    w = min(target[1] - tx, source[1] - (tx - x))
+    h = min(target[0] - ty, source[0] - (ty - y))
+    if w <= 0 or h <= 0:
+        return None
+    return tx, ty, w, h, tx - x, ty - y
+
+
+def paste_region(
+    target: np.ndarray, source: np.ndarray, x: int = 0, y: int = 0
+) -> tuple[int, int, int, int] | None:
+    """
+    Copies an array into the region of another array at x, y, the parts outside of the target are cut off
+    Args:
+        target (np.ndarray): The array written to, shape (h, w, c)
+        source (np.ndarray): The copied array, shape (h, w, c)
+        x (int): Coordinate x of the upper left corner in the target (can be negative)
+        y (int): Coordinate y of the upper left corner in the target (can be negative)
+
+    Returns:
+        The written rect (x, y, w, h), None if the arrays don't overlap
+    """
+    found = overlap(target.shape, source.shape, x, y)
+    if found is None:
+        return None
+    tx, ty, w, h, sx, sy = found
+    target[ty : ty + h, tx : tx + w] = source[sy : sy + h, sx : sx + w]
+    return tx, ty, w, h
+
+
+def fit(source: np.ndarray, shape: tuple[int, ...]) -> np.ndarray:
+    """
+    Returns an array with the given shape, cut off or padded with zeros at the right and the bottom
+    """
+    if source.shape == shape:
+        return source
+    data = np.zeros(shape, dtype=source.dtype)
+    paste_region(data, source)
+    return data
+
+
+def pixel_list(
+    xs: np.ndarray, ys: np.ndarray, colors: np.ndarray
+) -> list[tuple[int, int, str | int]]:
+    """
+    Converts changed pixels to the output of pixel_since
+    Args:
+        xs (np.ndarray): Coordinates x
+        ys (np.ndarray): Coordinates y
+        colors (np.ndarray): Values RGB, shape (n, 3), or palette indices, shape (n,)
+
+    Returns:
+        A list of [x, y, color (hex or palette index)]
+    """
+    if len(xs) == 0:
+        return []
+    pixels = np.empty((len(xs), 3), dtype=object)
+    pixels[:, 0] = xs
+    pixels[:, 1] = ys
+    if colors.ndim == 1:
+        pixels[:, 2] = colors
+    else:
+        pixels[:, 2] = np.vectorize(rgb_to_hex)(*colors.T)
+    return pixels.tolist()
 
 
 class Heart:
     """
-    The heart of the canvas, that stores all the pixels with timestamps
+    The heart of the canvas, that stores all the pixels with the generation of their last write
+    Every write (a batch, a restore, a paste) starts a new generation, so clients
+    polling for changes (pixel_since) get every change exactly once, independent of the clock.
     Attributes:
         config (Config): The config
         data (np.ndarray): The data of all the pixels
-        timestamp (np.ndarray): The current timestamp in 4 Bytes
+        generation (int): The number of writes applied to the canvas
+        tiles (np.ndarray): The generation of the last write to every tile
+        storage (CanvasStorage | None): The memory mapped file holding data (if persistence is enabled)
+        restored (bool): If data was restored from the storage
+        snapshots (SnapshotPool): The consistent frames published for readers
+        channels (int): The bytes per pixel
+        color_channels (int): The bytes of the color, the generation follows
+        palette (np.ndarray | None): The RGB values of the color indices, if data holds indices (see PaletteHeart)
 
     Structure of data:
     y [
         x[
             7 Bytes / 8-Bit Integers:
                 Byte 0-2: Colors RGB
-                Byte 3-6: 32-Bit Integer Timestamp
+                Byte 3-6: 32-Bit Integer Generation of the last write (0 if never written)
         ]
     ]
     y and x are swapped so rows come before columns, rendered left-right, then top-bottom respectively
@@ -29,17 +215,169 @@ class Heart:
 
     config: Config
     data: np.ndarray
-    timestamp: np.ndarray
+    generation: int
+    tiles: np.ndarray
+    tile_size: int = 64
+    storage: CanvasStorage | None
+    restored: bool
+    snapshots: SnapshotPool
+    channels: int = 7
+    color_channels: int = 3
+    palette: np.ndarray | None = None
 
     def __init__(self, config: Config):
         self.config = config
 
-        self.data = np.zeros(
-            (self.config.visuals.size.height, self.config.visuals.size.width, 7),
-            dtype=np.uint8,
+        shape = (
+            self.config.visuals.size.height,
+            self.config.visuals.size.width,
+            self.channels,
         )
+        self.storage = None
+        self.restored = False
+        self.generation = 0
+        if self.config.persistence.enabled:
+            self.storage = CanvasStorage(self.config.persistence.file, shape)
+            self.data = self.storage.data
+            self.restored = self.storage.restored
+            self.generation = self.storage.generation
+        else:
+            self.data = np.zeros(shape, dtype=np.uint8)
+
+        self.tiles = self.create_tiles()
+        if self.restored:
+            self.resume()
+        self.snapshots = SnapshotPool(self.data.shape, self.palette)
+        self.publish()
 
-        self.timestamp = np.zeros(4, dtype=np.uint8)
+    def create_tiles(self) -> np.ndarray:
+        """
+        Returns the (unchanged) tiles covering data
+        """
+        return np.zeros(
+            (
+                -(-self.data.shape[0] // self.tile_size),
+                -(-self.data.shape[1] // self.tile_size),
+            ),
+            dtype=np.uint64,
+        )
+
+    def resize(self, width: int, height: int) -> None:
+        """
+        Resizes the canvas, the pixels of the overlapping region are kept and the rest is empty
+        The overlap is copied at once, the tiles and the snapshots start over with the
+        new size (readers still holding an old snapshot keep it until they release it).
+        With persistence the storage file is replaced by one of the new size.
+        Args:
+            width (int): The new width
+            height (int): The new height
+        """
+        shape = (height, width, self.data.shape[2])
+        if self.storage:
+            kept = np.array(self.data[:height, :width])
+            self.storage.close(self.generation)
+            path = self.storage.path
+            path.unlink()
+            self.storage = CanvasStorage(path, shape)
+            self.data = self.storage.data
+            paste_region(self.data, kept)
+        else:
+            self.data = fit(self.data, shape)
+        self.tiles = self.create_tiles()
+        self.touch()
+        self.snapshots = SnapshotPool(shape, self.palette)
+        self.publish()
+
+    def flush(self) -> None:
+        """
+        Syncs the persistent storage to the disk (blocking, can run in a worker thread)
+        """
+        if self.storage:
+            self.storage.flush()
+
+    def checkpoint(self, generation: int) -> None:
+        """
+        Marks the persistent storage as synced up to the given generation
+        """
+        if self.storage:
+            self.storage.checkpoint(generation)
+
+    def close(self) -> None:
+        """
+        Syncs and closes the persistent storage
+        """
+        if self.storage:
+            self.storage.close(self.generation)
+
+    def touch(self, xs: np.ndarray | None = None, ys: np.ndarray | None = None) -> None:
+        """
+        Starts a new generation and marks the tiles of the given pixels as changed
+        Args:
+            xs (np.ndarray): Coordinates x, all tiles if None
+            ys (np.ndarray): Coordinates y, all tiles if None
+        """
+        self.generation += 1
+        if xs is None:
+            self.tiles[:] = self.generation
+        else:
+            self.tiles[ys // self.tile_size, xs // self.tile_size] = self.generation
+
+    def touch_rect(self, x: int, y: int, w: int, h: int) -> None:
+        """
+        Starts a new generation and marks the tiles of a region as changed
+        """
+        self.generation += 1
+        size = self.tile_size
+        self.tiles[
+            y // size : (y + h - 1) // size + 1, x // size : (x + w - 1) // size + 1
+        ] = self.generation
+
+    def publish(self) -> None:
+        """
+        Publishes the current state as snapshot, only called between ticks
+        """
+        self.snapshots.publish(self)
+
+    def snapshot(self) -> Snapshot:
+        """
+        Returns the latest published snapshot, it has to be released after use
+        """
+        return self.snapshots.acquire()
+
+    def dirty_rects(self, since: int) -> list[tuple[int, int, int, int]]:
+        """
+        Returns the regions changed after the given generation
+        Args:
+            since (int): The last generation seen by the caller
+
+        Returns:
+            A list of rects (x, y, w, h), adjacent tiles of a row are merged
+        """
+        height, width = self.data.shape[:2]
+        size = self.tile_size
+        rects = []
+        for row, cols in enumerate(self.tiles > since):
+            changed = np.flatnonzero(cols)
+            if len(changed) == 0:
+                continue
+            breaks = np.flatnonzero(np.diff(changed) != 1)
+            starts = np.r_[changed[0], changed[breaks + 1]]
+            ends = np.r_[changed[breaks], changed[-1]] + 1
+            y = row * size
+            h = min(size, height - y)
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                x = start * size
+                rects.append((x, y, min(end * size, width) - x, h))
+        return rects
+
+    def colors_at(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        Returns the RGB values of the given pixels of the live canvas, shape (n, 3)
+        """
+        pixels = self.data[ys, xs]
+        if self.palette is None:
+            return pixels[:, :3]
+        return self.palette[pixels[:, 0]]
 
     def update_pixel(self, x: int, y: int, value: tuple[int, int, int]) -> None:
         """
@@ -49,8 +387,25 @@ class Heart:
             y (int): Coordinate y
             value (tuple[int, int, int]): Values RGB
         """
+        self.touch(np.array([x]), np.array([y]))
         self.data[y, x, :3] = np.array(value, dtype=np.uint8)
-        self.data[y, x, 3:] = self.timestamp
+        self.data[y, x, 3:] = self.stamp
+
+    def blend_pixels(self, xs: np.ndarray, ys: np.ndarray, colors: np.ndarray) -> None:
+        """
+        Blends a batch of RGBA writes onto the canvas, in the order they are given
+        Args:
+            xs (np.ndarray): Coordinates x, shape (n,)
+            ys (np.ndarray): Coordinates y, shape (n,)
+            colors (np.ndarray): Values RGBA, shape (n, 4)
+
+        Writes to the same coordinate are split into rounds, so every round
+        touches each pixel at most once and later writes blend over earlier ones.
+        """
+        if len(xs) == 0:
+            return
+        self.touch(xs, ys)
+        blend(self.data, xs, ys, colors, self.stamp)
 
     def get_pixel_color(self, x: int, y: int) -> tuple:
         """
@@ -62,69 +417,85 @@ class Heart:
         Returns:
             Tuple with the values RGB
         """
-        data = self.data[y, x, :3]
-        return tuple(data.tolist())
+        return tuple(self.get_colors(x, y, 1, 1)[0, 0].tolist())
 
-    def update_timestamp(self) -> None:
+    def get_colors(self, x: int, y: int, w: int, h: int) -> np.ndarray:
         """
-        Updates the own timestamp frequently
-        Returns:
-            None
+        Returns the RGB values of a region of the live canvas, shape (h, w, 3)
+        """
+        region = self.data[y : y + h, x : x + w]
+        if self.palette is None:
+            return region[:, :, :3]
+        return self.palette[region[:, :, 0]]
+
+    @property
+    def stamp(self) -> np.ndarray:
+        """The bytes stored with the pixels of the current generation"""
+        return to_stamp(self.generation)
+
+    def resume(self) -> None:
+        """
+        Continues the generations after the latest write to the restored pixels and marks all tiles as changed
+        (the data of an unclean shutdown can be newer than the generation of its checkpoint)
+        """
+        latest = int(read_stamps(self.data, self.color_channels).max(initial=0))
+        self.generation = max(self.generation, latest)
+        self.touch()
+
+    def restamp(self) -> None:
         """
-        self.timestamp = time_to_np(time.time())
+        Starts a new generation for a replaced canvas, all written pixels get its stamp
+        """
+        self.touch()
+        stamps = self.data[:, :, self.color_channels :]
+        stamps[stamps.any(axis=2)] = self.stamp
 
-    def pixel_since(self, ts: int | float) -> list[tuple[int, int, str]] | None:
+    def pixel_since(self, since: int) -> tuple[int, list[tuple[int, int, str | int]]]:
         """
-        Returns all pixels that were modified since the given timestamp
+        Returns all pixels that were modified after the given generation
         Args:
-            ts: timestamp
+            since (int): The generation of the last state seen by the caller
 
         Returns:
-            A dictionary with the modified pixels
+            The generation of the returned state and the modified pixels
 
         Output format: [
             [
                 x (int),
                 y (int),
-                color (str)
+                color (str, or the palette index)
             ]
         ]
         """
-        if isinstance(ts, float):
-            ts = int(ts)
-        timestamps = (
-            np.frombuffer(self.data[:, :, 3:].tobytes(), dtype=np.uint32)
-            .astype(np.uint32)
-            .byteswap(True)
-        )
-        colors = self.data[:, :, :3]
-
-        filtered = np.where((timestamps >= ts) & (timestamps != 0))
-        if len(filtered[0]) == 0:
-            return []
-
-        coords = np.array(np.unravel_index(filtered[0], self.data.shape[:2])).T
+        c = self.color_channels
+        with self.snapshot() as snapshot:
+            generation = snapshot.generation
+            stamps = read_stamps(snapshot.data, c)
+            filtered = np.flatnonzero(stamps > since)
+            ys, xs = np.unravel_index(filtered, stamps.shape)
+            colors = snapshot.data[ys, xs, :c]
 
-        pixels = np.empty((coords.shape[0], 3), dtype=object)
-        pixels[:, :2] = coords
-
-        pixels[:, 2] = np.vectorize(rgb_to_hex)(*colors[coords[:, 0], coords[:, 1]].T)
-
-        pixels[:, [0, 1, 2]] = pixels[
-            :, [1, 0, 2]
-        ]  # transform from [y, x, color] to [x, y, color]
-
-        out = pixels.tolist()
-        return out
+        if self.palette is not None:
+            return generation, pixel_list(xs, ys, colors[:, 0])
+        return generation, pixel_list(xs, ys, colors)
 
     def create_image(self) -> Image:
         """
-        Creates an image from the canvas array
+        Creates an image from the latest snapshot
         Returns:
             The created image
         """
-        image = Image.fromarray(self.data[:, :, :3])
-        return image
+        return self.create_frame()[0]
+
+    def create_frame(self) -> tuple[Image, int]:
+        """
+        Creates an image from the latest snapshot
+        Returns:
+            The created image and the generation of the snapshot
+        """
+        with self.snapshot() as snapshot:
+            image = Image.fromarray(np.ascontiguousarray(snapshot.colors()))
+            return image, snapshot.generation
 
     def restore_from_image(self, image: Image) -> None:
         """
@@ -136,15 +507,66 @@ class Heart:
         ):
             raise IncorrectBackupSize()
         arr = np.asarray(image)
+        self.touch()
         self.data[:, :, :3] = arr
+        self.data[:, :, 3:] = self.stamp
 
     def restore_from_array(self, array: np.ndarray) -> None:
+        """
+        Restores the canvas from an array, the array is copied so readers never see a replaced canvas
+        The stamps of the array (e.g. from another process) are replaced by a new generation.
+        """
         if not self.data.shape == array.shape:
             raise IncorrectBackupSize()
-        self.data = array
+        self.data[:] = array
+        self.restamp()
+
+    def paste(
+        self, array: np.ndarray, x: int, y: int
+    ) -> tuple[int, int, int, int] | None:
+        """
+        Restores a canvas array of any size (e.g. an older backup) into the region at x, y
+        The parts outside of the canvas are cut off. The pasted pixels get a new
+        generation, so clients polling for changes receive them.
+        Returns:
+            The changed rect (x, y, w, h), None if the array is outside of the canvas
+        """
+        if array.shape[2] != self.channels:
+            raise IncorrectBackupSize()
+        c = self.color_channels
+        rect = paste_region(self.data[:, :, :c], array[:, :, :c], x, y)
+        if rect is None:
+            return None
+        rx, ry, rw, rh = rect
+        self.touch_rect(*rect)
+        self.data[ry : ry + rh, rx : rx + rw, c:] = self.stamp
+        return rect
+
+    def save_to_storage(self, path: Path) -> None:
+        """
+        Writes the canvas and its generation to a file in the format of CanvasStorage
+        """
+        storage = CanvasStorage(path, self.data.shape)
+        storage.data[:] = self.data
+        storage.close(self.generation)
+
+    def restore_from_storage(self, path: Path) -> bool:
+        """
+        Restores the canvas and its generation from a file written by save_to_storage
+        Returns:
+            If the file contained a canvas of the same size
+        """
+        storage = CanvasStorage(path, self.data.shape)
+        if not storage.restored:
+            return False
+        self.data[:] = storage.data
+        self.restored = True
+        self.generation = storage.generation
+        self.resume()
+        return True
 
     def get_raw_array(self) -> np.ndarray:
         """
-        Returns the data file
+        Returns the live canvas array, it is only consistent within a tick (see snapshot)
         """
         return self.data
@@ -0,0 +1,223 @@
+import numpy as np
+from PIL import Image
+
+from Canvas.heart import Heart, write_rounds
+from Config.config import Config
+from Misc.errors import IncorrectBackupSize
+from Misc.utils import alpha_blend, hex_to_rgba_array, rgb_to_hex
+
+
+def pack(colors: np.ndarray) -> np.ndarray:
+    """
+    Packs RGB values (n, 3) into 24-bit integers (n,)
+    """
+    colors = colors.astype(np.int64)
+    return (colors[..., 0] << 16) | (colors[..., 1] << 8) | colors[..., 2]
+
+
+class Palette:
+    """
+    A fixed set of colors (at most 256), a color is stored as its index (1 Byte)
+    All lookups are vectorized: the packed colors are searched in the sorted
+    packed palette, colors outside of it are mapped to the nearest palette color.
+    Attributes:
+        colors (np.ndarray): The RGB values of the indices, shape (n, 3)
+        hex (list[str]): The colors as hexadecimal strings
+        keys (np.ndarray): The packed colors, sorted
+        order (np.ndarray): The index of every sorted key
+    """
+
+    colors: np.ndarray
+    hex: list[str]
+    keys: np.ndarray
+    order: np.ndarray
+    chunk: int = 4096
+
+    def __init__(self, colors: list[str]):
+        if not 0 < len(colors) <= 256:
+            raise ValueError(f"A palette has 1-256 colors, not {len(colors)}")
+        self.colors = hex_to_rgba_array(colors)[:, :3].copy()
+        self.colors.flags.writeable = False
+        self.hex = [rgb_to_hex(*color) for color in self.colors.tolist()]
+        keys = pack(self.colors)
+        self.order = np.argsort(keys, kind="stable").astype(np.uint8)
+        self.keys = keys[self.order]
+
+    def __len__(self) -> int:
+        return len(self.colors)
+
+    def __contains__(self, color: tuple[int, int, int]) -> bool:
+        r, g, b = color[:3]
+        key = (r << 16) | (g << 8) | b
+        position = np.searchsorted(self.keys, key)
+        return position < len(self.keys) and self.keys[position] == key
+
+    def find(self, colors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Looks up the exact index of RGB values
+        Args:
+            colors (np.ndarray): Values RGB, shape (n, 3)
+
+        Returns:
+            The indices (uint8) and if the color is in the palette (the index is 0 if not)
+        """
+        keys = pack(colors)
+        position = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = self.keys[position] == keys
+        return np.where(found, self.order[position], 0).astype(np.uint8), found
+
+    def contains(self, colors: np.ndarray) -> np.ndarray:
+        """
+        Returns if the RGB values (n, 3) are in the palette, shape (n,)
+        """
+        return self.find(colors)[1]
+
+    def quantize(self, colors: np.ndarray) -> np.ndarray:
+        """
+        Maps RGB values to the index of the nearest palette color (squared distance)
+        Args:
+            colors (np.ndarray): Values RGB, shape (n, 3)
+
+        Returns:
+            The indices, shape (n,) uint8
+        """
+        index, found = self.find(colors)
+        if found.all():
+            return index
+        missing = np.flatnonzero(~found)
+        # every distinct color is only compared once with the palette
+        keys, inverse = np.unique(pack(colors[missing]), return_inverse=True)
+        unique = np.stack([keys >> 16, (keys >> 8) & 0xFF, keys & 0xFF], axis=1)
+        palette = self.colors.astype(np.int32)
+        nearest = np.empty(len(keys), dtype=np.uint8)
+        for start in range(0, len(keys), self.chunk):
+            part = unique[start : start + self.chunk, None, :].astype(np.int32)
+            distance = ((part - palette[None]) ** 2).sum(axis=2)
+            nearest[start : start + self.chunk] = distance.argmin(axis=1)
+        index[missing] = nearest[inverse.ravel()]
+        return index
+
+    def snap(self, colors: np.ndarray) -> np.ndarray:
+        """
+        Replaces RGB values (n, 3) by the nearest palette colors
+        """
+        return self.colors[self.quantize(colors)]
+
+    def decode(self, data: np.ndarray) -> np.ndarray:
+        """
+        Returns the RGB values of a canvas array holding indices (see PaletteHeart), shape (h, w, 3)
+        """
+        return self.colors[data[..., 0]]
+
+    @classmethod
+    def of(cls, config: Config, data: np.ndarray) -> "Palette | None":
+        """
+        Returns the configured palette if it is enabled or a canvas array holds indices (e.g. a backup), else None
+        """
+        if (
+            data.shape[2] != PaletteHeart.channels
+            and not config.visuals.palette.enabled
+        ):
+            return None
+        return cls(config.visuals.palette.colors)
+
+
+def blend_indices(
+    data: np.ndarray,
+    xs: np.ndarray,
+    ys: np.ndarray,
+    colors: np.ndarray,
+    stamp: np.ndarray,
+    palette: Palette,
+) -> None:
+    """
+    Blends a batch of RGBA writes onto a canvas array holding indices, in the order they are given
+    Opaque writes are stored as the index of the nearest palette color, the other ones
+    are blended over the current color and the result is mapped to the palette.
+    Args:
+        data (np.ndarray): The canvas array (see PaletteHeart)
+        xs (np.ndarray): Coordinates x, shape (n,)
+        ys (np.ndarray): Coordinates y, shape (n,)
+        colors (np.ndarray): Values RGBA, shape (n, 4)
+        stamp (np.ndarray): The generation bytes stored with the pixels (see to_stamp)
+        palette (Palette): The palette of the indices
+    """
+    for index in write_rounds(ys * data.shape[1] + xs):
+        rx, ry, rc = xs[index], ys[index], colors[index]
+        if np.all(rc[:, 3] == 0xFF):
+            rgb = rc[:, :3]
+        else:
+            current = palette.colors[data[ry, rx, 0]]
+            rgb = alpha_blend(current, rc[:, :3], rc[:, 3])
+        data[ry, rx, 0] = palette.quantize(rgb)
+        data[ry, rx, 1:] = stamp
+
+
+def convert(array: np.ndarray, channels: int, palette: Palette) -> np.ndarray:
+    """
+    Converts a canvas array between RGB (see Heart) and palette indices (see PaletteHeart)
+    Args:
+        array (np.ndarray): The canvas array, e.g. a backup taken in the other mode
+        channels (int): The bytes per pixel of the result
+        palette (Palette): The palette of the indices
+
+    Returns:
+        The converted array (the same array if it already has the channels)
+    """
+    if array.shape[2] == channels:
+        return array
+    if channels == PaletteHeart.channels and array.shape[2] == Heart.channels:
+        height, width = array.shape[:2]
+        index = palette.quantize(np.asarray(array[:, :, :3]).reshape(-1, 3))
+        return np.concatenate(
+            [index.reshape(height, width, 1), array[:, :, 3:]], axis=2
+        )
+    if channels == Heart.channels and array.shape[2] == PaletteHeart.channels:
+        return np.concatenate([palette.decode(array), array[:, :, 1:]], axis=2)
+    raise IncorrectBackupSize()
+
+
+class PaletteHeart(Heart):
+    """
+    A heart storing the palette index of every pixel instead of its RGB values
+    Structure of data:
+    y [
+        x[
+            5 Bytes / 8-Bit Integers:
+                Byte 0: Palette index
+                Byte 1-4: 32-Bit Integer Generation of the last write (0 if never written)
+        ]
+    ]
+    Colors are mapped to the palette on write, readers decode the indices with
+    Snapshot.colors. /canvas/since and the backups carry the indices.
+    Attributes:
+        table (Palette): The palette of the indices
+    """
+
+    table: Palette
+    channels: int = 5
+    color_channels: int = 1
+
+    def __init__(self, config: Config, palette: Palette):
+        self.table = palette
+        self.palette = palette.colors
+        super().__init__(config)
+
+    def update_pixel(self, x: int, y: int, value: tuple[int, int, int]) -> None:
+        self.blend_pixels(
+            np.array([x]), np.array([y]), np.array([(*value, 0xFF)], dtype=np.uint8)
+        )
+
+    def blend_pixels(self, xs: np.ndarray, ys: np.ndarray, colors: np.ndarray) -> None:
+        if len(xs) == 0:
+            return
+        self.touch(xs, ys)
+        blend_indices(self.data, xs, ys, colors, self.stamp, self.table)
+
+    def restore_from_image(self, image: Image) -> None:
+        if image.size != self.data.shape[1::-1]:
+            raise IncorrectBackupSize()
+        rgb = np.asarray(image.convert("RGB")).reshape(-1, 3)
+        self.touch()
+        self.data[:, :, 0] = self.table.quantize(rgb).reshape(self.data.shape[:2])
+        self.data[:, :, 1:] = self.stamp
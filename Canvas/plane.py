@@ -0,0 +1,272 @@
+import numpy as np
+
+from Canvas.heart import Heart, fit, overlap, paste_region
+
+
+class Plane:
+    """
+    A value for every pixel of the canvas (e.g. a counter or an owner), 0 by default
+    Attributes:
+        data (np.ndarray): The values, shape (h, w)
+    """
+
+    data: np.ndarray
+
+    def __init__(self, width: int, height: int, dtype: type):
+        self.data = np.zeros((height, width), dtype=dtype)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.data.shape
+
+    def get(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        Returns the values of the given pixels
+        """
+        return self.data[ys, xs]
+
+    def set(self, xs: np.ndarray, ys: np.ndarray, values: np.ndarray | int) -> None:
+        """
+        Sets the values of the given pixels, the last one wins for repeated pixels
+        """
+        self.data[ys, xs] = values
+
+    def add(self, xs: np.ndarray, ys: np.ndarray, values: np.ndarray | int) -> None:
+        """
+        Adds to the values of the given pixels, repeated pixels are added up
+        """
+        np.add.at(self.data, (ys, xs), values)
+
+    def fill(
+        self,
+        value: int | bool,
+        x: int = 0,
+        y: int = 0,
+        w: int | None = None,
+        h: int | None = None,
+    ) -> None:
+        """
+        Sets the values of a region (the whole plane by default), the parts outside are cut off
+        """
+        rows = slice(y, None if h is None else y + h)
+        cols = slice(x, None if w is None else x + w)
+        self.data[rows, cols] = value
+
+    def nonzero(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the coordinates (xs, ys) and the values of all pixels that aren't 0
+        """
+        ys, xs = np.nonzero(self.data)
+        return xs, ys, self.data[ys, xs]
+
+    def find(self, value: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the coordinates (xs, ys) of all pixels with a value (not 0)
+        """
+        ys, xs = np.nonzero(self.data == value)
+        return xs, ys
+
+    def resize(self, width: int, height: int) -> None:
+        """
+        Resizes the plane, the values of the overlapping region are kept
+        """
+        self.data = fit(self.data, (height, width))
+
+    def dump(self) -> dict[str, np.ndarray]:
+        """
+        Returns the arrays to save the plane (e.g. with np.savez)
+        """
+        return {"data": self.data}
+
+    def load(self, arrays) -> bool:
+        """
+        Restores the plane from the arrays of dump
+        Returns:
+            If the arrays are of a plane of the same kind and size
+        """
+        if "data" not in arrays or arrays["data"].shape != self.shape:
+            return False
+        self.data[:] = arrays["data"]
+        return True
+
+
+class TiledPlane(Plane):
+    """
+    A plane for very large, sparse canvases (visuals.sparse), split into tiles like TiledHeart
+    A tile is allocated on its first write, untouched tiles are 0. Full scans
+    (nonzero, find) only read the allocated tiles.
+    Attributes:
+        pool (np.ndarray): The allocated tiles, shape (n, tile_size, tile_size)
+        index (np.ndarray): The slot in the pool of every tile (-1 if untouched)
+        count (int): The number of used slots
+        width (int): The width of the plane
+        height (int): The height of the plane
+    """
+
+    pool: np.ndarray
+    index: np.ndarray
+    count: int
+    width: int
+    height: int
+    tile_size: int = Heart.tile_size
+
+    def __init__(self, width: int, height: int, dtype: type):
+        self.index = self.create_index(width, height)
+        self.pool = np.zeros((1, self.tile_size, self.tile_size), dtype=dtype)
+        self.count = 0
+        self.width, self.height = width, height
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.height, self.width
+
+    def create_index(self, width: int, height: int) -> np.ndarray:
+        """
+        Returns the index of a plane without tiles
+        """
+        size = self.tile_size
+        return np.full((-(-height // size), -(-width // size)), -1, dtype=np.int64)
+
+    def allocate(self, ty: np.ndarray, tx: np.ndarray) -> np.ndarray:
+        """
+        Returns the slots of tiles for writing, untouched tiles are allocated (the pool doubles if it is full)
+        """
+        slots = self.index[ty, tx]
+        untouched = slots < 0
+        if not untouched.any():
+            return slots
+        keys = np.unique(ty[untouched] * self.index.shape[1] + tx[untouched])
+        start, self.count = self.count, self.count + len(keys)
+        if self.count > len(self.pool):
+            pool = np.empty(
+                (max(2 * len(self.pool), self.count),) + self.pool.shape[1:],
+                dtype=self.pool.dtype,
+            )
+            pool[:start] = self.pool[:start]
+            self.pool = pool
+        self.pool[start : self.count] = 0
+        self.index[np.divmod(keys, self.index.shape[1])] = np.arange(start, self.count)
+        return self.index[ty, tx]
+
+    def get(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        size = self.tile_size
+        slots = self.index[ys // size, xs // size]
+        values = np.zeros(len(slots), dtype=self.pool.dtype)
+        touched = slots >= 0
+        values[touched] = self.pool[
+            slots[touched], ys[touched] % size, xs[touched] % size
+        ]
+        return values
+
+    def set(self, xs: np.ndarray, ys: np.ndarray, values: np.ndarray | int) -> None:
+        size = self.tile_size
+        slots = self.allocate(ys // size, xs // size)
+        self.pool[slots, ys % size, xs % size] = values
+
+    def add(self, xs: np.ndarray, ys: np.ndarray, values: np.ndarray | int) -> None:
+        size = self.tile_size
+        slots = self.allocate(ys // size, xs // size)
+        np.add.at(self.pool, (slots, ys % size, xs % size), values)
+
+    def fill(
+        self,
+        value: int | bool,
+        x: int = 0,
+        y: int = 0,
+        w: int | None = None,
+        h: int | None = None,
+    ) -> None:
+        if x <= 0 and y <= 0 and w is None and h is None and not value:
+            self.index[:] = -1
+            self.count = 0
+            return
+        found = overlap(
+            self.shape,
+            (self.height if h is None else h, self.width if w is None else w),
+            x,
+            y,
+        )
+        if found is None:
+            return
+        x, y, w, h = found[:4]
+        size = self.tile_size
+        ty, tx = np.mgrid[
+            y // size : (y + h - 1) // size + 1, x // size : (x + w - 1) // size + 1
+        ]
+        ty, tx = ty.ravel(), tx.ravel()
+        if value:
+            slots = self.allocate(ty, tx)
+        else:
+            slots = self.index[ty, tx]
+            ty, tx, slots = ty[slots >= 0], tx[slots >= 0], slots[slots >= 0]
+        for row, col, slot in zip(ty.tolist(), tx.tolist(), slots.tolist()):
+            top, left = max(y - row * size, 0), max(x - col * size, 0)
+            bottom = min(y + h - row * size, size)
+            right = min(x + w - col * size, size)
+            self.pool[slot, top:bottom, left:right] = value
+
+    def tiles(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the allocated tiles
+        Returns:
+            The tile coordinates y and x and the tiles, shape (n, tile_size, tile_size)
+        """
+        ty, tx = np.nonzero(self.index >= 0)
+        return ty, tx, self.pool[self.index[ty, tx]]
+
+    def positions(
+        self, ty: np.ndarray, tx: np.ndarray, found: tuple[np.ndarray, ...]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Converts the result of np.nonzero on tiles to the coordinates (xs, ys) of the pixels
+        """
+        n, iy, ix = found
+        size = self.tile_size
+        return tx[n] * size + ix, ty[n] * size + iy
+
+    def nonzero(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        ty, tx, tiles = self.tiles()
+        found = np.nonzero(tiles)
+        return *self.positions(ty, tx, found), tiles[found]
+
+    def find(self, value: int) -> tuple[np.ndarray, np.ndarray]:
+        ty, tx, tiles = self.tiles()
+        return self.positions(ty, tx, np.nonzero(tiles == value))
+
+    def resize(self, width: int, height: int) -> None:
+        """
+        Resizes the plane, only the tile index is copied
+        The parts of the edge tiles outside of a smaller plane are reset to 0
+        """
+        index = self.create_index(width, height)
+        paste_region(index[:, :, None], self.index[:, :, None])
+        self.index = index
+        self.width, self.height = width, height
+        size = self.tile_size
+        edge = index[-1][index[-1] >= 0]
+        if height % size:
+            self.pool[edge, height % size :] = 0
+        edge = index[:, -1][index[:, -1] >= 0]
+        if width % size:
+            self.pool[edge, :, width % size :] = 0
+
+    def dump(self) -> dict[str, np.ndarray]:
+        ty, tx, tiles = self.tiles()
+        return {"shape": np.array(self.shape), "ty": ty, "tx": tx, "tiles": tiles}
+
+    def load(self, arrays) -> bool:
+        if "tiles" not in arrays or tuple(arrays["shape"].tolist()) != self.shape:
+            return False
+        self.fill(0)
+        slots = self.allocate(arrays["ty"], arrays["tx"])
+        self.pool[slots] = arrays["tiles"]
+        return True
+
+
+def create_plane(width: int, height: int, dtype: type, sparse: bool = False) -> Plane:
+    """
+    Returns a plane of the canvas, a tiled one for sparse canvases (visuals.sparse)
+    """
+    if sparse:
+        return TiledPlane(width, height, dtype)
+    return Plane(width, height, dtype)
@@ -0,0 +1,73 @@
+import numpy as np
+
+from Canvas.plane import Plane, create_plane
+
+
+class Protection:
+    """
+    The protected regions of the canvas (e.g. sponsor logos, the statsbar), clients can't write there
+    The regions are compiled into a boolean mask of the canvas, so a batch of writes
+    is checked with one lookup, no matter how many regions there are.
+    Attributes:
+        regions (list[tuple[int, int, int, int]]): The protected rects (x, y, w, h)
+        mask (Plane): If a pixel is protected (tiled for a sparse canvas)
+        sparse (bool): If the mask is tiled
+    """
+
+    regions: list[tuple[int, int, int, int]]
+    mask: Plane
+    sparse: bool
+
+    def __init__(self, width: int, height: int, sparse: bool = False):
+        self.regions = []
+        self.sparse = sparse
+        self.mask = create_plane(width, height, bool, sparse)
+
+    def __bool__(self) -> bool:
+        return bool(self.regions)
+
+    def compile(self, regions: list) -> None:
+        """
+        Replaces the regions and rebuilds the mask, regions (partly) outside of the canvas are cut off
+        Args:
+            regions (list): The rects [x, y, w, h]
+        Raises:
+            ValueError: If a region isn't a rect with a positive size
+        """
+        rects = []
+        for region in regions:
+            if len(region) != 4 or not all(isinstance(v, int) for v in region):
+                raise ValueError(f"A region is [x, y, w, h], not {region}")
+            x, y, w, h = region
+            if x < 0 or y < 0 or w <= 0 or h <= 0:
+                raise ValueError(f"The region {region} is out of range")
+            rects.append((x, y, w, h))
+        height, width = self.mask.shape
+        mask = create_plane(width, height, bool, self.sparse)
+        for x, y, w, h in rects:
+            mask.fill(True, x, y, w, h)
+        self.regions, self.mask = rects, mask
+
+    def resize(self, width: int, height: int) -> None:
+        """
+        Rebuilds the mask for a new canvas size, the regions are kept
+        """
+        self.mask = create_plane(width, height, bool, self.sparse)
+        self.compile(self.regions)
+
+    def blocked(self, xs: np.ndarray, ys: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        """
+        Looks up which writes of a batch hit a protected pixel
+        Args:
+            xs (np.ndarray): Coordinates x, shape (n,)
+            ys (np.ndarray): Coordinates y, shape (n,)
+            valid (np.ndarray): Which writes are inside of the canvas, shape (n,)
+
+        Returns:
+            If a write is rejected, shape (n,)
+        """
+        if valid.all():
+            return self.mask.get(xs, ys)
+        blocked = np.zeros(len(xs), dtype=bool)
+        blocked[valid] = self.mask.get(xs[valid], ys[valid])
+        return blocked
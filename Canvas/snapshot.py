@@ -0,0 +1,118 @@
+import numpy as np
+
+
+class Snapshot:
+    """
+    A consistent, read-only frame of the canvas
+    Snapshots are published by the heart at the end of a tick. The buffers are
+    reused for later frames once no reader holds them anymore, so every reader
+    has to release its snapshot (or use it as context manager):
+        with canvas.snapshot() as snapshot:
+            image = Image.fromarray(snapshot.colors())
+    Acquiring and releasing happens in greenlets, the data can be read from any thread.
+    Attributes:
+        generation (int): The generation of the frame (-1 if the buffer is empty)
+        data (np.ndarray): The read-only canvas array (see Heart)
+        refs (int): The number of readers holding the snapshot
+        palette (np.ndarray | None): The RGB values of the color indices, if data holds indices (see PaletteHeart)
+    """
+
+    generation: int
+    data: np.ndarray
+    refs: int
+    buffer: np.ndarray
+    palette: np.ndarray | None
+
+    def __init__(self, shape: tuple[int, int, int], palette: np.ndarray | None = None):
+        self.generation = -1
+        self.refs = 0
+        self.palette = palette
+        self.buffer = np.zeros(shape, dtype=np.uint8)
+        self.data = self.buffer.view()
+        self.data.flags.writeable = False
+
+    def colors(
+        self,
+        x: int = 0,
+        y: int = 0,
+        width: int | None = None,
+        height: int | None = None,
+    ) -> np.ndarray:
+        """
+        Returns the RGB values of a region (the whole frame by default), shape (h, w, 3)
+        """
+        rows = slice(y, None if height is None else y + height)
+        cols = slice(x, None if width is None else x + width)
+        if self.palette is None:
+            return self.data[rows, cols, :3]
+        return self.palette[self.data[rows, cols, 0]]
+
+    def acquire(self) -> "Snapshot":
+        self.refs += 1
+        return self
+
+    def release(self) -> None:
+        self.refs -= 1
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+
+class SnapshotPool:
+    """
+    The buffers of the published snapshots (double-buffered)
+    Publishing copies the regions changed since a free buffer's frame into it and
+    makes it the current snapshot. If readers still hold all other buffers, a new
+    one is allocated instead of waiting, so the writer never blocks.
+    Attributes:
+        current (Snapshot): The latest published snapshot
+        snapshots (list[Snapshot]): All buffers
+        palette (np.ndarray | None): The RGB values of the color indices (see Snapshot)
+    """
+
+    current: Snapshot
+    snapshots: list[Snapshot]
+    palette: np.ndarray | None
+
+    def __init__(self, shape: tuple[int, int, int], palette: np.ndarray | None = None):
+        self.palette = palette
+        self.current = Snapshot(shape, palette)
+        self.snapshots = [self.current]
+
+    def acquire(self) -> Snapshot:
+        """
+        Returns the current snapshot, it has to be released after use
+        """
+        return self.current.acquire()
+
+    def publish(self, heart) -> Snapshot:
+        """
+        Publishes the current state of the heart (call at tick boundaries)
+        Args:
+            heart (Heart): The heart
+
+        Returns:
+            The current snapshot
+        """
+        if self.current.generation == heart.generation:
+            return self.current
+        free = [s for s in self.snapshots if s.refs == 0 and s is not self.current]
+        if free:
+            target = free.pop(0)
+            for snapshot in free:  # buffers allocated while readers were busy
+                self.snapshots.remove(snapshot)
+        else:
+            target = Snapshot(heart.data.shape, self.palette)
+            self.snapshots.append(target)
+
+        if target.generation < 0:
+            target.buffer[:] = heart.data
+        else:
+            for x, y, w, h in heart.dirty_rects(target.generation):
+                target.buffer[y : y + h, x : x + w] = heart.data[y : y + h, x : x + w]
+        target.generation = heart.generation
+        self.current = target
+        return target
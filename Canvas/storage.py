@@ -0,0 +1,125 @@
+import time
+from pathlib import Path
+
+import numpy as np
+
+from Misc.utils import logger
+
+MAGIC = b"PIXFRAME"
+VERSION = 1
+HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("height", "<u4"),
+        ("width", "<u4"),
+        ("channels", "<u4"),
+        ("generation", "<u8"),
+        ("timestamp", "<f8"),
+        ("clean", "u1"),
+    ]
+)
+DATA_OFFSET = 4096  # page aligned, so the data can be mapped independently
+
+
+class CanvasStorage:
+    """
+    A file backed canvas array (np.memmap) that is persisted by the page cache
+    Structure of the file:
+        Bytes 0-4095: Header (magic, version, dimensions, generation and
+                      timestamp of the last checkpoint, clean shutdown flag)
+        Bytes 4096-:  The canvas array (height, width, channels)
+    A checkpoint first syncs the data and then the header, so the header never
+    claims a generation that isn't on the disk yet.
+    Attributes:
+        path (Path): The path of the file
+        header (np.memmap): The header
+        data (np.memmap): The canvas array
+        restored (bool): If the file contained a canvas with matching dimensions
+    """
+
+    path: Path
+    header: np.memmap
+    data: np.memmap
+    restored: bool
+
+    def __init__(self, path: str | Path, shape: tuple[int, int, int]):
+        self.path = Path(path).resolve()
+        self.restored = self.validate(shape)
+        if not self.restored:
+            self.create(shape)
+        self.header = np.memmap(self.path, dtype=HEADER, mode="r+", shape=())
+        self.data = np.memmap(
+            self.path, dtype=np.uint8, mode="r+", offset=DATA_OFFSET, shape=shape
+        )
+        if self.restored:
+            logger.info(
+                f"Restored canvas from {self.path} (generation {self.generation}, "
+                f"checkpoint {time.ctime(float(self.header['timestamp']))}, "
+                f"{'clean' if self.header['clean'] else 'unclean'} shutdown)"
+            )
+        self.header["clean"] = 0
+        self.header.flush()
+
+    @property
+    def generation(self) -> int:
+        """The generation of the last checkpoint"""
+        return int(self.header["generation"])
+
+    def validate(self, shape: tuple[int, int, int]) -> bool:
+        """
+        Checks if the file exists and contains a canvas with the given shape
+        """
+        if not self.path.exists():
+            return False
+        if self.path.stat().st_size != DATA_OFFSET + int(np.prod(shape)):
+            logger.warning(f"Ignoring {self.path}: The canvas size doesn't match")
+            return False
+        header = np.fromfile(self.path, dtype=HEADER, count=1)[0]
+        if (
+            header["magic"] != MAGIC
+            or header["version"] != VERSION
+            or (header["height"], header["width"], header["channels"]) != shape
+        ):
+            logger.warning(f"Ignoring {self.path}: Invalid header")
+            return False
+        return True
+
+    def create(self, shape: tuple[int, int, int]) -> None:
+        """
+        Creates a new (sparse) file for a canvas with the given shape
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        header = np.zeros((), dtype=HEADER)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["height"], header["width"], header["channels"] = shape
+        header["timestamp"] = time.time()
+        with open(self.path, "wb") as f:
+            f.write(header.tobytes())
+            f.truncate(DATA_OFFSET + int(np.prod(shape)))
+
+    def flush(self) -> None:
+        """
+        Syncs the canvas array to the disk (msync), can be called from a worker thread
+        """
+        self.data.flush()
+
+    def checkpoint(self, generation: int, clean: bool = False) -> None:
+        """
+        Marks the synced canvas as consistent with the given generation
+        Args:
+            generation (int): The generation of the synced canvas
+            clean (bool): If the process is shutting down
+        """
+        self.header["generation"] = generation
+        self.header["timestamp"] = time.time()
+        self.header["clean"] = int(clean)
+        self.header.flush()
+
+    def close(self, generation: int) -> None:
+        """
+        Syncs everything and marks the file as cleanly closed
+        """
+        self.flush()
+        self.checkpoint(generation, clean=True)
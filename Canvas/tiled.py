@@ -0,0 +1,645 @@
+import weakref
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from Canvas.heart import Heart, blend, overlap, paste_region, pixel_list, read_stamps
+from Canvas.palette import Palette
+from Canvas.snapshot import Snapshot
+from Canvas.storage import CanvasStorage
+from Config.config import Config
+from Misc.errors import IncorrectBackupSize
+from Misc.utils import hex_to_rgb, logger
+
+
+class TiledArray:
+    """
+    A view of a tiled canvas array (see TiledHeart)
+    Slicing a region (e.g. data[y : y + h, x : x + w, :3]) assembles a dense
+    array from the tiles, untouched tiles are filled with the background.
+    Pixels given as coordinate arrays (data[ys, xs]) are looked up in their tiles.
+    The views of the snapshots never change, the heart copies their tiles on write.
+    An array loaded from a sparse backup (load) isn't shared, the deltas and the
+    journal are applied to its tiles (put, blend_pixels) without a dense copy.
+    Attributes:
+        pool (np.ndarray): The allocated tiles, shape (n, tile_size, tile_size, 7)
+        index (np.ndarray): The slot in the pool of every tile (-1 if untouched)
+        tile_size (int): The width and height of a tile
+        shape (tuple[int, int, int]): The shape of the canvas array
+        background (np.ndarray): The value of the untouched pixels
+    """
+
+    pool: np.ndarray
+    index: np.ndarray
+    tile_size: int
+    shape: tuple[int, int, int]
+    background: np.ndarray
+    dtype = np.dtype(np.uint8)
+    ndim: int = 3
+
+    def __init__(
+        self,
+        pool: np.ndarray,
+        index: np.ndarray,
+        tile_size: int,
+        shape: tuple[int, int, int],
+        background: np.ndarray,
+    ):
+        self.pool = pool
+        self.index = index
+        self.tile_size = tile_size
+        self.shape = shape
+        self.background = background
+
+    def __getitem__(self, key) -> np.ndarray:
+        if not isinstance(key, tuple):
+            key = (key,)
+        rows, cols, *channels = key + (slice(None),) * (2 - len(key))
+        if isinstance(rows, int) and isinstance(cols, int):
+            return self.pixel(cols, rows)[tuple(channels)]
+        if isinstance(rows, np.ndarray) and isinstance(cols, np.ndarray):
+            return self.pixels(cols, rows)[(slice(None), *channels)]
+        if not isinstance(rows, slice) or not isinstance(cols, slice):
+            raise TypeError("Only regions (slices) and pixels can be read")
+        y, end_y, step_y = rows.indices(self.shape[0])
+        x, end_x, step_x = cols.indices(self.shape[1])
+        if step_y != 1 or step_x != 1:
+            raise TypeError("Regions can't be read with steps")
+        if len(channels) == 1 and isinstance(channels[0], slice):
+            return self.region(x, y, end_x - x, end_y - y, channels[0])
+        region = self.region(x, y, end_x - x, end_y - y)
+        return region[(slice(None), slice(None), *channels)]
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        data = self[:, :]
+        return data if dtype is None else data.astype(dtype)
+
+    def pixel(self, x: int, y: int) -> np.ndarray:
+        """
+        Returns the value of a single pixel
+        """
+        size = self.tile_size
+        slot = self.index[y // size, x // size]
+        if slot < 0:
+            return self.background.copy()
+        return self.pool[slot, y % size, x % size].copy()
+
+    def pixels(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        Returns the values of the given pixels, only their tiles are read
+        Returns:
+            The values, shape (n, channels)
+        """
+        size = self.tile_size
+        slots = self.index[ys // size, xs // size]
+        values = np.empty((len(xs), self.shape[2]), dtype=np.uint8)
+        values[:] = self.background
+        touched = slots >= 0
+        values[touched] = self.pool[
+            slots[touched], ys[touched] % size, xs[touched] % size
+        ]
+        return values
+
+    def region(
+        self, x: int, y: int, w: int, h: int, channels: slice = slice(None)
+    ) -> np.ndarray:
+        """
+        Assembles a region from the tiles, only the touched tiles are copied
+        Returns:
+            A dense array of shape (h, w, channels)
+        """
+        background = self.background[channels]
+        region = np.empty((max(h, 0), max(w, 0), len(background)), dtype=np.uint8)
+        if w <= 0 or h <= 0:
+            return region
+        region[:] = background
+        size = self.tile_size
+        ty, tx = y // size, x // size
+        slots = self.index[ty : (y + h - 1) // size + 1, tx : (x + w - 1) // size + 1]
+        for row, col in zip(*np.nonzero(slots >= 0)):
+            paste_region(
+                region,
+                self.pool[slots[row, col], :, :, channels],
+                (tx + col) * size - x,
+                (ty + row) * size - y,
+            )
+        return region
+
+    def tiles(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the touched tiles
+        Returns:
+            The tile coordinates y and x and the tiles, shape (n, tile_size, tile_size, 7)
+        """
+        ty, tx = np.nonzero(self.index >= 0)
+        return ty, tx, self.pool[self.index[ty, tx]]
+
+    def copy(self) -> "TiledArray":
+        """
+        Returns a copy holding only the touched tiles, it can be written to (see load)
+        """
+        ty, tx, tiles = self.tiles()
+        index = np.full(self.index.shape, -1, np.int64)
+        index[ty, tx] = np.arange(len(tiles))
+        return TiledArray(tiles, index, self.tile_size, self.shape, self.background)
+
+    def save(self, path: Path) -> None:
+        """
+        Saves the touched tiles as .npz (a sparse full backup)
+        """
+        ty, tx, tiles = self.tiles()
+        np.savez(
+            path,
+            shape=np.array(self.shape),
+            tile_size=np.array(self.tile_size),
+            background=self.background,
+            ty=ty,
+            tx=tx,
+            tiles=tiles,
+        )
+
+    @staticmethod
+    def load(path: Path) -> "TiledArray":
+        """
+        Loads the tiles saved by save, only the saved tiles are held in memory
+        """
+        with np.load(path) as saved:
+            height, width, channels = saved["shape"].tolist()
+            size = int(saved["tile_size"])
+            tiles = saved["tiles"]
+            index = np.full((-(-height // size), -(-width // size)), -1, np.int64)
+            index[saved["ty"], saved["tx"]] = np.arange(len(tiles))
+            background = saved["background"]
+        return TiledArray(tiles, index, size, (height, width, channels), background)
+
+    def allocate(self, ty: np.ndarray, tx: np.ndarray) -> np.ndarray:
+        """
+        Returns the slots of tiles for writing, untouched tiles are appended to the pool
+        Only for arrays that aren't shared (see load), the views of the heart never change.
+        Args:
+            ty (np.ndarray): Tile coordinates y
+            tx (np.ndarray): Tile coordinates x
+
+        Returns:
+            The slot of every given tile
+        """
+        slots = self.index[ty, tx]
+        untouched = slots < 0
+        if not untouched.any():
+            return slots
+        keys = np.unique(ty[untouched] * self.index.shape[1] + tx[untouched])
+        tiles = np.empty((len(keys),) + self.pool.shape[1:], dtype=np.uint8)
+        tiles[:] = self.background
+        start = len(self.pool)
+        self.pool = np.concatenate([self.pool, tiles])
+        self.index[np.divmod(keys, self.index.shape[1])] = np.arange(
+            start, start + len(keys)
+        )
+        return self.index[ty, tx]
+
+    def put(self, index: np.ndarray, values: np.ndarray) -> None:
+        """
+        Writes pixels by their flat index (y * width + x), e.g. the pixels of a delta backup
+        """
+        ys, xs = np.divmod(index.astype(np.int64), self.shape[1])
+        size = self.tile_size
+        slots = self.allocate(ys // size, xs // size)
+        self.pool[slots, ys % size, xs % size] = values
+
+    def blend_pixels(
+        self,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        colors: np.ndarray,
+        stamp: np.ndarray,
+        palette: Palette | None = None,
+    ) -> None:
+        """
+        Blends a batch of RGBA writes onto the tiles, in the order they are given (see blend)
+        With a palette the blended colors are mapped to it.
+        """
+        size = self.tile_size
+        slots = self.allocate(ys // size, xs // size)
+        rows = self.pool.reshape(-1, size, self.pool.shape[3])
+        snap = palette.snap if palette else None
+        blend(rows, xs % size, slots * size + ys % size, colors, stamp, snap)
+
+    def fit(self, shape: tuple[int, int, int]) -> "TiledArray":
+        """
+        Returns the array cut off or padded to a shape at the right and the bottom (see fit)
+        The tiles are shared, so the array mustn't be used afterwards.
+        """
+        if shape == self.shape:
+            return self
+        size = self.tile_size
+        height, width = shape[:2]
+        index = np.full((-(-height // size), -(-width // size)), -1, np.int64)
+        paste_region(index[:, :, None], self.index[:, :, None])
+        # the edge tiles keep the pixels outside of a smaller array
+        edge = index[-1][index[-1] >= 0]
+        if height % size:
+            self.pool[edge, height % size :] = self.background
+        edge = index[:, -1][index[:, -1] >= 0]
+        if width % size:
+            self.pool[edge, :, width % size :] = self.background
+        return TiledArray(self.pool, index, size, shape, self.background)
+
+
+class TiledSnapshot(Snapshot):
+    """
+    A snapshot of a TiledHeart, the data is a TiledArray sharing the tiles with the heart
+    """
+
+    data: TiledArray
+
+    def __init__(self, data: TiledArray, generation: int):
+        self.generation = generation
+        self.refs = 0
+        self.data = data
+        self.palette = None
+
+
+class TiledSnapshotPool:
+    """
+    The published snapshots of a TiledHeart (same interface as SnapshotPool)
+    Publishing only copies the tile index, the heart copies a tile on its next write instead.
+    Attributes:
+        current (TiledSnapshot): The latest published snapshot
+    """
+
+    current: TiledSnapshot
+
+    def __init__(self, heart: "TiledHeart"):
+        self.current = TiledSnapshot(heart.freeze(), -1)
+
+    def acquire(self) -> TiledSnapshot:
+        """
+        Returns the current snapshot, it has to be released after use
+        """
+        return self.current.acquire()
+
+    def publish(self, heart: "TiledHeart") -> TiledSnapshot:
+        """
+        Publishes the current state of the heart (call at tick boundaries)
+        """
+        if self.current.generation != heart.generation:
+            # the previous snapshot is released first, so its tiles can be reused if no reader holds it
+            self.current = None
+            self.current = TiledSnapshot(heart.freeze(), heart.generation)
+        return self.current
+
+
+class TiledHeart(Heart):
+    """
+    A heart for very large, sparse canvases (visuals.sparse)
+    The canvas is split into tiles (tile_size), a tile is allocated in the pool on
+    its first write and untouched tiles read as the background color. Memory and
+    full scans (pixel_since, backups) scale with the touched tiles, not the canvas.
+    Snapshots share the tiles with the heart: publishing freezes the tiles and a
+    frozen tile is copied before it is written again (copy-on-write). Free slots
+    of the pool (no longer used by the heart or a living view) are reused.
+    With a palette the tiles still hold RGB, but every color is mapped to the palette
+    and untouched pixels have its first color, so the canvas matches a PaletteHeart
+    (pixel_since returns the indices as well).
+    Attributes:
+        table (Palette | None): The palette of the canvas (visuals.palette)
+        pool (np.ndarray): The allocated tiles, shape (n, tile_size, tile_size, 7)
+        index (np.ndarray): The slot in the pool of every tile (-1 if untouched)
+        background (np.ndarray): The value of the untouched pixels (color, generation 0)
+        frozen (np.ndarray): The slots shared with a view, by slot
+        free (np.ndarray): The slots that can be reused
+        views (weakref.WeakSet): The living views of the snapshots
+        shape (tuple[int, int, int]): The shape of the canvas array
+    """
+
+    table: Palette | None
+    pool: np.ndarray
+    index: np.ndarray
+    background: np.ndarray
+    frozen: np.ndarray
+    free: np.ndarray
+    views: weakref.WeakSet
+    shape: tuple[int, int, int]
+
+    def __init__(self, config: Config, palette: Palette | None = None):
+        self.config = config
+        self.table = palette
+        if self.config.persistence.enabled:
+            logger.warning(
+                "The sparse canvas isn't persisted, the backups are used to restore it"
+            )
+        self.storage = None
+        self.restored = False
+        self.generation = 0
+        self.background = np.zeros(7, dtype=np.uint8)
+        if palette is not None:
+            self.background[:3] = palette.colors[0]
+        else:
+            self.background[:3] = hex_to_rgb(self.config.visuals.sparse.background)
+        self.shape = (
+            self.config.visuals.size.height,
+            self.config.visuals.size.width,
+            7,
+        )
+        self.index = self.create_tiles().astype(np.int64) - 1
+        self.pool = np.empty((1, self.tile_size, self.tile_size, 7), dtype=np.uint8)
+        self.frozen = np.zeros(1, dtype=bool)
+        self.free = np.arange(1)
+        self.views = weakref.WeakSet()
+
+        self.tiles = self.create_tiles()
+        self.snapshots = TiledSnapshotPool(self)
+        self.publish()
+
+    @property
+    def data(self) -> TiledArray:
+        """The live canvas, it is only consistent within a tick (see snapshot)"""
+        return TiledArray(
+            self.pool, self.index, self.tile_size, self.shape, self.background
+        )
+
+    def create_tiles(self) -> np.ndarray:
+        """
+        Returns the (unchanged) tiles covering the canvas
+        """
+        return np.zeros(
+            (
+                -(-self.shape[0] // self.tile_size),
+                -(-self.shape[1] // self.tile_size),
+            ),
+            dtype=np.uint64,
+        )
+
+    def freeze(self) -> TiledArray:
+        """
+        Returns a view of the current tiles that never changes and recomputes the free slots
+        """
+        view = TiledArray(
+            self.pool, self.index.copy(), self.tile_size, self.shape, self.background
+        )
+        self.views.add(view)
+        self.frozen = np.zeros(len(self.pool), dtype=bool)
+        for other in self.views:
+            if other.pool is self.pool:
+                self.frozen[other.index[other.index >= 0]] = True
+        used = self.frozen.copy()
+        used[self.index[self.index >= 0]] = True
+        self.free = np.flatnonzero(~used)
+        return view
+
+    def allocate(self, count: int) -> np.ndarray:
+        """
+        Returns free slots of the pool, the pool grows (doubles) if there are not enough
+        A grown pool isn't shared with the views, they keep the old one.
+        """
+        if len(self.free) < count:
+            size = len(self.pool)
+            used = size - len(self.free)
+            capacity = max(2 * size, used + count)
+            pool = np.empty((capacity,) + self.pool.shape[1:], dtype=np.uint8)
+            pool[:size] = self.pool
+            self.pool = pool
+            self.frozen = np.zeros(capacity, dtype=bool)
+            self.free = np.r_[self.free, np.arange(size, capacity)]
+        slots, self.free = self.free[:count], self.free[count:]
+        return slots
+
+    def writable(self, ty: np.ndarray, tx: np.ndarray) -> np.ndarray:
+        """
+        Returns the slots of tiles for writing, untouched tiles are allocated and
+        frozen tiles are copied (copy-on-write)
+        Args:
+            ty (np.ndarray): Tile coordinates y
+            tx (np.ndarray): Tile coordinates x
+
+        Returns:
+            The slot of every given tile
+        """
+        slots = self.index[ty, tx]
+        stale = (slots < 0) | self.frozen[slots]
+        if not stale.any():
+            return slots
+        keys = np.unique(ty[stale] * self.index.shape[1] + tx[stale])
+        kty, ktx = np.divmod(keys, self.index.shape[1])
+        old = self.index[kty, ktx]
+        new = self.allocate(len(keys))
+        untouched = old < 0
+        self.pool[new[untouched]] = self.background
+        self.pool[new[~untouched]] = self.pool[old[~untouched]]
+        self.index[kty, ktx] = new
+        return self.index[ty, tx]
+
+    def write_region(self, x: int, y: int, region: np.ndarray) -> None:
+        """
+        Writes a dense region (h, w, c) at x, y into the tiles (the first c channels)
+        """
+        size = self.tile_size
+        h, w = region.shape[:2]
+        rows = np.arange(y // size, (y + h - 1) // size + 1)
+        cols = np.arange(x // size, (x + w - 1) // size + 1)
+        ty, tx = (a.ravel() for a in np.meshgrid(rows, cols, indexing="ij"))
+        slots = self.writable(ty, tx)
+        channels = region.shape[2]
+        for row, col, slot in zip(ty.tolist(), tx.tolist(), slots.tolist()):
+            paste_region(
+                self.pool[slot, :, :, :channels], region, x - col * size, y - row * size
+            )
+
+    def resize(self, width: int, height: int) -> None:
+        """
+        Resizes the canvas, only the tile index is copied
+        The parts of the edge tiles outside of a smaller canvas are reset to the background
+        """
+        index = np.full(
+            (-(-height // self.tile_size), -(-width // self.tile_size)), -1, np.int64
+        )
+        paste_region(index[:, :, None], self.index[:, :, None])
+        self.index = index
+        old_height, old_width = self.shape[:2]
+        self.shape = (height, width, self.shape[2])
+        size = self.tile_size
+        if height < old_height and height % size:
+            ty = np.full(index.shape[1], index.shape[0] - 1)
+            tx = np.arange(index.shape[1])
+            touched = index[ty, tx] >= 0
+            slots = self.writable(ty[touched], tx[touched])
+            self.pool[slots, height % size :] = self.background
+        if width < old_width and width % size:
+            ty = np.arange(index.shape[0])
+            tx = np.full(index.shape[0], index.shape[1] - 1)
+            touched = index[ty, tx] >= 0
+            slots = self.writable(ty[touched], tx[touched])
+            self.pool[slots, :, width % size :] = self.background
+        self.tiles = self.create_tiles()
+        self.touch()
+        self.publish()
+
+    def update_pixel(self, x: int, y: int, value: tuple[int, int, int]) -> None:
+        self.blend_pixels(
+            np.array([x]), np.array([y]), np.array([(*value, 0xFF)], dtype=np.uint8)
+        )
+
+    def blend_pixels(self, xs: np.ndarray, ys: np.ndarray, colors: np.ndarray) -> None:
+        """
+        Blends a batch of RGBA writes onto the tiles, in the order they are given
+        The pool is addressed as one array (slot * tile_size + y, x), so the writes
+        of all tiles are blended at once.
+        """
+        if len(xs) == 0:
+            return
+        size = self.tile_size
+        slots = self.writable(ys // size, xs // size)
+        rows = self.pool.reshape(-1, size, self.pool.shape[3])
+        self.touch(xs, ys)
+        snap = self.table.snap if self.table else None
+        blend(rows, xs % size, slots * size + ys % size, colors, self.stamp, snap)
+
+    def colors_at(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        return self.data.pixels(xs, ys)[:, :3]
+
+    def get_pixel_color(self, x: int, y: int) -> tuple:
+        return tuple(self.data.pixel(x, y)[:3].tolist())
+
+    def snap(self, colors: np.ndarray) -> np.ndarray:
+        """
+        Maps RGB values (..., 3) to the nearest palette colors, they are returned unchanged without a palette
+        """
+        if self.table is None:
+            return colors
+        return self.table.snap(colors.reshape(-1, 3)).reshape(colors.shape)
+
+    def pixel_since(self, since: int) -> tuple[int, list[tuple[int, int, str | int]]]:
+        """
+        Returns all pixels that were modified after the given generation, only the touched tiles are scanned
+        With a palette the colors are returned as their index (see Heart.pixel_since)
+        """
+        with self.snapshot() as snapshot:
+            generation = snapshot.generation
+            ty, tx, tiles = snapshot.data.tiles()
+        n, iy, ix = np.nonzero(read_stamps(tiles) > since)
+        size = self.tile_size
+        colors = tiles[n, iy, ix, :3]
+        if self.table is not None:
+            colors = self.table.quantize(colors)
+        return generation, pixel_list(tx[n] * size + ix, ty[n] * size + iy, colors)
+
+    def restore_from_image(self, image: Image) -> None:
+        if image.size != self.shape[1::-1]:
+            raise IncorrectBackupSize()
+        # without stamps every pixel counts as written, they are restamped
+        self.fill(np.asarray(image.convert("RGB")), restamp=True)
+
+    def restore_from_array(self, array: np.ndarray | TiledArray) -> None:
+        """
+        Restores the canvas from an array, the written pixels get a new generation
+        The tiles of a sparse array (e.g. a sparse backup) with the same tiles and background
+        are taken over directly, other arrays are split into tiles row by row.
+        """
+        if array.shape != self.shape:
+            raise IncorrectBackupSize()
+        if (
+            isinstance(array, TiledArray)
+            and array.tile_size == self.tile_size
+            and np.array_equal(array.background, self.background)
+        ):
+            ty, tx, tiles = array.tiles()
+            self.replace(ty, tx, tiles, restamp=True)
+        else:
+            self.fill(array, restamp=True)
+
+    def fill(self, array: np.ndarray | TiledArray, restamp: bool = False) -> None:
+        """
+        Replaces the tiles by a dense array, only the tiles that differ from the background
+        are kept. The array is read one row of tiles at a time, so a mapped file (e.g. the
+        storage) is never copied as a whole.
+        Args:
+            array (np.ndarray | TiledArray): The canvas array, an array with only the color channels counts as written everywhere
+            restamp (bool): If the written pixels get the new generation instead of their stamps
+        """
+        size = self.tile_size
+        rows, cols = self.index.shape
+        height, width, channels = self.shape
+        band = np.empty((size, cols * size, channels), dtype=np.uint8)
+        found = []
+        for row in range(rows):
+            part = array[row * size : min((row + 1) * size, height), :width]
+            band[:] = self.background
+            band[: len(part), :width, : part.shape[2]] = part
+            if part.shape[2] < channels:
+                band[: len(part), :width, part.shape[2] :] = 0xFF
+            blocks = band.reshape(size, cols, size, channels).swapaxes(0, 1)
+            touched = np.flatnonzero(np.any(blocks != self.background, axis=(1, 2, 3)))
+            found.append((np.full(len(touched), row), touched, blocks[touched]))
+        ty, tx, tiles = (np.concatenate(parts) for parts in zip(*found))
+        self.replace(ty, tx, tiles, restamp)
+
+    def replace(
+        self, ty: np.ndarray, tx: np.ndarray, tiles: np.ndarray, restamp: bool = False
+    ) -> None:
+        """
+        Replaces all tiles by the given ones, the other tiles become untouched
+        Only the tiles touched before or after are marked as changed.
+        Args:
+            ty (np.ndarray): Tile coordinates y
+            tx (np.ndarray): Tile coordinates x
+            tiles (np.ndarray): The tiles (changed if restamped or mapped to the palette), shape (n, tile_size, tile_size, 7)
+            restamp (bool): If the written pixels get the new generation instead of their stamps
+        """
+        changed = self.index >= 0
+        changed[ty, tx] = True
+        self.index[:] = -1
+        self.free = np.flatnonzero(~self.frozen)
+        slots = self.writable(ty, tx)
+        self.generation += 1
+        if restamp:
+            stamps = tiles[..., 3:]
+            stamps[stamps.any(axis=-1)] = self.stamp
+        tiles[..., :3] = self.snap(tiles[..., :3])
+        self.pool[slots] = tiles
+        self.tiles[changed] = self.generation
+
+    def paste(
+        self, array: np.ndarray, x: int, y: int
+    ) -> tuple[int, int, int, int] | None:
+        found = overlap(self.shape, array.shape, x, y)
+        if found is None:
+            return None
+        rx, ry, w, h, sx, sy = found
+        pasted = np.empty((h, w, self.shape[2]), dtype=np.uint8)
+        pasted[:, :, :3] = self.snap(array[sy : sy + h, sx : sx + w, :3])
+        self.touch_rect(rx, ry, w, h)
+        pasted[:, :, 3:] = self.stamp
+        self.write_region(rx, ry, pasted)
+        return rx, ry, w, h
+
+    def save_to_storage(self, path: Path) -> None:
+        """
+        Writes the canvas to a file in the format of CanvasStorage, tile by tile
+        """
+        storage = CanvasStorage(path, self.shape)
+        if self.background.any():
+            storage.data[:] = self.background
+        size = self.tile_size
+        ty, tx, tiles = self.data.tiles()
+        for row, col, tile in zip(ty.tolist(), tx.tolist(), tiles):
+            paste_region(storage.data, tile, col * size, row * size)
+        storage.close(self.generation)
+
+    def restore_from_storage(self, path: Path) -> bool:
+        storage = CanvasStorage(path, self.shape)
+        if not storage.restored:
+            return False
+        self.fill(storage.data)
+        self.restored = True
+        self.generation = storage.generation
+        self.resume()
+        return True
+
+    def resume(self) -> None:
+        latest = int(read_stamps(self.data.tiles()[2]).max(initial=0))
+        self.generation = max(self.generation, latest)
+        self.touch()
+
+    def get_raw_array(self) -> TiledArray:
+        return self.data
@@ -13,6 +13,7 @@ class Client:
         last_update (float): The last update of a pixel
         ip (str): The IP address of the client
         god (bool): If the client has godmode allowed (more features)
+        id (int): The id of the client, stored as owner of its pixels (see Manager.ids)
     """
 
     config: Config
@@ -20,10 +21,12 @@ class Client:
     last_update: float
     ip: str
     god: bool
+    id: int
 
-    def __init__(self, config: Config, ip: str):
+    def __init__(self, config: Config, ip: str, client_id: int = 0):
         self.config = config
         self.ip = ip
+        self.id = client_id
         self.connected = False
         self.last_update = 0
         self.god = False
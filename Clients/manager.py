@@ -1,5 +1,8 @@
 from Clients.clients import Client
 from Config.config import Config
+from Misc.utils import logger
+
+MAX_CLIENT_ID = 0xFFFF
 
 
 class Manager:
@@ -8,14 +11,23 @@ class Manager:
     Attributes:
         config (Config): The configuration
         clients (dict): A dictionary with all the clients that ever connected to the server
+        ids (dict[str, int]): The id of every client ip (see Attribution), stable within the session
+        ips (list[str]): The ip of every client id, id 0 stands for writes without a client (e.g. admin)
+        exhausted (bool): If all ids are taken (the warning is only logged once)
     """
 
     config: Config | None
     clients: dict[str, Client]
+    ids: dict[str, int]
+    ips: list[str]
+    exhausted: bool
 
     def __init__(self):
         self.config = None
         self.clients = {}
+        self.ids = {}
+        self.ips = [""]
+        self.exhausted = False
 
     def set_config(self, config: Config):
         """
@@ -27,10 +39,45 @@ class Manager:
         """
         Adds a new client
         """
-        client = Client(self.config, ip)
+        client = Client(self.config, ip, self.client_id(ip))
         self.clients[str(client)] = client
         return client
 
+    def client_id(self, ip: str) -> int:
+        """
+        Returns the id of a client ip, a new ip gets the next id (0 once all ids are taken)
+        """
+        client_id = self.ids.get(ip)
+        if client_id is None:
+            if len(self.ips) > MAX_CLIENT_ID:
+                if not self.exhausted:
+                    logger.warning(
+                        "All client ids are taken, new clients are anonymous"
+                    )
+                    self.exhausted = True
+                return 0
+            client_id = self.ids[ip] = len(self.ips)
+            self.ips.append(ip)
+        return client_id
+
+    def client_ip(self, client_id: int) -> str | None:
+        """
+        Returns the ip of a client id (None if unknown)
+        """
+        if 0 < client_id < len(self.ips) and self.ips[client_id]:
+            return self.ips[client_id]
+        return None
+
+    def restore_ids(self, ips: list[str]) -> None:
+        """
+        Restores the client ids of the previous process (hot restart)
+        """
+        self.ips = list(ips[: MAX_CLIENT_ID + 1]) or [""]
+        self.exhausted = False
+        self.ids = {ip: client_id for client_id, ip in enumerate(self.ips) if ip}
+        for ip, client in self.clients.items():
+            client.id = self.client_id(ip)
+
     def ensure_client(self, ip: str):
         """
         Ensures a client exists
@@ -1,7 +1,9 @@
 import json
 import logging
+import os
 import time
 from json import JSONDecodeError
+from typing import Callable
 
 from Misc.errors import MalformedConfigError, NoConfigError
 from Misc.utils import NoFrontendException, confirm, logger
@@ -16,13 +18,43 @@ class General(object):
         self.version = version
 
 
+class Headless:
+    """
+    Renders the display without a window and streams it as MJPEG
+    Attributes:
+        enabled (bool): If the display should run headless
+        stream (bool): If the frames are served via HTTP on connection.ports.stream
+        sink (str | None): A file or named pipe the frames are appended to
+        quality (int): The JPEG quality of the frames (1-100)
+    """
+
+    enabled: bool
+    stream: bool
+    sink: str | None
+    quality: int
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        stream: bool = True,
+        sink: str | None = None,
+        quality: int = 80,
+    ):
+        self.enabled = enabled
+        self.stream = stream
+        self.sink = sink
+        self.quality = quality
+
+
 class Display:
     enabled: bool
     fps: int
+    headless: Headless
 
-    def __init__(self, enabled: bool, fps: int):
+    def __init__(self, enabled: bool, fps: int, headless: dict = None):
         self.enabled = enabled
         self.fps = fps
+        self.headless = Headless(**(headless or {}))
         if self.fps > 10:
             logger.warn("Display FPS > 10 can result in major performance problems!")
             time.sleep(0.1)  # To make sure logger message was sent
@@ -72,10 +104,12 @@ class Frontend:
 class Ports:
     socket: int
     api: int
+    stream: int
 
-    def __init__(self, socket: int, api: int):
+    def __init__(self, socket: int, api: int, stream: int = 8081):
         self.socket = socket
         self.api = api
+        self.stream = stream
 
 
 class Connection(object):
@@ -110,13 +144,83 @@ class StatsBar:
         self.size = size
 
 
+class Sparse(object):
+    """
+    Sparse Canvas Config (for very large canvases)
+    Attributes:
+        enabled (bool): If the canvas is stored in tiles that are allocated on the first write
+        background (str): The color of the untouched tiles (hex), with visuals.palette its first color is used
+    """
+
+    enabled: bool
+    background: str
+
+    def __init__(self, enabled: bool = False, background: str = "000000"):
+        self.enabled = enabled
+        self.background = background
+
+
+PLACE_COLORS = [
+    "FFFFFF",
+    "E4E4E4",
+    "888888",
+    "222222",
+    "FFA7D1",
+    "E50000",
+    "E59500",
+    "A06A42",
+    "E5D900",
+    "94E044",
+    "02BE01",
+    "00D3DD",
+    "0083C7",
+    "0000EA",
+    "CF6EE4",
+    "820080",
+]
+
+
+class ColorPalette(object):
+    """
+    Palette Config (the canvas only holds a fixed set of colors)
+    Attributes:
+        enabled (bool): If the canvas stores palette indices (1 Byte) instead of RGB
+        colors (list[str]): The colors of the palette (hex, at most 256)
+        quantize (bool): If other colors are replaced by the nearest palette color, rejected otherwise
+    """
+
+    enabled: bool
+    colors: list[str]
+    quantize: bool
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        colors: list[str] | None = None,
+        quantize: bool = True,
+    ):
+        self.enabled = enabled
+        self.colors = colors or PLACE_COLORS
+        self.quantize = quantize
+
+
 class Visuals(object):
     size: Size
     statsbar: StatsBar
-
-    def __init__(self, size: dict, statsbar: dict):
+    sparse: Sparse
+    palette: ColorPalette
+
+    def __init__(
+        self,
+        size: dict,
+        statsbar: dict,
+        sparse: dict | None = None,
+        palette: dict | None = None,
+    ):
         self.size = Size(**size)
         self.statsbar = StatsBar(**statsbar)
+        self.sparse = Sparse(**(sparse or {}))
+        self.palette = ColorPalette(**(palette or {}))
 
 
 class Godmode(object):
@@ -137,17 +241,150 @@ class Game(object):
         self.godmode = Godmode(**godmode)
 
 
+class Journal(object):
+    """
+    Journal Config (write-ahead log of all applied pixels)
+    Attributes:
+        enabled (bool): If the pixels are logged
+        segment_size (int | float): The size in MB after which a new segment is started
+    """
+
+    enabled: bool
+    segment_size: int | float
+
+    def __init__(self, enabled: bool = False, segment_size: int | float = 64):
+        self.enabled = enabled
+        self.segment_size = segment_size
+
+
 class Backup(object):
+    """
+    Backup Config
+    Attributes:
+        enabled (bool): If backups are created
+        interval (int): The seconds between two backups
+        directory (str): The directory of the backups
+        delete (int): The number of full backups (with their deltas) to keep, 0 keeps all
+        keyframe (int): Every n-th backup is a full backup, the others only store changes
+        journal (Journal): The write-ahead log between the backups
+    """
+
     enabled: bool
     interval: int
     directory: str
     delete: int
-
-    def __init__(self, enabled: bool, interval: int, directory: str, delete: int):
+    keyframe: int
+    journal: Journal
+
+    def __init__(
+        self,
+        enabled: bool,
+        interval: int,
+        directory: str,
+        delete: int,
+        keyframe: int = 10,
+        journal: dict = None,
+    ):
         self.enabled = enabled
         self.interval = interval
         self.directory = directory
         self.delete = delete
+        self.keyframe = keyframe
+        self.journal = Journal(**(journal or {}))
+
+
+class Monitor(object):
+    """
+    Monitor Config (detects greenlets blocking the event loop)
+    Attributes:
+        enabled (bool): If the monitor is enabled
+        max_blocking_ms (int | float): A greenlet running longer without switching is reported
+        reports (int): The number of latest blocking reports kept for the metrics
+    """
+
+    enabled: bool
+    max_blocking_ms: int | float
+    reports: int
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_blocking_ms: int | float = 100,
+        reports: int = 10,
+    ):
+        self.enabled = enabled
+        self.max_blocking_ms = max_blocking_ms
+        self.reports = reports
+
+
+class Moderation(object):
+    """
+    Moderation Config
+    Attributes:
+        attribution (bool): If the owner (client) of every pixel is recorded, so the writes of a client can be reverted
+        protected (list[list[int]]): The regions [x, y, w, h] clients can't write to (e.g. sponsor logos)
+    """
+
+    attribution: bool
+    protected: list[list[int]]
+
+    def __init__(
+        self, attribution: bool = False, protected: list[list[int]] | None = None
+    ):
+        self.attribution = attribution
+        self.protected = protected or []
+
+
+class Persistence(object):
+    """
+    Persistence Config
+    Attributes:
+        enabled (bool): If the canvas is stored in a memory mapped file
+        file (str): The path of the file
+        interval (int | float): The seconds between two checkpoints (msync)
+    """
+
+    enabled: bool
+    file: str
+    interval: int | float
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        file: str = "Storage/canvas.bin",
+        interval: int | float = 5,
+    ):
+        self.enabled = enabled
+        self.file = file
+        self.interval = interval
+
+
+class Tick(object):
+    """
+    Tick Config (the canvas loop applying the queued pixels)
+    Attributes:
+        rate (int | float): The ticks per second
+        publish (int | float): The snapshots published per second (0 publishes every tick)
+        max_pixels (int): The pixels applied per tick at most, the rest is carried over (0 = unlimited)
+        max_ms (int | float): The milliseconds a tick may spend applying pixels (0 = unlimited)
+    """
+
+    rate: int | float
+    publish: int | float
+    max_pixels: int
+    max_ms: int | float
+
+    def __init__(
+        self,
+        rate: int | float = 30,
+        publish: int | float = 30,
+        max_pixels: int = 100000,
+        max_ms: int | float = 20,
+    ):
+        self.rate = rate
+        self.publish = publish
+        self.max_pixels = max_pixels
+        self.max_ms = max_ms
 
 
 class Logging(object):
@@ -180,27 +417,66 @@ class Logging(object):
             level = 0
         if level not in self._levelmapping:
             raise MalformedConfigError(
-                "config.json"
-                "logging.level must be between 0 (Debug) and 3 (Critical)"
+                "config.json" "logging.level must be between 0 (Debug) and 3 (Critical)"
             )
         self.level = level
         self.loglevel = self._levelmapping[level]
 
 
 class Timelapse(object):
+    """
+    Timelapse Config
+    Attributes:
+        enabled (bool): If the timelapse is recorded
+        interval (int): The seconds between two frames (frames are skipped if nothing changed)
+        directory (str): The directory of the videos
+        format (str): "mjpeg" or "mp4" (requires ffmpeg)
+        fps (int | float): The framerate of the video (mp4)
+        quality (int): The JPEG quality of the frames (mjpeg)
+    """
+
     enabled: bool
     interval: int
     directory: str
-
-    def __init__(self, enabled: bool, interval: int, directory: str):
+    format: str
+    fps: int | float
+    quality: int
+
+    def __init__(
+        self,
+        enabled: bool,
+        interval: int,
+        directory: str,
+        format: str = "mjpeg",
+        fps: int | float = 30,
+        quality: int = 90,
+    ):
         self.enabled = enabled
         self.interval = interval
         self.directory = directory
+        self.format = format
+        self.fps = fps
+        self.quality = quality
 
 
 class Config(object):
+    """
+    The configuration, loaded from a JSON file
+    Modules read the settings from the config when they need them, so a reload
+    takes effect immediately. Modules that derive state from the settings (e.g.
+    a sleeping loop) subscribe to get notified after a reload:
+        config.subscribe(lambda config, changed: ...)
+    Attributes:
+        config_file (str): The path of the JSON file
+        debug (bool): If started in debug mode
+        subscribers (list[Callable]): The callbacks notified after a reload
+        raw (dict): The content of the config file
+    """
+
     config_file: str
     debug: bool
+    subscribers: list[Callable[["Config", set[str]], None]]
+    raw: dict
 
     backup: Backup
     connection: Connection
@@ -208,12 +484,18 @@ class Config(object):
     game: Game
     general: General
     logging: Logging
+    monitor: Monitor
+    moderation: Moderation
+    persistence: Persistence
+    tick: Tick
     timelapse: Timelapse
     visuals: Visuals
 
     def __init__(self, config_file: str, debug: bool = False):
         self.config_file = config_file
         self.debug = debug
+        self.subscribers = []
+        self.raw = {}
         self.load_config()
         if self.debug:
             self.logging.level = 0
@@ -223,21 +505,70 @@ class Config(object):
             conf = json.load(f)
         return conf
 
-    def load_config(self):
+    def load_config(self) -> set[str]:
+        """
+        Loads the config file, the sections are only replaced if the whole file is valid
+        Returns:
+            The names of the sections that changed
+        """
         try:
             conf = self.read_config()
-            self.backup = Backup(**conf["backup"])
-            self.connection = Connection(**conf["connection"])
-            self.frontend = Frontend(**conf["frontend"])
-            self.general = General(**conf["general"])
-            self.game = Game(**conf["game"])
-            self.logging = Logging(**conf["logging"], debug=self.debug)
-            self.timelapse = Timelapse(**conf["timelapse"])
-            self.visuals = Visuals(**conf["visuals"])
+            sections = {
+                "backup": Backup(**conf["backup"]),
+                "connection": Connection(**conf["connection"]),
+                "frontend": Frontend(**conf["frontend"]),
+                "general": General(**conf["general"]),
+                "game": Game(**conf["game"]),
+                "logging": Logging(**conf["logging"], debug=self.debug),
+                "monitor": Monitor(**conf.get("monitor", {})),
+                "moderation": Moderation(**conf.get("moderation", {})),
+                "persistence": Persistence(**conf.get("persistence", {})),
+                "tick": Tick(**conf.get("tick", {})),
+                "timelapse": Timelapse(**conf["timelapse"]),
+                "visuals": Visuals(**conf["visuals"]),
+            }
         except FileNotFoundError as fe:
             raise NoConfigError(fe.filename)
+        except KeyError as ke:
+            raise MalformedConfigError(self.config_file, f"Missing section {ke}")
         except (TypeError, JSONDecodeError) as te:
             raise MalformedConfigError(te.args)
-
-    def reload(self):
-        self.load_config()
+        changed = {name for name in sections if conf.get(name) != self.raw.get(name)}
+        for name, section in sections.items():
+            setattr(self, name, section)
+        self.raw = conf
+        return changed
+
+    def save(self) -> None:
+        """
+        Writes the raw config back to the config file (e.g. after the canvas was resized)
+        The file is replaced at once, so a crash never leaves a partial config
+        """
+        temp = f"{self.config_file}.tmp"
+        with open(temp, "w") as f:
+            json.dump(self.raw, f, indent=2)
+            f.write("\n")
+        os.replace(temp, self.config_file)
+
+    def subscribe(self, callback: Callable[["Config", set[str]], None]) -> None:
+        """
+        Registers a callback that is called with the config and the names of the changed sections after every reload
+        """
+        self.subscribers.append(callback)
+
+    def reload(self) -> set[str]:
+        """
+        Reloads the config file and notifies the subscribers
+        Returns:
+            The names of the sections that changed
+        """
+        changed = self.load_config()
+        logger.info(
+            f"Reloaded config from {self.config_file}, changed: {', '.join(sorted(changed)) or 'nothing'}"
+        )
+        for callback in self.subscribers:
+            try:
+                callback(self, changed)
+            except Exception as e:
+                logger.error(f"Failed to apply the reloaded config in {callback}: {e}")
+        return changed
@@ -0,0 +1,359 @@
+"""
+A fast client for PixelFrame: paints images and generates load over the socketserver
+
+Paints an image, only sending the pixels that differ from the canvas (needs the API):
+    python3 Examples/Sockets/painter.py --api http://localhost:8443 paint image.png --offset 100,200
+Keeps the image painted:
+    python3 Examples/Sockets/painter.py --api http://localhost:8443 paint image.png --loop
+Floods the canvas with random pixels from 16 connections:
+    python3 Examples/Sockets/painter.py -c 16 load --duration 30
+
+The commands are pipelined on every connection (up to --window unanswered
+lines) and limited to --rate pixels per second in total. The server accepts one
+connection per IP, so several connections need several source addresses
+(--source, on localhost 127.0.0.2, 127.0.0.3, ... are used automatically).
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import random
+import time
+import urllib.request
+from io import BytesIO
+
+from PIL import Image
+
+
+class RateLimiter:
+    """
+    A token bucket shared by all connections
+    Attributes:
+        rate (float): The pixels per second (0 = unlimited)
+        tokens (float): The pixels that can be sent right now
+        updated (float): The last time the tokens were refilled
+    """
+
+    rate: float
+    tokens: float
+    updated: float
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    async def take(self, count: int) -> None:
+        """
+        Waits until count pixels may be sent
+        """
+        if not self.rate:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= count or self.tokens >= self.rate:
+                self.tokens -= count
+                return
+            await asyncio.sleep((count - self.tokens) / self.rate)
+
+
+class Connection:
+    """
+    A pipelined connection to the socketserver
+    Attributes:
+        host (str): The host of the server
+        port (int): The port of the socketserver
+        source (str | None): The local address of the connection
+        window (int): The maximum number of unanswered lines
+        sent (int): The number of sent lines
+        answered (int): The number of answers
+        accepted (int): The number of set pixels
+        rejected (int): The number of pixels rejected (e.g. cooldown)
+    """
+
+    host: str
+    port: int
+    source: str | None
+    window: int
+    sent: int
+    answered: int
+    accepted: int
+    rejected: int
+
+    def __init__(self, host: str, port: int, source: str | None, window: int):
+        self.host = host
+        self.port = port
+        self.source = source
+        self.window = window
+        self.sent = self.answered = self.accepted = self.rejected = 0
+        self.reader = None
+        self.writer = None
+        self.progress = asyncio.Event()
+        self.answers = None
+
+    async def open(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, local_addr=(self.source, 0) if self.source else None
+        )
+        self.answers = asyncio.create_task(self.read())
+
+    async def read(self) -> None:
+        """
+        Counts the answers of the server
+        """
+        while line := await self.reader.readline():
+            if "PX Success" in line.decode(errors="replace"):
+                self.accepted += 1
+            else:
+                self.rejected += 1
+            self.answered += 1
+            self.progress.set()
+        self.progress.set()
+        raise ConnectionError(f"Disconnected from {self.host}:{self.port}")
+
+    async def send(self, lines: list[str]) -> None:
+        """
+        Sends a batch of lines, waits while the window is full
+        """
+        while self.sent - self.answered > self.window:
+            if self.answers.done():
+                self.answers.result()  # raises the disconnect
+            self.progress.clear()
+            await self.progress.wait()
+        self.writer.write("".join(lines).encode())
+        self.sent += len(lines)
+        await self.writer.drain()
+
+    async def finish(self) -> None:
+        """
+        Waits for all answers and closes the connection
+        """
+        while self.answered < self.sent and not self.answers.done():
+            self.progress.clear()
+            await self.progress.wait()
+        self.answers.cancel()
+        self.writer.close()
+
+
+def sources(host: str, connections: int, given: list[str]) -> list[str | None]:
+    """
+    Returns the local addresses of the connections (the server accepts one connection per IP)
+    """
+    if given:
+        return given
+    if connections == 1:
+        return [None]
+    if ipaddress.ip_address(host).is_loopback:
+        return [f"127.0.0.{i + 2}" for i in range(connections)]
+    raise SystemExit(
+        "The server accepts one connection per IP, use --source for more connections"
+    )
+
+
+def fetch_region(api: str, x: int, y: int, width: int, height: int) -> Image.Image:
+    """
+    Gets the current pixels of a region (lossless) from the API
+    """
+    url = f"{api}/canvas/region?x={x}&y={y}&width={width}&height={height}"
+    with urllib.request.urlopen(url) as response:
+        return Image.open(BytesIO(response.read())).convert("RGB")
+
+
+def fetch_size(api: str) -> tuple[int, int]:
+    """
+    Gets the size of the canvas from the API
+    """
+    with urllib.request.urlopen(f"{api}/canvas/size") as response:
+        size = json.load(response)
+    return size["x"], size["y"]
+
+
+def image_commands(
+    image: Image.Image, offset: tuple[int, int], canvas: Image.Image | None
+) -> list[str]:
+    """
+    Creates the PX commands for all pixels of the image that differ from the canvas
+    Pixels with less than 50% alpha are skipped
+    """
+    width, height = image.size
+    target = image.tobytes()
+    current = canvas.tobytes() if canvas else None
+    commands = []
+    for i in range(width * height):
+        r, g, b, a = target[4 * i : 4 * i + 4]
+        if a < 128 or (current and current[3 * i : 3 * i + 3] == bytes((r, g, b))):
+            continue
+        x, y = i % width + offset[0], i // width + offset[1]
+        commands.append(f"PX {x} {y} {r:02x}{g:02x}{b:02x}\n")
+    return commands
+
+
+async def send_all(
+    connections: list[Connection],
+    commands: list[str],
+    limiter: RateLimiter,
+    batch: int,
+) -> None:
+    """
+    Distributes the commands over the connections
+    """
+    queue = asyncio.Queue()
+    for i in range(0, len(commands), batch):
+        queue.put_nowait(commands[i : i + batch])
+
+    async def worker(connection: Connection):
+        while not queue.empty():
+            lines = queue.get_nowait()
+            await limiter.take(len(lines))
+            await connection.send(lines)
+
+    await asyncio.gather(*(worker(connection) for connection in connections))
+
+
+async def report(connections: list[Connection], interval: float = 1.0) -> None:
+    """
+    Prints the throughput every interval
+    """
+    last, start = 0, time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        accepted = sum(c.accepted for c in connections)
+        rejected = sum(c.rejected for c in connections)
+        print(
+            f"[{time.monotonic() - start:7.1f}s] {(accepted - last) / interval:10,.0f} px/s"
+            f"  set {accepted:,}  rejected {rejected:,}",
+            flush=True,
+        )
+        last = accepted
+
+
+async def run(args: argparse.Namespace) -> None:
+    connections = [
+        Connection(args.host, args.port, source, args.window)
+        for source in sources(args.host, args.connections, args.source)
+    ]
+    await asyncio.gather(*(connection.open() for connection in connections))
+    limiter = RateLimiter(args.rate)
+    reporter = asyncio.create_task(report(connections))
+    start = time.monotonic()
+
+    try:
+        if args.mode == "paint":
+            image = Image.open(args.image).convert("RGBA")
+            if args.scale != 1:
+                image = image.resize(
+                    (round(image.width * args.scale), round(image.height * args.scale)),
+                    Image.Resampling.NEAREST,
+                )
+            while True:
+                canvas = None
+                if args.api:
+                    canvas = await asyncio.to_thread(
+                        fetch_region, args.api, *args.offset, *image.size
+                    )
+                commands = image_commands(image, args.offset, canvas)
+                if args.order == "random":
+                    random.shuffle(commands)
+                print(f"{len(commands):,} pixels to paint", flush=True)
+                await send_all(connections, commands, limiter, args.batch)
+                await asyncio.gather(*(c.finish() for c in connections))
+                if not args.loop:
+                    break
+                await asyncio.sleep(args.interval)
+                for connection in connections:
+                    await connection.open()
+        else:
+            x, y, width, height = args.region or (0, 0, *fetch_size(args.api))
+            rng = random.Random(args.seed)
+            deadline = start + args.duration if args.duration else None
+            chunk = args.batch * len(connections) * 10
+            sent = 0
+            while (not args.count or sent < args.count) and (
+                not deadline or time.monotonic() < deadline
+            ):
+                count = min(chunk, args.count - sent) if args.count else chunk
+                commands = [
+                    f"PX {rng.randrange(x, x + width)} {rng.randrange(y, y + height)} "
+                    f"{rng.getrandbits(24):06x}\n"
+                    for _ in range(count)
+                ]
+                await send_all(connections, commands, limiter, args.batch)
+                sent += count
+            await asyncio.gather(*(c.finish() for c in connections))
+    finally:
+        reporter.cancel()
+
+    seconds = time.monotonic() - start
+    accepted = sum(c.accepted for c in connections)
+    rejected = sum(c.rejected for c in connections)
+    print(
+        f"Set {accepted:,} pixels in {seconds:.1f}s ({accepted / seconds:,.0f} px/s), "
+        f"{rejected:,} rejected, {len(connections)} connection(s)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1", help="the server")
+    parser.add_argument("--port", default=1234, type=int, help="the socket port")
+    parser.add_argument(
+        "--api", default=None, help="the API (e.g. http://localhost:8443) for the diff"
+    )
+    parser.add_argument(
+        "-c", "--connections", default=1, type=int, help="the number of connections"
+    )
+    parser.add_argument(
+        "--source", nargs="+", default=[], help="local addresses, one per connection"
+    )
+    parser.add_argument(
+        "--rate", default=0, type=float, help="pixels per second (0 = unlimited)"
+    )
+    parser.add_argument("--batch", default=100, type=int, help="lines per write")
+    parser.add_argument(
+        "--window", default=1000, type=int, help="unanswered lines per connection"
+    )
+    modes = parser.add_subparsers(dest="mode", required=True)
+
+    paint = modes.add_parser("paint", help="paint an image")
+    paint.add_argument("image", help="the image file")
+    paint.add_argument(
+        "--offset",
+        default=(0, 0),
+        type=lambda s: tuple(int(v) for v in s.split(",")),
+        help="the position x,y of the image",
+    )
+    paint.add_argument("--scale", default=1.0, type=float, help="scale of the image")
+    paint.add_argument(
+        "--order", default="random", choices=["random", "rows"], help="paint order"
+    )
+    paint.add_argument(
+        "--loop", action="store_true", help="keep repainting the changed pixels"
+    )
+    paint.add_argument(
+        "--interval", default=1.0, type=float, help="seconds between the repaints"
+    )
+
+    load = modes.add_parser("load", help="send random pixels")
+    load.add_argument(
+        "--region",
+        default=None,
+        type=lambda s: tuple(int(v) for v in s.split(",")),
+        help="the area x,y,width,height (default: the whole canvas, needs --api)",
+    )
+    load.add_argument("--count", default=0, type=int, help="the number of pixels")
+    load.add_argument("--duration", default=0, type=float, help="seconds to run")
+    load.add_argument("--seed", default=None, type=int, help="the random seed")
+
+    args = parser.parse_args()
+    if args.mode == "load" and not args.region and not args.api:
+        parser.error("load needs --region or --api")
+    if args.mode == "load" and not args.count and not args.duration:
+        parser.error("load needs --count or --duration")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
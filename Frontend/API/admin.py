@@ -1,16 +1,31 @@
+import asyncio
 import time
+from pathlib import Path
 
-from fastapi import APIRouter, BackgroundTasks, FastAPI
+import numpy as np
+from fastapi import APIRouter, BackgroundTasks, FastAPI, HTTPException
 from fastapi.params import Depends
+from fastapi.responses import PlainTextResponse
+from gevent import get_hub
 from starlette import status
 
-from Canvas.canvas import Canvas, Pixel
+from Backup.backup import BackupHandler
+from Backup.journal import render_frame
+from Canvas.canvas import Canvas
+from Clients.manager import manager
 from Config.config import Config
 from Frontend.API.models import PixelArray
 from Misc import security
-from Misc.errors import InvalidJSONFormat
+from Misc.errors import (
+    ColorNotInPalette,
+    InvalidColorFormat,
+    MalformedConfigError,
+    NoConfigError,
+)
 from Misc.eventhandler import event_handler
-from Misc.utils import hex_to_rgb, logger
+from Misc.profiler import profiler
+from Misc.utils import hex_to_rgba_array, logger
+from Stats.metrics import metrics
 
 
 class AdminAPI:
@@ -43,28 +58,180 @@ class AdminAPI:
     def register_routes(self):
         @self.router.get("/reload")
         async def reload():
-            self.config.reload()
+            """
+            # Reload
+            Reloads the config file and applies it to the running modules (rate limits, tick rate and budget, intervals, ...)
+            Returns the names of the changed sections, the running config is kept if the file is invalid
+            """
+            try:
+                changed = self.config.reload()
+            except (MalformedConfigError, NoConfigError) as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            return {"changed": sorted(changed)}
+
+        @self.router.put("/resize")
+        async def resize(width: int, height: int):
+            """
+            # Resize
+            Resizes the canvas while the server runs, the pixels inside of both sizes are kept.
+            The new size is saved to the config file, web clients reload the canvas on their next poll
+            """
+            try:
+                self.canvas.resize(width, height)
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            return {"x": width, "y": height}
+
+        @self.router.put("/restore")
+        async def restore(x: int = 0, y: int = 0, until: str | None = None):
+            """
+            # Restore
+            Restores the latest backup (or the latest one up to `until`, %Y_%m_%d_%H_%M_%S) into the region at x, y.
+            The backup can have any size (e.g. from before a resize), the parts outside of the canvas are cut off
+            """
+            path = Path(self.config.backup.directory).resolve()
+            try:
+                array, backup = BackupHandler.load_backup(path, until)
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="No backup found")
+            rect = self.canvas.paste(array, x, y)
+            if rect is None:
+                raise HTTPException(
+                    status_code=422, detail="The backup is outside of the canvas"
+                )
+            return {"backup": backup, "region": rect}
+
+        @self.router.put("/rollback")
+        async def rollback(client: str, since: float):
+            """
+            # Rollback
+            Reverts the pixels a client (ip) wrote since a unix time, if nobody wrote over them since.
+            The earlier state is rendered from the backups and the journal. Needs `moderation.attribution`
+            and `backup.journal`, a backup alone could be older than the time
+            """
+            if not self.canvas.attribution:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="The owners of the pixels aren't recorded",
+                )
+            if not self.config.backup.journal.enabled:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="The journal is disabled, the canvas at that time can't be rendered",
+                )
+            owner = manager.ids.get(client)
+            if owner is None:
+                raise HTTPException(status_code=404, detail="Unknown client")
+            if self.canvas.journal:
+                self.canvas.journal.flush()
+            try:
+                past = get_hub().threadpool.apply(render_frame, (self.config, since))
+            except FileNotFoundError as e:
+                raise HTTPException(status_code=404, detail=str(e))
+            reverted = self.canvas.rollback(owner, past)
+            logger.info(f"Reverted {reverted} pixels of {client} since {since}")
+            return {"client": client, "since": since, "reverted": reverted}
+
+        @self.router.get("/protected")
+        async def get_protected():
+            """
+            # Protected regions
+            Returns the regions [x, y, w, h] clients can't write to and the rejected writes of every client
+            """
+            return {
+                "regions": self.config.moderation.protected,
+                "rejected": metrics.rejected.to_dict(),
+            }
+
+        @self.router.put("/protected", status_code=status.HTTP_201_CREATED)
+        async def add_protected(x: int, y: int, w: int, h: int):
+            """
+            # Protect
+            Protects a region (e.g. a sponsor logo or the statsbar), writes of clients to it are rejected.
+            Admin writes still pass. The regions are saved to the config file
+            """
+            try:
+                self.canvas.protect([*self.config.moderation.protected, [x, y, w, h]])
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            return {"regions": self.config.moderation.protected}
+
+        @self.router.delete("/protected")
+        async def remove_protected(index: int | None = None):
+            """
+            # Unprotect
+            Removes the protected region at an index of the list (all regions if no index is given)
+            """
+            regions = list(self.config.moderation.protected)
+            if index is None:
+                regions = []
+            elif 0 <= index < len(regions):
+                del regions[index]
+            else:
+                raise HTTPException(status_code=404, detail="Unknown region")
+            self.canvas.protect(regions)
+            return {"regions": self.config.moderation.protected}
 
         @self.router.put("/pixel", status_code=status.HTTP_201_CREATED)
         async def update_pixel(array: PixelArray):
+            if not array.pixels:
+                return
             try:
-                for ctp in array.pixels:
-                    x, y, c = ctp
-                    if not self.canvas.pixel_in_bounds(x, y):
-                        continue
-                    r, g, b, a = hex_to_rgb(c, True)
-                    pixel = Pixel(x, y, r, g, b, a)
-                    self.canvas.put_pixel(pixel)
-
-            except (TypeError, TypeError):
-                raise InvalidJSONFormat()
-
-        def restarter():
+                xs, ys, colors = zip(*array.pixels)
+                colors = hex_to_rgba_array(colors)
+            except (TypeError, ValueError):
+                raise InvalidColorFormat()
+            if not self.canvas.colors_allowed(colors[:, :3]):
+                raise ColorNotInPalette()
+            pixels = np.empty((len(xs), 6), dtype=np.int64)
+            pixels[:, 0] = xs
+            pixels[:, 1] = ys
+            pixels[:, 2:] = colors
+            self.canvas.put_pixels(pixels)
+
+        @self.router.get("/metrics")
+        async def get_metrics():
+            """
+            # Metrics
+            Returns the runtime metrics (tick timing, backlog)
+            """
+            return metrics.to_dict()
+
+        @self.router.get("/profile")
+        async def get_profile(seconds: float = 10, collapsed: bool = False):
+            """
+            # Profile
+            Samples the stacks of all greenlets for some seconds (max. 300) while the server keeps running.
+            Returns the time every greenlet was running and the collapsed stacks (one `stack count` per line),
+            which can be rendered by flamegraph.pl or speedscope. Use `collapsed=true` to only get the stacks as text.
+            """
+            if not 0 < seconds <= 300:
+                raise HTTPException(status_code=422, detail="Seconds out of range")
+            if profiler.running:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A profile is already running",
+                )
+            profiler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profile = profiler.stop()
+            if collapsed:
+                return PlainTextResponse(profile["stacks"])
+            return profile
+
+        def restarter(hot: bool):
             time.sleep(0.1)
             logger.critical("Restarting queued by API\n")
             time.sleep(0.1)
-            event_handler.trigger("system-restart")
+            event_handler.trigger("system-hot-restart" if hot else "system-restart")
 
         @self.router.delete("/restart", status_code=status.HTTP_200_OK)
-        async def restart(background_tasks: BackgroundTasks):
-            background_tasks.add_task(restarter)
+        async def restart(background_tasks: BackgroundTasks, hot: bool = False):
+            """
+            # Restart
+            Restarts the server. A hot restart hands the canvas, the queue, the listening sockets
+            and all client connections over to the new process instead of reloading from the backup
+            """
+            background_tasks.add_task(restarter, hot)
@@ -9,7 +9,7 @@ from starlette import status
 from Canvas.canvas import Canvas
 from Clients.manager import manager
 from Config.config import Config
-from Misc.errors import InvalidColorFormat
+from Misc.errors import ColorNotInPalette, InvalidColorFormat
 from Misc.utils import cooldown_to_text, hex_to_rgb
 
 
@@ -35,21 +35,21 @@ class CanvasAPI:
 
         self.register_routes()
 
-    def get_canvas_bytes(self, format: str, quality: int) -> BytesIO:
+    def get_canvas_bytes(self, format: str, quality: int) -> tuple[BytesIO, int]:
         """
         Returns the canvas as a BytesIO object
         Args:
             format (str): The format of the image
             quality (int): The quality of the image (1-100)
         Returns:
-             A BytesIO object
+             A BytesIO object and the generation of the canvas
         """
-        pil_img: Image = self.canvas.get_canvas()
+        pil_img, generation = self.canvas.get_frame()
         pil_img = pil_img.convert("RGB")
         buf = BytesIO()
         pil_img.save(buf, format=format, quality=quality)
         buf.seek(0)
-        return buf
+        return buf, generation
 
     def register_routes(self):
         """
@@ -66,16 +66,49 @@ class CanvasAPI:
         async def get_canvas():
             """
             # Canvas Image
-            Use this to get a webp image of the canvas
+            Use this to get a webp image of the canvas, the header `X-Generation` holds its generation for /canvas/since
             """
-            img = self.get_canvas_bytes("webp", 50)
+            img, generation = self.get_canvas_bytes("webp", 50)
             resp = StreamingResponse(content=img, media_type=f"image/webp")
             resp.headers["Cache-Control"] = "no-cache"
+            resp.headers["X-Generation"] = str(generation)
             resp.headers["Last-Modified"] = time.strftime(
                 "%a, %d %b %Y %H:%M:%S GMT", time.gmtime()
             )
             return resp
 
+        @self.router.get(
+            "/region",
+            responses={
+                200: {"content": {"image/png": {}}},
+            },
+            response_class=Response,
+        )
+        async def get_region(x: int, y: int, width: int, height: int):
+            """
+            # Canvas region
+            Use this to get a lossless png image of a region of the canvas, e.g. to compare it with a template
+            """
+            size = self.canvas.get_size()
+            if (
+                x < 0
+                or y < 0
+                or width <= 0
+                or height <= 0
+                or x + width > size[0]
+                or y + height > size[1]
+            ):
+                raise HTTPException(
+                    status_code=422, detail="Region out of bounds. Try /canvas/size"
+                )
+            buf = BytesIO()
+            self.canvas.get_region(x, y, width, height).save(
+                buf, format="png", compress_level=1
+            )
+            resp = Response(content=buf.getvalue(), media_type="image/png")
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp
+
         @self.router.get("/size")
         async def get_size():
             """
@@ -85,6 +118,14 @@ class CanvasAPI:
             size = self.canvas.get_size()
             return {"x": size[0], "y": size[1]}
 
+        @self.router.get("/palette")
+        async def get_palette() -> list[str]:
+            """
+            # Canvas palette
+            Returns the colors of the palette (hex), the changes of /canvas/since carry their index instead of the color. Empty if the canvas has no palette
+            """
+            return self.canvas.palette.hex if self.canvas.palette else []
+
         @self.router.get("/pps")
         async def get_pps(request: Request):
             """
@@ -127,20 +168,28 @@ class CanvasAPI:
                 r, g, b, a = hex_to_rgb(color, True)
             except ValueError:
                 raise InvalidColorFormat()
-            self.canvas.add_pixel(x, y, r, g, b, a)
-            manager.client(request.client.host).update_cooldown()
+            if not self.canvas.color_allowed(r, g, b):
+                raise ColorNotInPalette()
+            client = manager.client(request.client.host)
+            self.canvas.add_pixel(x, y, r, g, b, a, client)
+            client.update_cooldown()
 
         @self.router.get("/since", status_code=status.HTTP_200_OK)
-        async def pixel_since(timestamp: int, response: Response, raw: bool = False):
+        async def pixel_since(generation: int, response: Response, raw: bool = False):
             """
-            # Canvas changes since timestamp
-            Returns all pixels changed since the given UNIX timestamp. Use `raw` to get the changed pixels as a json object and avoid redirects on too many changed pixels.
+            # Canvas changes since generation
+            Returns all pixels changed after the given generation (from `X-Generation` of /canvas/ or the previous response) and the generation of the returned state, every change is returned exactly once. Use `raw` to get the changed pixels as a json object and avoid redirects on too many changed pixels.
+            With a palette the color of a pixel is its index in /canvas/palette.
+            Clients are redirected to the whole canvas if it was resized or restored since the generation or the generation is unknown (e.g. after a restart).
             """
             redirect = RedirectResponse(url="/canvas/")
             if self.config.frontend.web.force_reload:
                 return redirect
-            out = self.canvas.get_pixel_since(timestamp)
+            known = self.canvas.reset <= generation <= self.canvas.get_generation()
+            if not known and not raw:
+                return redirect
+            current, out = self.canvas.get_pixel_since(generation)
             if len(out) > 1000 and not raw:
                 return redirect
             response.status_code = status.HTTP_200_OK
-            return out
+            return {"generation": current, "pixels": out}
@@ -1,4 +1,5 @@
 import random
+import socket
 from typing import Annotated
 
 import uvicorn
@@ -14,6 +15,7 @@ from Config.config import Config
 from Frontend.API.admin import AdminAPI
 from Frontend.API.canvas import CanvasAPI
 from Frontend.API.website import WebserviceAPI
+from Misc.handover import Handover, handover
 from Misc.security import create_access_token
 from Misc.Template.pixelmodule import PixelModule
 from Misc.utils import logger
@@ -89,6 +91,7 @@ class PixelAPI(PixelModule):
         canvas_api (CanvasAPI): The API router for the canvas functions
         canvas (Canvas): The canvas itself
         config (Config): The config for everything
+        socket (socket.socket | None): The listening socket of the API
     """
 
     base_api: FastAPI
@@ -97,6 +100,7 @@ class PixelAPI(PixelModule):
     admin_api: AdminAPI
     canvas: Canvas
     config: Config
+    socket: socket.socket | None
 
     def __init__(self, canvas: Canvas, config: Config):
         self.config = config
@@ -108,6 +112,7 @@ class PixelAPI(PixelModule):
             debug=self.config.debug,
         )
         self.canvas = canvas
+        self.socket = handover.take_socket("api") if handover else None
         super().__init__("PixelAPI")
         self.register_routes()
 
@@ -164,10 +169,20 @@ class PixelAPI(PixelModule):
         """
         logger.info(f"Starting Process: {self.prefix}.loop")
 
-        uvicorn.run(
+        config = uvicorn.Config(
             self.base_api,
             host=self.config.connection.host,
             port=self.config.connection.ports.api,
             log_level=self.config.logging.loglevel,
             headers=[("server", self.config.general.name)],
         )
+        if not self.socket:
+            self.socket = config.bind_socket()
+        uvicorn.Server(config).run(sockets=[self.socket])
+
+    def hand_over(self, handover: Handover) -> None:
+        """
+        Hands the listening socket over to the next process (hot restart)
+        """
+        if self.socket:
+            handover.add_socket("api", self.socket)
@@ -1,11 +1,16 @@
+import os
 import time
-from typing import Optional
+from io import BytesIO
+from typing import BinaryIO, Callable, Iterator, Optional
 
 import pygame
-from gevent import Greenlet, spawn
+from gevent import Greenlet, get_hub, spawn
+from gevent.event import Event
+from gevent.pywsgi import WSGIServer
 from gevent.time import sleep as gsleep
-from PIL.Image import Image
-from pygame import Surface, SurfaceType
+from PIL import Image
+from pygame import Rect, Surface, SurfaceType
+from pygame.font import Font
 
 from Canvas.canvas import Canvas
 from Config.config import Config
@@ -27,6 +32,11 @@ class Display(PixelModule):
         loop_routine (Greenlet): The Greenlet with the loop
         stats (Stats): The stats of the whole canvas (if displayed)
         show_stats (bool): Whether the stats should be shown
+        surface (Surface): The persistent copy of the canvas, updated by dirty rects only
+        generation (int): The canvas generation shown on the surface
+        fonts (tuple[Font, Font] | None): The cached fonts of the statsbar (text, outline)
+        statsbar (tuple[str, Surface, Surface] | None): The cached text of the statsbar
+        statsbar_rect (Rect | None): The area covered by the statsbar in the last frame
     """
 
     config: Config
@@ -35,6 +45,11 @@ class Display(PixelModule):
     loop_routine: Greenlet
     stats: Stats
     show_stats: bool
+    surface: Surface
+    generation: int
+    fonts: tuple[Font, Font] | None
+    statsbar: tuple[str, Surface, Surface] | None
+    statsbar_rect: Rect | None
 
     def __init__(self, canvas: Canvas):
         self.canvas = canvas
@@ -48,6 +63,11 @@ class Display(PixelModule):
         pygame.display.set_caption("PixelFrame")
         pygame.font.init()
         self.screen = pygame.display.set_mode(self.config.visuals.size.get_size())
+        self.surface = Surface(self.config.visuals.size.get_size(), depth=24)
+        self.generation = -1
+        self.fonts = None
+        self.statsbar = None
+        self.statsbar_rect = None
         super().__init__("CANVAS")
 
     def register_events(self):
@@ -67,7 +87,6 @@ class Display(PixelModule):
 
     def loop(self):
         logger.info(f"Starting Process: {self.prefix}.loop")
-        updates = 1.0 / self.config.frontend.display.fps
 
         try:
             while self.running:
@@ -83,48 +102,247 @@ class Display(PixelModule):
                 self.render()
 
                 end = time.time() - start
-                gsleep(max(updates - end, 0))
+                gsleep(max(1.0 / self.config.frontend.display.fps - end, 0))
         except SystemStop:
             return
 
     def render(self):
+        """
+        Copies the changed regions of the canvas to the screen and draws the statsbar
+        The statsbar is only drawn again if its text changed or the canvas below it changed,
+        nothing is presented if the frame is the same as the last one
+        """
+        rects = self.update_surface()
+        for rect in rects:
+            self.screen.blit(self.surface, rect, rect)
 
-        image: Image = self.canvas.get_canvas()
-        img = pygame.image.fromstring(image.tobytes(), image.size, image.mode)
-        self.screen.fill((0, 0, 0))
-        self.screen.blit(img, (0, 0))
+        text = self.stats_text() if self.show_stats else None
+        shown = self.statsbar[0] if self.statsbar_rect and self.statsbar else None
+        covered = self.statsbar_rect and self.statsbar_rect.collidelist(rects) != -1
+        if text != shown or covered:
+            if self.statsbar_rect:
+                self.screen.blit(self.surface, self.statsbar_rect, self.statsbar_rect)
+                rects.append(self.statsbar_rect)
+                self.statsbar_rect = None
+            if text is not None:
+                self.statsbar_rect = self.render_stats(text)
+                rects.append(self.statsbar_rect)
 
-        if self.show_stats:
-            users: int = 0  # self.canvas.socketserver.user_count()
-            pixel: int = self.canvas.stats.get_pixelcount()
+        if rects:
+            self.present(rects)
 
-            text: str = (
-                f"Host: {self.config.connection.host} "
-                f"| Socket: {self.config.connection.ports.socket} "
-                f"| Users: {users} "
-                f"| Pixels: {pixel}"
-            )
+    def present(self, rects: list[Rect]) -> None:
+        """
+        Shows the changed regions of the screen
+        Args:
+            rects (list[Rect]): The regions changed in this frame
+        """
+        pygame.display.update(rects)
 
-            font = pygame.font.Font("Misc/font.otf", self.config.visuals.statsbar.size)
-            outline = pygame.font.Font(
-                "Misc/font_bold.otf", self.config.visuals.statsbar.size
-            )
-            rendertext = font.render(text, True, (255, 255, 255))
-            renderoutline = outline.render(text, True, (0, 0, 0))
+    def resize(self, width: int, height: int) -> None:
+        """
+        Recreates the screen and the surface for a resized canvas
+        """
+        self.screen = pygame.display.set_mode((width, height))
+        self.surface = Surface((width, height), depth=24)
+        self.statsbar_rect = None
+
+    def update_surface(self) -> list[Rect]:
+        """
+        Copies the regions changed since the last frame from the latest snapshot into the surface
+        Returns:
+            The updated regions
+        """
+        with self.canvas.snapshot() as snapshot:
+            if snapshot.generation == self.generation:
+                return []
+            height, width = snapshot.data.shape[:2]
+            if self.surface.get_size() != (width, height):
+                self.resize(width, height)
+            rects = [Rect(r) for r in self.canvas.get_dirty_rects(self.generation)]
+            self.generation = snapshot.generation
+
+            pixels = pygame.surfarray.pixels3d(self.surface)
+            for rect in rects:
+                pixels[rect.left : rect.right, rect.top : rect.bottom] = (
+                    snapshot.colors(
+                        rect.left, rect.top, rect.width, rect.height
+                    ).swapaxes(0, 1)
+                )
+            del pixels  # unlocks the surface for blitting
+        return rects
 
-            tsx, tsy = font.size(text)
-            self.screen.blit(
-                renderoutline,
-                (self.config.visuals.size.width / 2 - tsx / 2, tsy - tsy / 2),
+    def stats_text(self) -> str:
+        """
+        Returns the text of the statsbar
+        """
+        users: int = 0  # self.canvas.socketserver.user_count()
+        pixel: int = self.canvas.stats.get_pixelcount()
+
+        return (
+            f"Host: {self.config.connection.host} "
+            f"| Socket: {self.config.connection.ports.socket} "
+            f"| Users: {users} "
+            f"| Pixels: {pixel}"
+        )
+
+    def render_stats(self, text: str) -> Rect:
+        """
+        Draws the statsbar on the screen, the text is only rendered again if it changed
+        Args:
+            text (str): The text of the statsbar (see stats_text)
+        Returns:
+            The area covered by the statsbar
+        """
+        if self.fonts is None:
+            self.fonts = (
+                pygame.font.Font("Misc/font.otf", self.config.visuals.statsbar.size),
+                pygame.font.Font(
+                    "Misc/font_bold.otf", self.config.visuals.statsbar.size
+                ),
             )
-            self.screen.blit(
-                rendertext,
-                (self.config.visuals.size.width / 2 - tsx / 2, tsy - tsy / 2),
+        if self.statsbar is None or self.statsbar[0] != text:
+            font, outline = self.fonts
+            self.statsbar = (
+                text,
+                font.render(text, True, (255, 255, 255)),
+                outline.render(text, True, (0, 0, 0)),
             )
 
-        pygame.display.update()
+        _, rendertext, renderoutline = self.statsbar
+        tsx, tsy = self.fonts[0].size(text)
+        position = (self.config.visuals.size.width / 2 - tsx / 2, tsy - tsy / 2)
+        rect = self.screen.blit(renderoutline, position)
+        return rect.union(self.screen.blit(rendertext, position))
 
     def stop(self):
         super().stop()
         pygame.mixer.quit()
         pygame.quit()
+
+
+class HeadlessDisplay(Display):
+    """
+    The display without a window, every changed frame is encoded as JPEG
+    and served as MJPEG stream and/or appended to a file or pipe
+    Attributes:
+        frame (bytes | None): The latest encoded frame
+        frame_id (int): The number of the latest frame
+        new_frame (Event): Set when a new frame was encoded
+        server (WSGIServer | None): The HTTP server for the MJPEG stream
+        sink (BinaryIO | None): The file or pipe the frames are written to
+    """
+
+    boundary: bytes = b"frame"
+    frame: bytes | None
+    frame_id: int
+    new_frame: Event
+    server: WSGIServer | None
+    sink: BinaryIO | None
+
+    def __init__(self, canvas: Canvas):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        super().__init__(canvas)
+        self.frame = None
+        self.frame_id = 0
+        self.new_frame = Event()
+        self.server = None
+        self.sink = None
+        headless = self.config.frontend.display.headless
+        if headless.stream:
+            self.server = WSGIServer(
+                (self.config.connection.host, self.config.connection.ports.stream),
+                self.stream,
+                log=None,
+            )
+
+    def present(self, rects: list[Rect]) -> None:
+        """
+        Encodes the frame in the threadpool, so the other greenlets keep running
+        Args:
+            rects (list[Rect]): The regions changed in this frame
+        """
+        image = Image.frombytes(
+            "RGB", self.screen.get_size(), pygame.image.tobytes(self.screen, "RGB")
+        )
+        frame = get_hub().threadpool.apply(self.encode, (image,))
+
+        self.frame = frame
+        self.frame_id += 1
+        new_frame, self.new_frame = self.new_frame, Event()
+        new_frame.set()
+
+    def encode(self, image: Image.Image) -> bytes:
+        """
+        Encodes a frame and appends it to the sink (runs in a worker thread)
+        Args:
+            image (Image): The frame
+
+        Returns:
+            The JPEG data
+        """
+        buf = BytesIO()
+        image.save(
+            buf, format="jpeg", quality=self.config.frontend.display.headless.quality
+        )
+        frame = buf.getvalue()
+        path = self.config.frontend.display.headless.sink
+        if path:
+            try:
+                if self.sink is None:
+                    self.sink = open(path, "ab")
+                self.sink.write(frame)
+                self.sink.flush()
+            except OSError as e:
+                logger.error(f"Couldn't write frame to {path} - {e}")
+                self.sink = None
+        return frame
+
+    def stream(self, environ: dict, start_response: Callable) -> Iterator[bytes]:
+        """
+        The WSGI application serving the frames as multipart/x-mixed-replace
+        """
+        start_response(
+            "200 OK",
+            [
+                (
+                    "Content-Type",
+                    "multipart/x-mixed-replace; boundary=" + self.boundary.decode(),
+                ),
+                ("Cache-Control", "no-cache"),
+            ],
+        )
+        frame_id = -1
+        while self.running:
+            if self.frame is None or frame_id == self.frame_id:
+                self.new_frame.wait(timeout=5)
+                continue
+            frame_id, frame = self.frame_id, self.frame
+            yield (
+                b"--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n"
+                % (self.boundary, len(frame))
+                + frame
+                + b"\r\n"
+            )
+
+    def loop(self):
+        if self.server:
+            try:
+                self.server.start()
+                logger.info(
+                    f"Streaming display on {self.config.connection.host}:{self.config.connection.ports.stream}"
+                )
+            except OSError as e:
+                logger.critical(
+                    f"Couldn't start display stream on port {self.config.connection.ports.stream} - {e}"
+                )
+                self.server = None
+        super().loop()
+
+    def stop(self):
+        if self.server:
+            self.server.stop(timeout=1)
+        if self.sink:
+            self.sink.close()
+            self.sink = None
+        super().stop()
@@ -1,7 +1,7 @@
 import time
 from typing import Optional
 
-from gevent import spawn
+from gevent import Greenlet, getcurrent, spawn
 from gevent._socket3 import socket as socket3
 from gevent.lock import RLock
 
@@ -10,6 +10,7 @@ from Clients.manager import Manager, manager
 from Config.config import Config
 from Misc.errors import SystemStop
 from Misc.eventhandler import event_handler
+from Misc.handover import Handover, handover
 from Misc.Template.pixelmodule import PixelModule
 from Misc.utils import logger
 
@@ -28,10 +29,11 @@ class SClient:
         cooldown_until(float): The unix time when the client can place the next pixel
         lock (RLock): The locking primative to identify the Greenlet
         kill (bool): The attribute that stops/kills all running processes of the class
+        buffer (bytearray): The received input that wasn't processed yet
+        detached (bool): If the connection was handed over to another process
 
     """
 
-    pps: int | float  # Pixel per Second
     ip: str
     port: int
     canvas: Canvas
@@ -44,6 +46,8 @@ class SClient:
     kill: bool = False
     timeout: bool
     manager: Manager
+    buffer: bytearray
+    detached: bool = False
 
     def __init__(
         self,
@@ -66,12 +70,17 @@ class SClient:
         self.ip = ip
         self.port = port
         self.mclient = manager.add_client(self.ip)
-        self.pps = self.mclient.get_pps()
         self.mclient.connect()
         self.socket = None
         self.connected_at = time.time()
         self.lock = RLock()
         self.timeout = False
+        self.buffer = bytearray()
+
+    @property
+    def pps(self) -> int | float:
+        """The number of pixels the client can set per second (follows the config)"""
+        return self.mclient.get_pps()
 
     def stop(self) -> None:
         """
@@ -108,13 +117,52 @@ class SClient:
         """
         self.send(line)
 
-    def connect(self, socket: socket3) -> None:
+    def readline(self, limit: int = 1024) -> str:
+        """
+        Reads a line from the client socket, the input stays in the buffer until a line is complete
+        Args:
+            limit (int): The maximum length of the line
+
+        Returns:
+            The line, empty if the client disconnected
+        """
+        while True:
+            end = self.buffer.find(b"\n", 0, limit)
+            if end >= 0 or len(self.buffer) >= limit:
+                size = end + 1 if end >= 0 else limit
+                line = self.buffer[:size].decode(errors="replace")
+                del self.buffer[:size]
+                return line
+            data = self.socket.recv(65536)
+            if not data:
+                line = self.buffer.decode(errors="replace")
+                self.buffer.clear()
+                return line
+            self.buffer += data
+
+    def detach(self) -> tuple[socket3, bytes]:
+        """
+        Stops handling the connection without closing it (to hand it over to another process)
+        Returns:
+            The socket and the input that wasn't processed yet
+        """
+        with self.lock:
+            self.detached = True
+            socket = self.socket
+            self.socket = None
+            self.connected = False
+        self.task.kill()
+        return socket, bytes(self.buffer)
+
+    def connect(self, socket: socket3, pending: bytes = b"") -> None:
         """
         The 'loop' for handling the client connection
         Args:
             socket (socket): the socket of the client
+            pending (bytes): Input of the client that wasn't processed yet (after a hot restart)
         """
         self.socket = socket
+        self.buffer = bytearray(pending)
         self.kill = False
         self.socket.settimeout(self.canvas.config.connection.timeout)
         self.connected = True
@@ -124,14 +172,13 @@ class SClient:
 
         with self.lock:
             self.socket = socket
-            readline = self.socket.makefile().readline
 
         try:
             while self.socket and not self.kill:
                 line = ""
                 while not self.kill:
                     try:
-                        line = readline(1024).strip()
+                        line = self.readline(1024).strip()
                     except (ConnectionResetError, TimeoutError):
                         self.stop()
                         return
@@ -174,8 +221,9 @@ class SClient:
                     ):
                         self.send("Wrong arguments")
         finally:
-            self.timeout = True
-            self.disconnect("Connection Timeout...")
+            if not self.detached:
+                self.timeout = True
+                self.disconnect("Connection Timeout...")
 
     def disconnect(self, message: str = None) -> None:
         """
@@ -214,6 +262,7 @@ class Socketserver(PixelModule):
         socket(socket): The socket server
         clients (dict[str, SClient]): The list of clients
         cpps (int | float): Refers to default pps of the clients
+        task (Greenlet | None): The greenlet accepting the connections
     """
 
     config: Config
@@ -224,6 +273,7 @@ class Socketserver(PixelModule):
     clients: dict[str, SClient]
     self_disable: bool = False
     cpps: int | float
+    task: Greenlet | None = None
 
     def __init__(self, canvas: Canvas, config: Config) -> None:
         """
@@ -236,18 +286,62 @@ class Socketserver(PixelModule):
         self.canvas = canvas
         self.host = self.config.connection.host
         self.port = self.config.connection.ports.socket
-        self.socket = socket3()
-        try:
-            self.socket.bind((self.host, self.port))
-        except OSError as e:
-            logger.critical(
-                f"Couldn't start socketserver on {self.host}:{self.port} - {e}"
-            )
-            self.self_disable = True
-        self.socket.listen()
         self.clients = {}
+        self.config.subscribe(self.reconfigure)
+        self.socket = handover.take_socket("socket") if handover else None
+        if self.socket:
+            self.adopt_clients(handover)
+        else:
+            self.socket = socket3()
+            try:
+                self.socket.bind((self.host, self.port))
+            except OSError as e:
+                logger.critical(
+                    f"Couldn't start socketserver on {self.host}:{self.port} - {e}"
+                )
+                self.self_disable = True
+            self.socket.listen()
         super().__init__("SOCKSERV")
 
+    def reconfigure(self, config: Config, changed: set[str]) -> None:
+        """
+        Applies a reloaded config to the connected clients
+        """
+        if "connection" in changed:
+            for client in self.clients.values():
+                if client.connected and client.socket:
+                    client.socket.settimeout(config.connection.timeout)
+
+    def adopt_clients(self, handover: Handover) -> None:
+        """
+        Continues handling the client connections of the previous process
+        """
+        clients = handover.take_clients()
+        for ip, port, sock, pending in clients:
+            client = self.clients[ip] = SClient(
+                self.canvas, ip, port, self.config.game.pps
+            )
+            client.task = spawn(client.connect, sock, pending)
+        if clients:
+            logger.info(f"Took over {len(clients)} client connections")
+
+    def hand_over(self, handover: Handover) -> None:
+        """
+        Stops accepting and handling connections and hands the listening socket and
+        all client connections over to the next process (hot restart)
+        """
+        self.running = False
+        if self.task:
+            self.task.kill()
+        if self.self_disable:
+            return
+        handover.add_socket("socket", self.socket)
+        for client in self.clients.values():
+            if client.connected and client.socket:
+                sock, pending = client.detach()
+                handover.add_client(client.ip, client.port, sock, pending)
+        logger.info(f"Handed over {len(handover.clients)} client connections")
+
     def stop(self) -> None:
         """
         Acts as a kind of 'killswitch' function
@@ -266,6 +360,7 @@ class Socketserver(PixelModule):
         if self.self_disable:
             return
         logger.info(f"Starting Process: {self.prefix}.loop")
+        self.task = getcurrent()
         try:
             while self.running:
                 sock, addr = self.socket.accept()
@@ -324,7 +419,10 @@ class Socketserver(PixelModule):
                     a = c & 0x000000FF
                 else:
                     return
-                self.canvas.add_pixel(x, y, r, g, b, a)
+                if not self.canvas.color_allowed(r, g, b):
+                    client.send("PX Color not in the palette (see PALETTE)")
+                    return
+                self.canvas.add_pixel(x, y, r, g, b, a, client.mclient)
                 client.send("PX Success")
             else:
                 r, g, b = self.canvas.get_pixel(x, y)
@@ -336,6 +434,7 @@ class Socketserver(PixelModule):
             help += "  >>> HELP\n"
             help += "  >>> STATS\n"
             help += "  >>> SIZE\n"
+            help += "  >>> PALETTE\n"
             help += "  >>> QUIT\n"
             # help += "  >>> TEXT x y text (currently disabled)\n"
             help += "  >>> PX x y [RRGGBB[AA]]\n"
@@ -354,6 +453,11 @@ class Socketserver(PixelModule):
         def on_size(client: SClient, *args, **kwargs):
             client.send("SIZE %d %d" % self.canvas.get_size())
 
+        @event_handler.register(f"{self.prefix}-PALETTE")
+        def on_palette(client: SClient, *args, **kwargs):
+            palette = self.canvas.palette
+            client.send("PALETTE " + (" ".join(palette.hex) if palette else "none"))
+
         @event_handler.register(f"{self.prefix}-PPS")
         def on_pps(client: SClient, *args, **kwargs):
             client.send("PPS %d" % client.mclient.get_pps())
@@ -3,12 +3,13 @@ let host;
 let canvas;
 let canvasContainer;
 let ctx;
-let lastUpdate;
+let generation = -1;
 let interval;
 let positionPopup;
 let fullscreenButton;
 let isFullscreen;
 let inactivityTimer;
+let palette = [];
 const inactivityLimit = 5000;
 
 function init(event) {
@@ -22,8 +23,8 @@ function init(event) {
     positionPopup = document.getElementById("positionPopup");
     fullscreenButton = document.getElementById("fullScreenButton");
     ctx = canvas.getContext("2d");
-    lastUpdate = new Date().getTime();
     resizeCanvas();
+    loadPalette();
     loadImage();
     interval = setInterval(updateNewPixels, 1000);
 
@@ -50,10 +51,6 @@ function changeCanvasSize(x, y){
     canvas.height = y;
 }
 
-function updateTime(){
-    lastUpdate = Math.floor(Date.now() / 1000);
-}
-
 function getCanvasSize() {
     return new Promise(function(resolve, reject) {
         let sizeURL = host + "/canvas/size";
@@ -101,8 +98,14 @@ function loadImage(){
             let blob = xhrImg.response;
             let img = new Image();
             img.onload = function() {
+                if (img.width !== canvas.width || img.height !== canvas.height){
+                    changeCanvasSize(img.width, img.height);
+                }
                 ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
+                // the changes are polled from the state of the image on
+                generation = imageGeneration;
             };
+            let imageGeneration = parseInt(xhrImg.getResponseHeader("X-Generation"));
             img.src = URL.createObjectURL(blob);
         } else {
             console.error("Error on loading " + imgURL + ": ", xhrImg.statusText);
@@ -118,11 +121,16 @@ function loadImage(){
     }
 
     xhrImg.send();
-    updateTime();
 }
 
 function getNewPixels(callback) {
-    let url = host + "/canvas/since?timestamp=" + (lastUpdate - 0);
+    if (generation < 0) {
+        // the image isn't loaded yet
+        callback([]);
+        return;
+    }
+    let since = generation;
+    let url = host + "/canvas/since?generation=" + since;
     fetch(url)
         .then(response => {
             if (response.redirected && response.url === host + "/canvas/"){
@@ -133,7 +141,13 @@ function getNewPixels(callback) {
                     throw "offline";
                 }
                 response.json().then(r => {
-                    callback(r)
+                    if (generation !== since) {
+                        // the image was reloaded meanwhile
+                        callback([]);
+                        return;
+                    }
+                    generation = r.generation;
+                    callback(r.pixels);
                 })
             }
         })
@@ -146,6 +160,13 @@ function getNewPixels(callback) {
         });
 }
 
+function loadPalette() {
+    fetch(host + "/canvas/palette")
+        .then(response => response.json())
+        .then(colors => { palette = colors; })
+        .catch(error => console.error("Failed to load the palette:", error));
+}
+
 function hexToRgb(hex) {
     if (hex.length === 6) {
         hex = '#' + hex;
@@ -165,6 +186,13 @@ function changePixels(pixels){
         let x = pixel[0];
         let y = pixel[1];
         let color = pixel[2];
+        if (typeof color === "number") {
+            // the index of a palette color
+            color = palette[color];
+            if (color === undefined) {
+                return;
+            }
+        }
 
         let [r, g, b] = hexToRgb(color);
 
@@ -187,8 +215,6 @@ function updateNewPixels() {
             changePixels(data)
         }
     });
-
-    updateTime();
 }
 
 function countdown(t) {
@@ -210,7 +236,7 @@ function offlineHandler(){
     console.log(offlineDiv, offlineText);
     offlineDiv.classList.remove("hidden");
     offlineText.classList.remove("hidden");
-    let url = host + "/canvas/since?timestamp=" + (lastUpdate);
+    let url = host + "/canvas/size";
     let connected = false;
     fetch(url)
         .then(response => {
@@ -226,7 +252,6 @@ function offlineHandler(){
         .catch(error => {
             console.log("Still offline");
         });
-    updateTime();
     countdown(5);
 }
 
@@ -45,6 +45,14 @@ class InvalidColorFormat(HTTPException):
         )
 
 
+class ColorNotInPalette(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="The color isn't in the palette",
+        )
+
+
 class SystemStop(Exception):
     def __init__(self):
         super().__init__("Stopping system")
@@ -0,0 +1,150 @@
+import base64
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from gevent import socket
+
+from Misc.utils import logger
+
+ENV = "PIXELFRAME_HANDOVER"
+
+
+class Handover:
+    """
+    The state handed over to the new process on a hot restart (os.execv keeps the pid)
+    The listening sockets and the client connections are passed as inheritable
+    file descriptors, the canvas as file in shared memory (/dev/shm). The new
+    process finds the directory of the handover in the environment.
+    Structure of the directory:
+        state.json: The file descriptors and the clients
+        canvas.bin: The canvas (see CanvasStorage), missing if persistence is enabled
+        owners.npz: The owners of the pixels (see Attribution), if attribution is enabled
+    Attributes:
+        directory (Path): The directory of the handover
+        sockets (dict[str, int]): The file descriptors of the listening sockets by name
+        clients (list[dict]): The client connections (ip, port, fd and the unprocessed input)
+    """
+
+    directory: Path
+    sockets: dict[str, int]
+    clients: list[dict]
+
+    def __init__(self, directory: Path, state: dict | None = None):
+        self.directory = directory
+        state = state or {}
+        self.sockets = state.get("sockets", {})
+        self.clients = state.get("clients", [])
+
+    @property
+    def canvas(self) -> Path:
+        """The path of the handed over canvas"""
+        return self.directory / "canvas.bin"
+
+    @property
+    def owners(self) -> Path:
+        """The path of the handed over owners of the pixels"""
+        return self.directory / "owners.npz"
+
+    @classmethod
+    def create(cls) -> "Handover":
+        """
+        Creates an empty handover in shared memory (or the temp directory)
+        """
+        shm = Path("/dev/shm")
+        base = shm if shm.is_dir() else Path(tempfile.gettempdir())
+        return cls(Path(tempfile.mkdtemp(prefix="pixelframe-handover-", dir=base)))
+
+    @classmethod
+    def load(cls) -> "Handover | None":
+        """
+        Loads the handover of the previous process (if this process was hot restarted)
+        """
+        directory = os.environ.pop(ENV, None)
+        if not directory:
+            return None
+        try:
+            with open(Path(directory) / "state.json") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring the handover in {directory}: {e}")
+            return None
+        logger.info(f"Taking over from the previous process ({directory})")
+        return cls(Path(directory), state)
+
+    def add_socket(self, name: str, sock: socket.socket) -> None:
+        """
+        Hands over a listening socket
+        """
+        self.sockets[name] = self.inherit(sock)
+
+    def add_client(self, ip: str, port: int, sock: socket.socket, pending: bytes):
+        """
+        Hands over a client connection with the input that wasn't processed yet
+        """
+        self.clients.append(
+            {
+                "ip": ip,
+                "port": port,
+                "fd": self.inherit(sock),
+                "pending": base64.b64encode(pending).decode(),
+            }
+        )
+
+    @staticmethod
+    def inherit(sock: socket.socket) -> int:
+        """
+        Returns a duplicate of the file descriptor of a socket that survives os.execv
+        """
+        fd = os.dup(sock.fileno())
+        os.set_inheritable(fd, True)
+        return fd
+
+    def take_socket(self, name: str) -> socket.socket | None:
+        """
+        Returns a handed over listening socket (only once)
+        """
+        fd = self.sockets.pop(name, None)
+        if fd is None:
+            return None
+        sock = socket.socket(fileno=fd)
+        sock.set_inheritable(False)
+        return sock
+
+    def take_clients(self) -> list[tuple[str, int, socket.socket, bytes]]:
+        """
+        Returns the handed over client connections (only once)
+        """
+        clients = []
+        for client in self.clients:
+            sock = socket.socket(fileno=client["fd"])
+            sock.set_inheritable(False)
+            pending = base64.b64decode(client["pending"])
+            clients.append((client["ip"], client["port"], sock, pending))
+        self.clients = []
+        return clients
+
+    def save(self) -> None:
+        """
+        Writes the state and points the environment of the next process to it
+        """
+        with open(self.directory / "state.json", "w") as f:
+            json.dump({"sockets": self.sockets, "clients": self.clients}, f)
+        os.environ[ENV] = str(self.directory)
+
+    def close(self) -> None:
+        """
+        Closes the sockets that weren't taken and removes the directory
+        """
+        for fd in self.sockets.values():
+            os.close(fd)
+        for client in self.clients:
+            os.close(client["fd"])
+        self.sockets = {}
+        self.clients = []
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+handover = Handover.load()
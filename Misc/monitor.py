@@ -0,0 +1,159 @@
+import sys
+import time
+import traceback
+from collections import deque
+
+import greenlet
+from gevent import get_hub
+from gevent.time import sleep as gsleep
+
+from Config.config import Config
+from Misc.profiler import (
+    get_ident,
+    greenlet_name,
+    short_filename,
+    start_new_thread,
+    thread_sleep,
+)
+from Misc.utils import logger
+from Stats.metrics import BlockingMetrics, metrics
+
+
+def format_stack(frame) -> list[str]:
+    """
+    Returns the stack of a frame, the innermost call last (e.g. Canvas/canvas.py:312 in update)
+    """
+    summary = traceback.StackSummary.extract(
+        traceback.walk_stack(frame), lookup_lines=False
+    )
+    return [
+        f"{short_filename(entry.filename)}:{entry.lineno} in {entry.name}"
+        for entry in reversed(summary)
+    ]
+
+
+class BlockingMonitor:
+    """
+    Detects greenlets that block the event loop (every client waits meanwhile)
+    Every greenlet switch is traced, a greenlet (other than the Hub) running
+    longer than max_blocking_ms without switching is reported with the real
+    duration. A watchdog OS thread captures the stack while the block lasts.
+    The reports are recorded in the metrics (/admin/metrics) and logged by the loop.
+    Attributes:
+        config (Config): The configuration
+        running (bool): If the loop is running
+        threshold (float): The maximum blocking time in seconds
+        blocks (deque): The blocks not logged yet (timestamp, greenlet, duration, stack)
+    """
+
+    config: Config
+    running: bool
+    threshold: float
+    blocks: deque
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.threshold = config.monitor.max_blocking_ms / 1000
+        self.blocks = deque()
+        self.hub = get_hub()
+        self.current = None
+        self.switched = 0.0
+        self.switch = 0
+        self.stack = (-1, [])
+        self.previous = None
+        self.running = False
+        metrics.blocking = BlockingMetrics(config.monitor.reports)
+        config.subscribe(self.reconfigure)
+
+    def reconfigure(self, config: Config, changed: set[str]) -> None:
+        """
+        Applies a reloaded threshold and number of reports
+        """
+        if "monitor" in changed:
+            self.threshold = config.monitor.max_blocking_ms / 1000
+            latest = metrics.blocking.latest
+            metrics.blocking.latest = deque(latest, maxlen=config.monitor.reports)
+
+    def trace(self, event: str, args: tuple) -> None:
+        """
+        The greenlet trace function, reports the greenlet switched away from if it blocked
+        """
+        if self.running and event in ("switch", "throw"):
+            origin, target = args
+            now = time.perf_counter()
+            duration = now - self.switched
+            if duration > self.threshold and origin is not self.hub:
+                switch, stack = self.stack
+                self.blocks.append(
+                    (
+                        time.time() - duration,
+                        greenlet_name(origin),
+                        duration,
+                        stack if switch == self.switch else [],
+                    )
+                )
+            self.switch += 1
+            self.switched = now
+            self.current = target
+        if self.previous:
+            self.previous(event, args)
+
+    def watch(self, thread: int) -> None:
+        """
+        The watchdog loop (runs in its own OS thread), captures the stack of a blocking greenlet
+        Args:
+            thread (int): The ident of the thread running the hub
+        """
+        while self.running:
+            thread_sleep(self.threshold / 2)
+            switch = self.switch
+            if (
+                self.current is self.hub
+                or self.stack[0] == switch
+                or time.perf_counter() - self.switched <= self.threshold
+            ):
+                continue
+            frame = sys._current_frames().get(thread)
+            if frame is not None and switch == self.switch:
+                self.stack = (switch, format_stack(frame))
+
+    def start(self) -> None:
+        """
+        Starts tracing the greenlets and the watchdog (call from the main thread)
+        """
+        self.running = True
+        self.current = greenlet.getcurrent()
+        self.switched = time.perf_counter()
+        self.previous = greenlet.settrace(self.trace)
+        start_new_thread(self.watch, (get_ident(),))
+        logger.info(
+            f"Monitoring greenlets blocking longer than {self.threshold * 1000:g}ms"
+        )
+
+    def report(self) -> None:
+        """
+        Records and logs the detected blocks
+        """
+        while self.blocks:
+            timestamp, name, duration, stack = self.blocks.popleft()
+            metrics.blocking.record(timestamp, name, duration, stack)
+            where = "\n    ".join(stack[-8:]) if stack else "(stack not captured)"
+            logger.warning(
+                f"Event loop blocked for {duration * 1000:.1f}ms by {name}\n    {where}"
+            )
+
+    def loop(self):
+        """
+        Starts the monitor and reports the blocks every second
+        """
+        logger.info("Starting Process: Monitor.loop")
+        self.start()
+        try:
+            while self.running:
+                gsleep(1)
+                self.report()
+        finally:
+            self.running = False
+            # a trace installed later (e.g. the profiler) stays, it restores this one when it stops
+            if greenlet.gettrace() == self.trace:
+                greenlet.settrace(self.previous)
@@ -0,0 +1,191 @@
+import os
+import sys
+import time
+from collections import Counter
+from functools import lru_cache
+
+import greenlet
+from gevent import Greenlet, monkey
+from gevent.hub import Hub
+
+start_new_thread = monkey.get_original("_thread", "start_new_thread")
+allocate_lock = monkey.get_original("_thread", "allocate_lock")
+get_ident = monkey.get_original("_thread", "get_ident")
+thread_sleep = monkey.get_original("time", "sleep")
+
+
+def greenlet_name(g: greenlet.greenlet) -> str:
+    """
+    Returns a readable name of a greenlet (e.g. Canvas.loop or SClient.connect[ip])
+    """
+    if isinstance(g, Hub):
+        return "Hub"
+    if not isinstance(g, Greenlet):
+        return "main" if g.parent is None else type(g).__name__
+    run = getattr(g, "_run", None)
+    name = getattr(run, "__qualname__", None) or type(run).__name__
+    ip = getattr(getattr(run, "__self__", None), "ip", None)
+    return f"{name}[{ip}]" if ip else name
+
+
+@lru_cache(maxsize=4096)
+def short_filename(filename: str) -> str:
+    """
+    Returns the path of a source file relative to the project or its sys.path entry
+    """
+    roots = [os.getcwd()] + sorted(
+        (p for p in sys.path if p and os.path.isabs(p)), key=len, reverse=True
+    )
+    for root in roots:
+        if filename.startswith(root + os.sep):
+            return os.path.relpath(filename, root)
+    return filename
+
+
+def frame_name(frame) -> str:
+    """
+    Returns the name of the function of a frame (e.g. Canvas.update (Canvas/canvas.py:340))
+    """
+    code = frame.f_code
+    filename = short_filename(code.co_filename)
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({filename}:{code.co_firstlineno})"
+
+
+class Profiler:
+    """
+    A sampling profiler for all greenlets of the main thread
+    A separate OS thread samples the stack of the running greenlet, so only the
+    time the greenlets are actually running shows up (the Hub is idle or waiting
+    for IO). Every greenlet switch is traced to account the time per greenlet.
+    Only one profile can run at a time:
+        profiler.start()
+        gevent.sleep(10)
+        profile = profiler.stop()
+    Attributes:
+        interval (float): The time between two samples in seconds
+        running (bool): If a profile is running
+        sampling (lock): Held by the sampling thread while it runs
+        current (greenlet): The running greenlet of the main thread
+        stacks (Counter): The samples of the collapsed stacks
+        cpu (Counter): The running time of every greenlet in seconds
+        switches (Counter): The number of switches away from every greenlet
+    """
+
+    interval: float
+    running: bool
+    sampling: object
+    current: greenlet.greenlet
+    stacks: Counter
+    cpu: Counter
+    switches: Counter
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.running = False
+        self.sampling = allocate_lock()
+        self.current = None
+        self.started = self.switched = 0.0
+        self.previous = None
+        self.stacks = Counter()
+        self.cpu = Counter()
+        self.switches = Counter()
+
+    def trace(self, event: str, args: tuple) -> None:
+        """
+        The greenlet trace function, accounts the time to the greenlet switched away from
+        """
+        if event in ("switch", "throw"):
+            origin, target = args
+            now = time.perf_counter()
+            self.cpu[origin] += now - self.switched
+            self.switches[origin] += 1
+            self.switched = now
+            self.current = target
+        if self.previous:
+            self.previous(event, args)
+
+    def sample(self, thread: int) -> None:
+        """
+        The sampling loop (runs in its own OS thread until running is False)
+        Args:
+            thread (int): The ident of the thread to sample
+        """
+        try:
+            while self.running:
+                frame = sys._current_frames().get(thread)
+                current = self.current
+                if frame is not None and current is not None:
+                    stack = []
+                    while frame is not None:
+                        stack.append(frame_name(frame))
+                        frame = frame.f_back
+                    stack.append(greenlet_name(current))
+                    self.stacks[";".join(reversed(stack))] += 1
+                thread_sleep(self.interval)
+        finally:
+            self.sampling.release()
+
+    def start(self) -> None:
+        """
+        Starts profiling (call from a greenlet of the main thread)
+        """
+        if self.running:
+            raise RuntimeError("A profile is already running")
+        self.running = True
+        self.stacks.clear()
+        self.cpu.clear()
+        self.switches.clear()
+        self.current = greenlet.getcurrent()
+        self.started = self.switched = time.perf_counter()
+        self.previous = greenlet.settrace(self.trace)
+        self.sampling.acquire()
+        start_new_thread(self.sample, (get_ident(),))
+
+    def stop(self) -> dict:
+        """
+        Stops profiling
+        Returns:
+            The collapsed stacks (flamegraph format) and the time of every greenlet
+        """
+        greenlet.settrace(self.previous)
+        self.previous = None
+        self.running = False
+        now = time.perf_counter()
+        duration = now - self.started
+        self.cpu[greenlet.getcurrent()] += now - self.switched
+        with self.sampling:  # waits for the last sample
+            pass
+
+        names = {}
+        for g, cpu in self.cpu.items():
+            entry = names.setdefault(greenlet_name(g), [0.0, 0, 0])
+            entry[0] += cpu
+            entry[1] += self.switches[g]
+            entry[2] += 1
+        samples = self.stacks.copy()
+        self.cpu.clear()
+        self.switches.clear()
+        return {
+            "seconds": round(duration, 3),
+            "interval_ms": self.interval * 1000,
+            "samples": sum(samples.values()),
+            "greenlets": [
+                {
+                    "name": name,
+                    "count": count,
+                    "cpu_ms": round(cpu * 1000, 3),
+                    "share": round(cpu / duration, 4),
+                    "switches": switches,
+                }
+                for name, (cpu, switches, count) in sorted(
+                    names.items(), key=lambda item: -item[1][0]
+                )
+            ],
+            "stacks": "\n".join(
+                f"{stack} {count}" for stack, count in samples.most_common()
+            ),
+        }
+
+
+profiler = Profiler()
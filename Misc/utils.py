@@ -52,7 +52,12 @@ class Status:
             },
             "display": {
                 "state": "online" if self.display else "offline",
-                "port": "Not supported",
+                "port": (
+                    self.config.connection.ports.stream
+                    if self.config.frontend.display.headless.enabled
+                    and self.config.frontend.display.headless.stream
+                    else "Not supported"
+                ),
             },
             "socketserver": {
                 "state": "online" if self.socketserver else "offline",
@@ -134,6 +139,43 @@ def hex_to_rgb(
         return None
 
 
+def hex_to_rgba_array(colors: list[str]) -> np.ndarray:
+    """
+    Transforms a list of hexadecimal strings (RRGGBB[AA]) to an array of RGBA values
+    Raises:
+        ValueError: If one of the colors has an invalid format
+    """
+    lengths = np.fromiter(map(len, colors), dtype=np.int64, count=len(colors))
+    if np.any((lengths != 6) & (lengths != 8)):
+        raise ValueError("Not a valid color")
+    values = np.array([int(c, 16) for c in colors], dtype=np.uint32)
+    values = np.where(lengths == 6, (values << 8) | 0xFF, values)
+    return values.astype(">u4").view(np.uint8).reshape(-1, 4)
+
+
+def alpha_blend(
+    background: np.ndarray, foreground: np.ndarray, alpha: np.ndarray
+) -> np.ndarray:
+    """
+    Blends RGB colors over a background with integer arithmetic
+    Args:
+        background (np.ndarray): The current colors, shape (n, 3)
+        foreground (np.ndarray): The new colors, shape (n, 3)
+        alpha (np.ndarray): The opacity of the new colors (0-255), shape (n,)
+
+    Returns:
+        The blended colors as uint8, rounded to the nearest integer
+    """
+    alpha = alpha.astype(np.uint32)[:, None]
+    value = foreground.astype(np.uint32) * alpha
+    value += background.astype(np.uint32) * (0xFF - alpha)
+    # exact round(value / 255) for value <= 255 * 255
+    value += 128
+    value += value >> 8
+    value >>= 8
+    return value.astype(np.uint8)
+
+
 def cooldown_to_text(cooldown: float) -> str:
     """Transforms the cooldown to a string (seconds/milliseconds)"""
     if cooldown < 1:
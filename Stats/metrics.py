@@ -0,0 +1,182 @@
+from collections import Counter, deque
+
+
+class TickMetrics:
+    """
+    The timing of the canvas ticks
+    Attributes:
+        ticks (int): The number of ticks
+        overruns (int): The number of ticks that took longer than their period
+        carried (int): The number of ticks that left pixels for the next tick
+        applied (int): The number of applied pixels
+        backlog (int): The number of queued pixels after the latest tick
+        last_ms (float): The duration of the latest tick
+        max_ms (float): The longest tick
+        total_ms (float): The duration of all ticks
+    """
+
+    ticks: int
+    overruns: int
+    carried: int
+    applied: int
+    backlog: int
+    last_ms: float
+    max_ms: float
+    total_ms: float
+
+    def __init__(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.carried = 0
+        self.applied = 0
+        self.backlog = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.total_ms = 0.0
+
+    def record(self, duration: float, period: float, applied: int, backlog: int):
+        """
+        Records a tick
+        Args:
+            duration (float): The duration of the tick in seconds
+            period (float): The time available for a tick in seconds
+            applied (int): The number of applied pixels
+            backlog (int): The number of pixels left in the queue
+        """
+        ms = duration * 1000
+        self.ticks += 1
+        self.overruns += duration > period
+        self.carried += backlog > 0
+        self.applied += applied
+        self.backlog = backlog
+        self.last_ms = ms
+        self.max_ms = max(self.max_ms, ms)
+        self.total_ms += ms
+
+    def to_dict(self) -> dict:
+        return {
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "carried": self.carried,
+            "applied": self.applied,
+            "backlog": self.backlog,
+            "last_ms": round(self.last_ms, 3),
+            "max_ms": round(self.max_ms, 3),
+            "avg_ms": round(self.total_ms / self.ticks, 3) if self.ticks else 0.0,
+        }
+
+
+class BlockingMetrics:
+    """
+    The greenlets that blocked the event loop (see Misc.monitor)
+    Attributes:
+        count (int): The number of blocks
+        total_ms (float): The duration of all blocks
+        max_ms (float): The longest block
+        greenlets (Counter): The number of blocks of every greenlet
+        latest (deque): The latest blocks with their stacks
+    """
+
+    count: int
+    total_ms: float
+    max_ms: float
+    greenlets: Counter
+    latest: deque
+
+    def __init__(self, reports: int = 10):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.greenlets = Counter()
+        self.latest = deque(maxlen=reports)
+
+    def record(
+        self, timestamp: float, greenlet: str, duration: float, stack: list[str]
+    ):
+        """
+        Records a block
+        Args:
+            timestamp (float): The unix time the block started
+            greenlet (str): The name of the blocking greenlet
+            duration (float): The duration of the block in seconds
+            stack (list[str]): The stack during the block (empty if unknown)
+        """
+        ms = duration * 1000
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.greenlets[greenlet] += 1
+        self.latest.append(
+            {
+                "time": round(timestamp, 3),
+                "greenlet": greenlet,
+                "ms": round(ms, 3),
+                "stack": stack,
+            }
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "max_ms": round(self.max_ms, 3),
+            "greenlets": dict(self.greenlets.most_common()),
+            "latest": list(reversed(self.latest)),
+        }
+
+
+class RejectionMetrics:
+    """
+    The writes of clients rejected by the protected regions (see Canvas.protection)
+    Attributes:
+        count (int): The number of rejected writes
+        clients (Counter): The number of rejected writes of every client (ip)
+    """
+
+    count: int
+    clients: Counter
+
+    def __init__(self):
+        self.count = 0
+        self.clients = Counter()
+
+    def record(self, clients: dict[str, int]):
+        """
+        Records the rejected writes of a batch
+        Args:
+            clients (dict[str, int]): The number of rejected writes of every client
+        """
+        self.count += sum(clients.values())
+        self.clients.update(clients)
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "clients": dict(self.clients.most_common())}
+
+
+class Metrics:
+    """
+    The runtime metrics of pixelframe
+    Attributes:
+        tick (TickMetrics): The timing of the canvas ticks
+        blocking (BlockingMetrics): The greenlets that blocked the event loop
+        rejected (RejectionMetrics): The writes rejected by the protected regions
+    """
+
+    tick: TickMetrics
+    blocking: BlockingMetrics
+    rejected: RejectionMetrics
+
+    def __init__(self):
+        self.tick = TickMetrics()
+        self.blocking = BlockingMetrics()
+        self.rejected = RejectionMetrics()
+
+    def to_dict(self) -> dict:
+        return {
+            "tick": self.tick.to_dict(),
+            "blocking": self.blocking.to_dict(),
+            "rejected": self.rejected.to_dict(),
+        }
+
+
+metrics = Metrics()
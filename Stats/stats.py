@@ -1,28 +1,65 @@
+import numpy as np
+
+from Canvas.plane import Plane, TiledPlane, create_plane
+
+
 class Stats:
     """
     The Stats of the canvas
     Attributes:
-        pixelstats (dict): A dictionary with the stats
+        pixelstats (Plane): The number of updates per pixel (tiled for a sparse canvas)
+        pixelcount (int): The total number of pixel updates
     """
 
-    pixelstats: dict[str, int]
+    pixelstats: Plane
+    pixelcount: int
 
     def __init__(self):
-        self.pixelstats = {}
+        self.pixelstats = Plane(0, 0, np.uint32)
+        self.pixelcount = 0
+
+    def resize(self, width: int, height: int, sparse: bool = False) -> None:
+        """
+        Sets the size of the tracked canvas, keeping the stats inside the new bounds
+        """
+        if isinstance(self.pixelstats, TiledPlane) != sparse:
+            self.pixelstats = create_plane(width, height, np.uint32, sparse)
+        else:
+            self.pixelstats.resize(width, height)
 
     def add_pixel(self, x, y) -> None:
-        index = f"{x}-{y}"
-        self.pixelstats[index] = self.pixelstats.get(index, 0) + 1
+        self.pixelstats.add(np.array([x]), np.array([y]), 1)
+        self.pixelcount += 1
+
+    def add_pixels(
+        self, xs: np.ndarray, ys: np.ndarray, counts: np.ndarray | None = None
+    ) -> None:
+        """
+        Counts a batch of pixel updates
+        Args:
+            xs (np.ndarray): Coordinates x
+            ys (np.ndarray): Coordinates y
+            counts (np.ndarray | None): The number of updates per coordinate (1 if None)
+        """
+        if counts is None:
+            self.pixelstats.add(xs, ys, 1)
+            self.pixelcount += len(xs)
+        else:
+            self.pixelstats.add(xs, ys, counts)
+            self.pixelcount += int(counts.sum())
 
     def get_pixelstats(self) -> list[tuple[str, int]]:
-        s = sorted(self.pixelstats.items(), key=lambda x: x[1], reverse=True)
-        return s
+        xs, ys, counts = self.pixelstats.nonzero()
+        order = np.argsort(counts, kind="stable")[::-1]
+        return [
+            (f"{x}-{y}", count)
+            for x, y, count in zip(
+                xs[order].tolist(), ys[order].tolist(), counts[order].tolist()
+            )
+        ]
 
     def get_pixelcount(self) -> int:
-        count = 0
-        for p in self.pixelstats.values():
-            count += p
-        return count
+        return self.pixelcount
 
 
 stats = Stats()
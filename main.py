@@ -1,5 +1,6 @@
 import argparse
 import os
+import signal
 import sys
 
 import gevent
@@ -12,6 +13,7 @@ from Clients.manager import manager as umanager
 from Config.config import Config
 from Misc.errors import SystemStop
 from Misc.eventhandler import event_handler
+from Misc.handover import Handover, handover
 from Misc.utils import logger, status
 
 
@@ -57,9 +59,20 @@ def main():
     coroutines = [main_loop, heart_loop]
     display_loop = None
     server_loop = None
+    server = None
+    api = None
+
+    if config.monitor.enabled:
+        from Misc.monitor import BlockingMonitor
+
+        monitor = BlockingMonitor(config)
+        coroutines.append(spawn(monitor.loop))
 
     if config.frontend.display.enabled:
-        from Frontend.display import Display
+        if config.frontend.display.headless.enabled:
+            from Frontend.display import HeadlessDisplay as Display
+        else:
+            from Frontend.display import Display
 
         status.update("display", True)
         display = Display(canvas)
@@ -105,6 +118,9 @@ def main():
         api_loop = spawn(api.loop)
         coroutines.append(api_loop)
 
+    if handover:
+        handover.close()  # everything needed was taken over
+
     logger.info("Starting Processes...")
 
     def stopper():
@@ -126,8 +142,28 @@ def main():
         stopper()
         logger.info("Restarting...\n")
         os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    @event_handler.register("system-hot-restart")
+    def system_hot_restart():
+        logger.info("Handing over to a new process...")
+        state = Handover.create()
+        if server:
+            server.hand_over(state)
+        if api:
+            api.hand_over(state)
+        canvas.hand_over(state)
+        state.save()
+        stopper()
+        logger.info("Restarting...\n")
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    if hasattr(signal, "SIGUSR2"):
+        gevent.signal_handler(
+            signal.SIGUSR2, lambda: spawn(event_handler.trigger, "system-hot-restart")
+        )
+
     try:
-        coroutines[-1].join() # wait until SIGINT (or system-restart)
+        coroutines[-1].join()  # wait until SIGINT (or system-restart)
     except KeyboardInterrupt:
         pass
 